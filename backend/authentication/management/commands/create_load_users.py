@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from authentication.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Creates (or re-activates) the active users the load generator logs in as: <prefix>-<n>@example.com"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10)
+        parser.add_argument("--prefix", default="load")
+        parser.add_argument("--password", default="load-test-password")
+
+    def handle(self, *args, **options):
+        for idx in range(options["count"]):
+            user, _ = CustomUser.objects.get_or_create(email=f"{options['prefix']}-{idx}@example.com")
+            user.is_active = True
+            user.set_password(options["password"])
+            user.save()
+        self.stdout.write(self.style.SUCCESS(f"Successfully created {options['count']} load test users"))
@@ -0,0 +1,76 @@
+"""
+Request metrics and the `/metrics` endpoint (Prometheus text format, see `src/utils/metrics.py`).
+
+`MetricsMiddleware` records the latency and status of every request labelled with its URL name, and the number of
+SQL queries counted by `ProfilingMiddleware`. GPT stream and circuit breaker metrics are recorded in `src/utils/gpt.py`.
+
+The endpoint is for scrapers only: requests need the `METRICS_TOKEN` bearer token or to come from one of
+`METRICS_ALLOWED_IPS`, everything else gets a 403.
+"""
+import hmac
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from src.utils.metrics import REGISTRY, Counter, Histogram
+
+__all__ = ["MetricsMiddleware", "metrics_view", "record_cache"]
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Time to build the response", ["view", "method"])
+REQUESTS = Counter("http_requests_total", "Handled requests", ["view", "method", "status"])
+DB_QUERIES = Histogram(
+    "http_request_db_queries", "SQL queries per request", ["view"], buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by outcome, hit ratio = hit / total", ["cache", "result"]
+)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _view_name(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.url_name or match.route
+
+
+class MetricsMiddleware:
+    """Place before `ProfilingMiddleware`, whose query counts it reads."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started_at = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started_at
+
+        view = _view_name(request)
+        REQUEST_LATENCY.observe(elapsed, view=view, method=request.method)
+        REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        timings = getattr(request, "timings", None)
+        if timings is not None:
+            DB_QUERIES.observe(timings.queries, view=view)
+        REGISTRY.maybe_flush()
+        return response
+
+
+def metrics_view(request):
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _may_scrape(request) -> bool:
+    if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+        return True
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return (
+        bool(settings.METRICS_TOKEN)
+        and scheme.lower() == "bearer"
+        and hmac.compare_digest(token, settings.METRICS_TOKEN)
+    )
@@ -0,0 +1,169 @@
+"""
+Per-request profiling.
+
+`ProfilingMiddleware` measures every request: the number and duration of SQL queries, time spent in the spans
+recorded with `timed` (serializers, the branching engine) and the total time of the view. The numbers are sent back
+in a `Server-Timing` header, so they show up in the browser's network panel, and can be logged as one structured
+record per request. The header is only sent to staff users, or to everyone with `DEBUG`, as it tells how requests
+hit the database.
+
+A fraction of requests (`PROFILING_SAMPLE_RATE`), and requests from staff users carrying the `PROFILING_HEADER`
+header, additionally run under `cProfile`; the stats are dumped to `PROFILING_DUMP_DIR` and can be inspected with
+`python -m pstats <file>`.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.db import connections
+
+__all__ = ["ProfilingMiddleware", "RequestTimings", "current_timings", "timed", "timed_function"]
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.total = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.spans: dict[str, float] = defaultdict(float)
+        self._open: dict[str, int] = defaultdict(int)
+
+    def query_wrapper(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - started_at
+
+    def as_dict(self) -> dict:
+        return {
+            "total_ms": round(self.total * 1000, 2),
+            "queries": self.queries,
+            "db_ms": round(self.query_time * 1000, 2),
+            **{f"{name}_ms": round(duration * 1000, 2) for name, duration in self.spans.items()},
+        }
+
+    def server_timing(self) -> str:
+        metrics = [f'db;dur={self.query_time * 1000:.2f};desc="{self.queries} queries"']
+        metrics += [f"{name};dur={duration * 1000:.2f}" for name, duration in self.spans.items()]
+        metrics.append(f"total;dur={self.total * 1000:.2f}")
+        return ", ".join(metrics)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """The timings of the request being handled, or None outside of a profiled request."""
+    return _current.get()
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """
+    Adds the time spent in the block to the `name` span of the current request. Nested blocks with the same name are
+    only counted once, so recursive serializers do not inflate their span.
+    """
+    timings = _current.get()
+    if timings is None or timings._open[name]:
+        yield
+        return
+
+    timings._open[name] += 1
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.spans[name] += time.perf_counter() - started_at
+        timings._open[name] -= 1
+
+
+def timed_function(name: str):
+    """Decorator version of `timed`."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ProfilingMiddleware:
+    """Must come after `AuthenticationMiddleware`, the profiling header is only honoured for staff users."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+
+        timings = request.timings = RequestTimings()
+        token = _current.set(timings)
+        profiler = cProfile.Profile() if self._should_profile(request) else None
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(timings.query_wrapper))
+                if profiler is not None:
+                    try:
+                        profiler.enable()
+                    except ValueError:  # another profiler is already active in this thread
+                        profiler = None
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _current.reset(token)
+        timings.total = time.perf_counter() - timings.started_at
+
+        if settings.DEBUG or _is_staff(request):
+            response["Server-Timing"] = timings.server_timing()
+        dump = self._dump(profiler, request) if profiler is not None else None
+        if settings.PROFILING_LOG:
+            record = {"method": request.method, "path": request.path, "status": response.status_code}
+            record.update(timings.as_dict())
+            if dump:
+                record["profile"] = dump
+            logger.info(json.dumps(record))
+        return response
+
+    @staticmethod
+    def _should_profile(request) -> bool:
+        if settings.PROFILING_HEADER in request.headers:
+            return _is_staff(request)
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    @staticmethod
+    def _dump(profiler: cProfile.Profile, request) -> str:
+        os.makedirs(settings.PROFILING_DUMP_DIR, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", request.path).strip("_") or "root"
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{slug}-{uuid.uuid4().hex[:8]}.pstats"
+        path = os.path.join(settings.PROFILING_DUMP_DIR, filename)
+        profiler.dump_stats(path)
+        return path
+
+
+def _is_staff(request) -> bool:
+    user = getattr(request, "user", None)
+    return bool(user is not None and user.is_staff)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -55,6 +56,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "backend.metrics.MetricsMiddleware",
+    "backend.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -87,7 +90,7 @@ WSGI_APPLICATION = "backend.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.getenv("DATABASE_PATH", BASE_DIR / "db.sqlite3"),
     }
 }
 
@@ -149,3 +152,59 @@ CSRF_TRUSTED_ORIGINS = [
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 CSRF_COOKIE_SAMESITE = "None"
+
+# Admission control for upstream GPT calls (see gpt/scheduler.py)
+GPT_STREAMS_MAX_CONCURRENT = int(os.getenv("GPT_STREAMS_MAX_CONCURRENT", 16))
+GPT_STREAMS_MAX_PER_USER = int(os.getenv("GPT_STREAMS_MAX_PER_USER", 4))
+GPT_STREAMS_MAX_QUEUE = int(os.getenv("GPT_STREAMS_MAX_QUEUE", 64))
+GPT_STREAMS_QUEUE_TIMEOUT = float(os.getenv("GPT_STREAMS_QUEUE_TIMEOUT", 10))
+
+# Background title generation (see gpt/titles.py)
+GPT_TITLE_WORKERS = int(os.getenv("GPT_TITLE_WORKERS", 4))
+GPT_TITLE_MAX_PENDING = int(os.getenv("GPT_TITLE_MAX_PENDING", 64))
+
+# Request profiling (see backend/profiling.py). Its query counts feed /metrics; Server-Timing is only sent to staff
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+PROFILING_LOG = os.getenv("PROFILING_LOG", "false").lower() == "true"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0.0))
+PROFILING_HEADER = os.getenv("PROFILING_HEADER", "X-Profile")
+PROFILING_DUMP_DIR = os.getenv("PROFILING_DUMP_DIR", os.path.join(tempfile.gettempdir(), "backend-profiles"))
+
+# Windowed message reads (see chat.views.version_messages)
+CHAT_MESSAGE_WINDOW = int(os.getenv("CHAT_MESSAGE_WINDOW", 50))
+CHAT_MESSAGE_WINDOW_MAX = int(os.getenv("CHAT_MESSAGE_WINDOW_MAX", 500))
+
+# Message search (see chat/search)
+CHAT_SEARCH_BACKEND = os.getenv("CHAT_SEARCH_BACKEND", "chat.search.SQLiteFTS5Backend")
+CHAT_SEARCH_MAX_RESULTS = int(os.getenv("CHAT_SEARCH_MAX_RESULTS", 50))
+
+# Compression of large message bodies (see chat/utils/compression.py)
+CHAT_BODY_COMPRESSION_THRESHOLD = int(os.getenv("CHAT_BODY_COMPRESSION_THRESHOLD", 2048))
+CHAT_BODY_COMPRESSION_CODEC = os.getenv("CHAT_BODY_COMPRESSION_CODEC", "zstd")
+
+# Retention of soft-deleted conversations (see chat/management/commands/purge_conversations.py)
+CHAT_PURGE_RETENTION_DAYS = float(os.getenv("CHAT_PURGE_RETENTION_DAYS", 30))
+CHAT_PURGE_BATCH_SIZE = int(os.getenv("CHAT_PURGE_BATCH_SIZE", 200))
+
+# Garbage collection of unreachable and empty versions (see chat/utils/gc.py)
+CHAT_GC_UNREACHABLE = os.getenv("CHAT_GC_UNREACHABLE", "true").lower() == "true"
+CHAT_GC_EMPTY = os.getenv("CHAT_GC_EMPTY", "true").lower() == "true"
+CHAT_GC_MIN_IDLE_HOURS = float(os.getenv("CHAT_GC_MIN_IDLE_HOURS", 24))
+CHAT_GC_SLICE_SIZE = int(os.getenv("CHAT_GC_SLICE_SIZE", 500))
+CHAT_GC_BATCH_SIZE = int(os.getenv("CHAT_GC_BATCH_SIZE", 1000))
+
+# Delta sync (see chat/utils/changes.py)
+CHAT_SYNC_PAGE = int(os.getenv("CHAT_SYNC_PAGE", 500))
+CHAT_SYNC_PAGE_MAX = int(os.getenv("CHAT_SYNC_PAGE_MAX", 2000))
+
+# Live conversation updates over WebSockets (see chat/live)
+CHAT_LIVE_BROKER = os.getenv("CHAT_LIVE_BROKER", "chat.live.InProcessBroker")
+CHAT_LIVE_BROKER_URL = os.getenv("CHAT_LIVE_BROKER_URL", "tcp://127.0.0.1:8765")
+CHAT_LIVE_BROKER_TIMEOUT = float(os.getenv("CHAT_LIVE_BROKER_TIMEOUT", 2))
+
+# Access to /metrics (see backend/metrics.py): scrapers send `Authorization: Bearer <METRICS_TOKEN>` or connect from
+# one of the comma-separated METRICS_ALLOWED_IPS. With neither set, the endpoint is closed
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_ALLOWED_IPS = [
+    address.strip() for address in os.getenv("METRICS_ALLOWED_IPS", "").split(",") if address.strip()
+]
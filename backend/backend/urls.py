@@ -5,6 +5,8 @@ from django.http import JsonResponse
 from django.urls import include, path
 from rest_framework.decorators import api_view
 
+from backend.metrics import metrics_view
+
 
 @api_view(["GET"])
 def root_view(request):
@@ -16,5 +18,6 @@ urlpatterns = [
     path("chat/", include("chat.urls")),
     path("gpt/", include("gpt.urls")),
     path("auth/", include("authentication.urls")),
+    path("metrics", metrics_view, name="metrics"),
     path("", root_view),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
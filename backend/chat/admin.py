@@ -1,16 +1,40 @@
+from django import forms
 from django.contrib import admin
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from nested_admin.nested import NestedModelAdmin, NestedStackedInline, NestedTabularInline
 
-from chat.models import Conversation, Message, Role, Version
+from chat.models import Conversation, Message, Role, Version, VersionAncestry
+from chat.utils.ancestry import path_from_root
 
 
 class RoleAdmin(NestedModelAdmin):
     list_display = ["id", "name"]
 
 
+class MessageForm(forms.ModelForm):
+    # The text lives in a shared MessageBody; editing it points the message at the body of the new text
+    content = forms.CharField(widget=forms.Textarea)
+
+    class Meta:
+        model = Message
+        exclude = ["body"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.body_id:
+            self.initial.setdefault("content", self.instance.content)
+
+    def save(self, commit=True):
+        self.instance.content = self.cleaned_data["content"]
+        return super().save(commit)
+
+
 class MessageAdmin(NestedModelAdmin):
-    list_display = ["display_desc", "role", "id", "created_at", "version"]
+    form = MessageForm
+    list_display = ["display_desc", "role", "id", "position", "created_at", "version"]
+    list_select_related = ["body", "role", "version"]
 
     def display_desc(self, obj):
         return obj.content[:20] + "..."
@@ -20,6 +44,7 @@ class MessageAdmin(NestedModelAdmin):
 
 class MessageInline(NestedTabularInline):
     model = Message
+    form = MessageForm
     extra = 2  # number of extra forms to display
 
 
@@ -51,7 +76,18 @@ class DeletedListFilter(admin.SimpleListFilter):
 class ConversationAdmin(NestedModelAdmin):
     actions = ["undelete_selected", "soft_delete_selected"]
     inlines = [VersionInline]
-    list_display = ("title", "id", "created_at", "modified_at", "deleted_at", "version_count", "is_deleted", "user")
+    list_display = (
+        "title",
+        "id",
+        "created_at",
+        "modified_at",
+        "deleted_at",
+        "version_count",
+        "message_count",
+        "last_message_at",
+        "is_deleted",
+        "user",
+    )
     list_filter = (DeletedListFilter,)
     ordering = ("-modified_at",)
 
@@ -83,7 +119,38 @@ class ConversationAdmin(NestedModelAdmin):
 
 class VersionAdmin(NestedModelAdmin):
     inlines = [MessageInline]
-    list_display = ("id", "conversation", "parent_version", "root_message")
+    list_display = ("id", "conversation", "parent_version", "root_message", "depth", "descendant_count")
+    readonly_fields = ("path_from_root",)
+
+    def get_queryset(self, request):
+        # Both counts come from the closure table, the version itself is linked to itself at depth 0
+        ancestors = VersionAncestry.objects.filter(descendant=OuterRef("pk"), depth__gte=1).values("descendant")
+        descendants = VersionAncestry.objects.filter(ancestor=OuterRef("pk"), depth__gte=1).values("ancestor")
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                depth=Coalesce(Subquery(ancestors.annotate(count=Count("pk")).values("count")), 0),
+                descendant_count=Coalesce(Subquery(descendants.annotate(count=Count("pk")).values("count")), 0),
+            )
+        )
+
+    def depth(self, obj):
+        return obj.depth
+
+    depth.short_description = "Depth"
+    depth.admin_order_field = "depth"
+
+    def descendant_count(self, obj):
+        return obj.descendant_count
+
+    descendant_count.short_description = "Number of descendants"
+    descendant_count.admin_order_field = "descendant_count"
+
+    def path_from_root(self, obj):
+        return " → ".join(str(version.pk) for version in path_from_root(obj))
+
+    path_from_root.short_description = "Path from root"
 
 
 admin.site.register(Role, RoleAdmin)
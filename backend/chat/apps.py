@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_delete
 
 
 class ChatConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "chat"
+
+    def ready(self):
+        import chat.checks  # noqa: F401
+        from chat.models import Version, detach_deleted_version
+
+        # ORM deletes, e.g. from the admin, keep the closure table of the version tree consistent
+        pre_delete.connect(detach_deleted_version, sender=Version, dispatch_uid="chat_detach_deleted_version")
@@ -0,0 +1,52 @@
+"""
+Benchmark registry.
+
+A benchmark is a factory registered with `@benchmark(name, sizes=...)`. For each size the factory builds its
+fixtures and returns a `Case`, whose `run` is timed `repeat` times; `prepare` is called untimed before every run and
+its return value is passed to `run`. `metrics`, when given, returns figures that are not timings (sizes, counts) to
+record next to them. Every factory runs inside a transaction that is rolled back afterwards.
+"""
+import importlib
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+__all__ = ["BENCHMARKS", "Benchmark", "Case", "benchmark", "load_benchmarks"]
+
+BENCHMARK_MODULES = [
+    "chat.benchmarks.branching",
+    "chat.benchmarks.compression",
+    "chat.benchmarks.deletion",
+    "chat.benchmarks.queries",
+    "chat.benchmarks.search",
+]
+
+
+@dataclass
+class Case:
+    run: Callable[[Any], Any]
+    prepare: Callable[[], Any] = field(default=lambda: None)
+    metrics: Optional[Callable[[], dict]] = None
+
+
+@dataclass
+class Benchmark:
+    name: str
+    factory: Callable[[int], Case]
+    sizes: tuple[int, ...]
+
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, sizes: tuple[int, ...]):
+    def decorator(factory: Callable[[int], Case]) -> Callable[[int], Case]:
+        BENCHMARKS[name] = Benchmark(name, factory, sizes)
+        return factory
+
+    return decorator
+
+
+def load_benchmarks() -> dict[str, Benchmark]:
+    for module in BENCHMARK_MODULES:
+        importlib.import_module(module)
+    return BENCHMARKS
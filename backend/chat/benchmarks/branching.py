@@ -0,0 +1,57 @@
+import copy
+
+from django.test import Client
+from django.urls import reverse
+
+from authentication.models import CustomUser
+from chat.benchmarks import Case, benchmark
+from chat.benchmarks.generators import make_deep_linear, make_mixed, make_nested_edits, make_wide_fanout
+from chat.models import Conversation
+from chat.serializers import ConversationSerializer
+from chat.utils.branching import make_branched_conversation
+
+SHAPES = {
+    "deep_linear": (make_deep_linear, (50, 200, 1000)),
+    "wide_fanout": (make_wide_fanout, (10, 50, 100)),
+    "nested_edits": (make_nested_edits, (5, 20, 50)),
+    "mixed": (make_mixed, (10, 50, 100)),
+}
+
+
+def _benchmark_user() -> CustomUser:
+    user, _ = CustomUser.objects.get_or_create(email="benchmark@example.com", defaults={"is_active": True})
+    return user
+
+
+def _register(shape: str, make_conversation, sizes: tuple[int, ...]):
+    @benchmark(f"branching.{shape}", sizes)
+    def branching(size: int) -> Case:
+        conversation = make_conversation(_benchmark_user(), size)
+        data = ConversationSerializer(conversation).data
+        return Case(prepare=lambda: copy.deepcopy(data), run=make_branched_conversation)
+
+    @benchmark(f"serializer.{shape}", sizes)
+    def serializer(size: int) -> Case:
+        conversation = make_conversation(_benchmark_user(), size)
+        return Case(
+            prepare=lambda: Conversation.objects.get(pk=conversation.pk),
+            run=lambda instance: ConversationSerializer(instance).data,
+        )
+
+    @benchmark(f"view.{shape}", sizes)
+    def view(size: int) -> Case:
+        user = _benchmark_user()
+        conversation = make_conversation(user, size)
+        client = Client()
+        client.force_login(user)
+        url = reverse("get_branched_conversation", kwargs={"pk": conversation.pk})
+
+        def run(_):
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+
+        return Case(run=run)
+
+
+for _shape, (_make_conversation, _sizes) in SHAPES.items():
+    _register(_shape, _make_conversation, _sizes)
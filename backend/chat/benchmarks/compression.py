@@ -0,0 +1,61 @@
+"""
+Reads of message bodies stored plain and compressed, with the storage each codec takes.
+
+Every size is the length of the bodies in KB; each case writes 200 such bodies with one codec and times reading all of
+their texts back. The results also hold `raw_kb` and `stored_kb`, the size of the texts and of what the database
+holds for them. Bodies are drawn from the seeding vocabulary, which compresses better than real prose: take the
+ratios as an upper bound.
+"""
+import random
+
+from django.db import connection
+from django.test import override_settings
+
+from chat.benchmarks import Case, benchmark
+from chat.benchmarks.generators import WORDS
+from chat.models import MessageBody
+from chat.utils import compression
+from chat.utils.bulk import parameter_list
+
+SIZES = (1, 8, 32)
+BODIES = 200
+CODECS = ["none", "zlib"] + (["zstd"] if compression.zstandard is not None else [])
+
+
+def _text(rng: random.Random, size_kb: int) -> str:
+    words = []
+    length = 0
+    while length < size_kb * 1024:
+        words.append(rng.choice(WORDS))
+        length += len(words[-1]) + 1
+    return " ".join(words)
+
+
+def _storage(bodies: list[MessageBody]) -> dict:
+    hashes = [body.hash for body in bodies]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT SUM(length(CAST(content AS BLOB))) FROM chat_messagebody WHERE hash IN ({parameter_list(hashes)})",
+            hashes,
+        )
+        stored = cursor.fetchone()[0]
+    raw = sum(len(body.content.encode()) for body in bodies)
+    return {"raw_kb": raw / 1024, "stored_kb": stored / 1024}
+
+
+def _register(codec: str):
+    @benchmark(f"compression.read.{codec}", SIZES)
+    def factory(size: int) -> Case:
+        rng = random.Random(f"{codec}-{size}")
+        bodies = [MessageBody.for_content(_text(rng, size)) for _ in range(BODIES)]
+        with override_settings(CHAT_BODY_COMPRESSION_CODEC=codec, CHAT_BODY_COMPRESSION_THRESHOLD=0):
+            MessageBody.objects.bulk_create(bodies)
+        hashes = [body.hash for body in bodies]
+        return Case(
+            run=lambda state: list(MessageBody.objects.filter(hash__in=hashes).values_list("content", flat=True)),
+            metrics=lambda: _storage(bodies),
+        )
+
+
+for _codec in CODECS:
+    _register(_codec)
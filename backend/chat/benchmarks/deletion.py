@@ -0,0 +1,29 @@
+"""
+Hard deletes of one conversation, through Django's collector and with `chat.utils.deletion.delete_conversations`.
+
+Every size is the number of versions of a `make_mixed` tree; a fresh tree is built, untimed, before every run.
+"""
+import itertools
+
+from authentication.models import CustomUser
+from chat.benchmarks import Case, benchmark
+from chat.benchmarks.generators import make_mixed
+from chat.utils.deletion import delete_conversations
+
+SIZES = (10, 100, 500)
+
+
+def _fresh_trees(size: int):
+    user, _ = CustomUser.objects.get_or_create(email="benchmark@example.com", defaults={"is_active": True})
+    seeds = itertools.count()
+    return lambda: make_mixed(user, size, seed=next(seeds))
+
+
+@benchmark("delete.collector", SIZES)
+def collector(size: int) -> Case:
+    return Case(prepare=_fresh_trees(size), run=lambda conversation: conversation.delete())
+
+
+@benchmark("delete.set_based", SIZES)
+def set_based(size: int) -> Case:
+    return Case(prepare=_fresh_trees(size), run=lambda conversation: delete_conversations([conversation.pk]))
@@ -0,0 +1,172 @@
+"""
+Deterministic conversation shapes for benchmarks.
+
+Every generator builds its rows in memory the same way `conversation_add_version` would (a new version copies the
+parent's messages before the edited one, then continues with the edit and a tail), and writes them with a handful of
+`bulk_create` calls. Timestamps advance by one second per message, so the ordering is stable across runs.
+"""
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from django.db import transaction
+
+from chat.models import Conversation, Message, Role, Version, VersionAncestry
+from chat.utils.bulk import preserved_timestamps
+
+__all__ = [
+    "ConversationBuilder",
+    "grow_mixed",
+    "make_deep_linear",
+    "make_mixed",
+    "make_nested_edits",
+    "make_wide_fanout",
+]
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+WORDS = (
+    "the a model answer question context version branch message token stream latency python django query index "
+    "cache user assistant explain example because therefore however summary detail value result error retry"
+).split()
+
+
+class ConversationBuilder:
+    """
+    Builds one conversation in memory. With `deterministic_ids` the ids come from the seeded generator too, so the
+    same seed always yields the same rows (and cannot be saved twice). `body_words` > 0 appends a random sentence of
+    up to twice that many words to every message body.
+    """
+
+    def __init__(
+        self,
+        user,
+        title: str = "Benchmark conversation",
+        start: datetime = EPOCH,
+        seed: int = 0,
+        roles: Optional[dict] = None,
+        body_words: int = 0,
+        deterministic_ids: bool = False,
+    ):
+        self.user = user
+        self.roles = roles or {name: Role.objects.get_or_create(name=name)[0] for name in ("user", "assistant")}
+        self.clock = start
+        self.rng = random.Random(seed)
+        self.body_words = body_words
+        self.deterministic_ids = deterministic_ids
+        self.conversation = Conversation(id=self._uuid(), title=title, user=user, created_at=start, modified_at=start)
+        self.versions: list[Version] = []
+        self.messages: dict[uuid.UUID, list[Message]] = {}
+        self.root = self._new_version()
+
+    def _uuid(self) -> uuid.UUID:
+        if not self.deterministic_ids:
+            return uuid.uuid4()
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def _tick(self) -> datetime:
+        self.clock += timedelta(seconds=1)
+        return self.clock
+
+    def _new_version(self, parent: Optional[Version] = None, root_message: Optional[Message] = None) -> Version:
+        version = Version(
+            id=self._uuid(), conversation=self.conversation, parent_version=parent, root_message=root_message
+        )
+        self.versions.append(version)
+        self.messages[version.id] = []
+        return version
+
+    def _message(self, version: Version, role: str, content: str) -> Message:
+        message = Message(
+            id=self._uuid(),
+            version=version,
+            role=self.roles[role],
+            content=content,
+            created_at=self._tick(),
+            position=len(self.messages[version.id]),
+        )
+        self.messages[version.id].append(message)
+        return message
+
+    def _body(self, label: str) -> str:
+        if not self.body_words:
+            return label
+        words = self.rng.choices(WORDS, k=self.rng.randint(1, 2 * self.body_words))
+        return f"{label}: {' '.join(words)}"
+
+    def append(self, version: Version, count: int) -> Version:
+        """Appends `count` alternating user/assistant messages."""
+        for _ in range(count):
+            idx = len(self.messages[version.id])
+            role = "user" if idx % 2 == 0 else "assistant"
+            self._message(version, role, self._body(f"{role} message {idx} of version {self.versions.index(version)}"))
+        return version
+
+    def branch(self, parent: Version, at_index: int, tail: int = 1) -> Version:
+        """Edits the message at `at_index` of `parent` into a new version, followed by `tail` more messages."""
+        parent_messages = self.messages[parent.id]
+        version = self._new_version(parent, root_message=parent_messages[at_index])
+        for message in parent_messages[:at_index]:
+            self._message(version, message.role.name, message.content)
+        edited = f"edited message {at_index} of version {len(self.versions) - 1}"
+        self._message(version, parent_messages[at_index].role.name, edited)
+        return self.append(version, tail)
+
+    def finish(self, active: Optional[Version] = None) -> tuple[Conversation, list[Version], list[Message]]:
+        """Sets the active version and returns the unsaved rows, for callers that write many conversations at once."""
+        self.conversation.active_version = active or self.versions[-1]
+        self.conversation.modified_at = self.clock
+        return self.conversation, self.versions, [m for messages in self.messages.values() for m in messages]
+
+    def save(self, active: Optional[Version] = None) -> Conversation:
+        conversation, versions, messages = self.finish(active)
+        with transaction.atomic(), preserved_timestamps(Conversation, Message):
+            Conversation.objects.bulk_create([conversation])
+            Version.objects.bulk_create(versions)
+            Message.objects.bulk_create(messages)
+            VersionAncestry.objects.bulk_create(VersionAncestry.objects.rows_for(versions))
+        return conversation
+
+
+def make_deep_linear(user, size: int) -> Conversation:
+    """A single version with `size` messages."""
+    builder = ConversationBuilder(user, "Deep linear")
+    builder.append(builder.root, size)
+    return builder.save()
+
+
+def make_wide_fanout(user, size: int, messages: int = 10) -> Conversation:
+    """`size` sibling versions, all editing the same user message of the root version."""
+    builder = ConversationBuilder(user, "Wide fan-out")
+    builder.append(builder.root, messages)
+    for _ in range(size):
+        builder.branch(builder.root, at_index=messages // 2 - (messages // 2) % 2, tail=3)
+    return builder.save()
+
+
+def make_nested_edits(user, size: int, messages: int = 6) -> Conversation:
+    """A chain of `size` versions, each editing the last user message of the previous one."""
+    builder = ConversationBuilder(user, "Nested edits")
+    version = builder.append(builder.root, messages)
+    for _ in range(size):
+        last_user_idx = (len(builder.messages[version.id]) - 1) // 2 * 2
+        version = builder.branch(version, at_index=last_user_idx, tail=3)
+    return builder.save()
+
+
+def make_mixed(user, size: int, seed: int = 0) -> Conversation:
+    """`size` versions branching off random versions at random user messages."""
+    builder = ConversationBuilder(user, "Mixed", seed=seed)
+    return grow_mixed(builder, size).save()
+
+
+def grow_mixed(builder: ConversationBuilder, size: int, first: int = 8, max_tail: int = 5) -> ConversationBuilder:
+    """Gives the root version `first` messages, then adds `size` versions as `make_mixed` does."""
+    builder.append(builder.root, first)
+    for _ in range(size):
+        parent = builder.rng.choice(builder.versions)
+        user_indices = range(0, len(builder.messages[parent.id]), 2)
+        builder.branch(parent, at_index=builder.rng.choice(user_indices), tail=builder.rng.randint(1, max_tail))
+    return builder
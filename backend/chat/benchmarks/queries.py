@@ -0,0 +1,69 @@
+"""
+Hot chat queries, with and without the composite indexes of `chat/migrations/0002_composite_indexes.py`.
+
+Every size seeds that many conversations (see `seed_conversations`) and times the queries against one of them. The
+`.fk_index` variants swap the composite conversation index for the single-column foreign key index it replaced, inside
+the benchmark's rolled back transaction, so one run shows the latency before and after on the same data. Message
+queries are range scans of the `(version, position)` unique index and have no such variant. Run with
+`--use-current-db` on a large seeded database for realistic numbers.
+"""
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, models
+
+from chat.benchmarks import Case, benchmark
+from chat.models import Conversation, Message
+
+SIZES = (500, 5000)
+
+COMPOSITE_INDEXES = {
+    Conversation: ("chat_conv_user_deleted_mod_idx", models.Index(fields=["user"], name="bench_conv_user_idx")),
+}
+
+
+def _seed(size: int) -> Conversation:
+    call_command(
+        "seed_conversations", users=5, conversations=size, seed=4242, prefix="bench-queries", stdout=StringIO()
+    )
+    return Conversation.objects.filter(user__email="bench-queries-0@example.com").order_by("-created_at").first()
+
+
+def _use_fk_indexes() -> None:
+    # Plain statements rather than `with schema_editor()`, which SQLite refuses inside a transaction
+    schema_editor = connection.schema_editor()
+    with connection.cursor() as cursor:
+        for model, (name, fk_index) in COMPOSITE_INDEXES.items():
+            index = next(index for index in model._meta.indexes if index.name == name)
+            cursor.execute(str(index.remove_sql(model, schema_editor)))
+            cursor.execute(str(fk_index.create_sql(model, schema_editor)))
+
+
+QUERIES = {
+    "messages_of_version": lambda state: list(Message.objects.filter(version=state["version"])),
+    "messages_before": lambda state: list(
+        Message.objects.filter(version=state["version"], position__lt=state["branch_point"])
+    ),
+    "messages_tail": lambda state: list(Message.objects.filter(version=state["version"]).order_by("-position")[:10]),
+    "conversation_list": lambda state: list(
+        Conversation.objects.filter(user=state["user"], deleted_at__isnull=True).order_by("-modified_at")
+    ),
+}
+FK_INDEX_QUERIES = ["conversation_list"]
+
+
+def _register(name: str, query, fk_index: bool):
+    @benchmark(f"queries.{name}{'.fk_index' if fk_index else ''}", SIZES)
+    def factory(size: int) -> Case:
+        conversation = _seed(size)
+        version = conversation.active_version
+        state = {"version": version, "branch_point": version.messages.last().position, "user": conversation.user}
+        if fk_index:
+            _use_fk_indexes()
+        return Case(prepare=lambda: state, run=query)
+
+
+for _name, _query in QUERIES.items():
+    _register(_name, _query, fk_index=False)
+    if _name in FK_INDEX_QUERIES:
+        _register(_name, _query, fk_index=True)
@@ -0,0 +1,58 @@
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+
+import django
+from django.db import connection, transaction
+
+from chat.benchmarks import Benchmark
+
+__all__ = ["find_regressions", "run_benchmark", "environment"]
+
+
+def run_benchmark(bench: Benchmark, size: int, repeat: int) -> dict:
+    """Builds the fixtures for `size`, times `repeat` runs and rolls everything back."""
+    with transaction.atomic():
+        case = bench.factory(size)
+        timings = []
+        for _ in range(repeat):
+            state = case.prepare()
+            started_at = time.perf_counter()
+            case.run(state)
+            timings.append(time.perf_counter() - started_at)
+        metrics = case.metrics() if case.metrics is not None else {}
+        transaction.set_rollback(True)
+
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "repeat": repeat,
+        **metrics,
+    }
+
+
+def find_regressions(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Lists the results whose median is more than `threshold` (a fraction) slower than the baseline median."""
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        limit = reference["median_ms"] * (1 + threshold)
+        if result["median_ms"] > limit:
+            regressions.append(
+                f"{key}: {result['median_ms']:.2f}ms vs baseline {reference['median_ms']:.2f}ms "
+                f"(+{(result['median_ms'] / reference['median_ms'] - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def environment() -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "machine": platform.machine(),
+    }
@@ -0,0 +1,51 @@
+"""
+Message search, with the FTS5 index and with the unindexed `icontains` fallback on the same data.
+
+Every size seeds that many conversations (see `seed_conversations`) spread over five users, adds a rare word to ten
+of the first user's conversations and searches that user's messages. The seeded bodies come from a vocabulary of 30
+words, so the common-word queries match about half of all messages: the worst case for bm25, which needs every
+matching row's statistics. For the one million message figure, seed a database first (e.g. `seed_conversations
+--users 100 --conversations 100000`) and run with `--use-current-db`.
+"""
+from io import StringIO
+
+from django.core.management import call_command
+
+from authentication.models import CustomUser
+from chat.benchmarks import Case, benchmark
+from chat.models import Conversation, Message, Role
+from chat.search import ContainsSearchBackend, SQLiteFTS5Backend
+
+SIZES = (500, 5000)
+QUERIES = {
+    "common": "latency",
+    "common_words": "django query index",
+    "rare": "kubernetes",
+    "rare_prefix": "kuber",
+    "rare_and_common": "kubernetes latency",
+}
+BACKENDS = {"fts5": SQLiteFTS5Backend, "contains": ContainsSearchBackend}
+
+
+def _seed(size: int) -> CustomUser:
+    call_command("seed_conversations", users=5, conversations=size, seed=4343, prefix="bench-search", stdout=StringIO())
+    user = CustomUser.objects.get(email="bench-search-0@example.com")
+    role = Role.objects.get(name="user")
+    for conversation in Conversation.objects.filter(user=user).select_related("active_version")[:10]:
+        Message.objects.create(
+            version=conversation.active_version, role=role, content="How do I scale kubernetes latency?"
+        )
+    return user
+
+
+def _register(backend_name: str, query_name: str):
+    @benchmark(f"search.{backend_name}.{query_name}", SIZES)
+    def factory(size: int) -> Case:
+        user = _seed(size)
+        backend = BACKENDS[backend_name]()
+        return Case(run=lambda state: backend.search(user, QUERIES[query_name], 20))
+
+
+for _backend_name in BACKENDS:
+    for _query_name in QUERIES:
+        _register(_backend_name, _query_name)
@@ -0,0 +1,25 @@
+"""
+System checks of the chat app.
+
+The message body reference counts, the search index, the sync change log and the conversation counters are kept by
+SQLite triggers (see `chat/migrations`). On any other database nothing would maintain them: bodies would never be
+released and counters would stay at 0, so the app refuses to start there instead.
+"""
+from django.core.checks import Error, register
+from django.db import connections
+
+__all__ = ["check_database_vendor"]
+
+
+@register()
+def check_database_vendor(app_configs, **kwargs) -> list[Error]:
+    return [
+        Error(
+            f"The `{connection.alias}` database is {connection.vendor}, the chat app needs SQLite.",
+            hint="Its reference counts, search index, change log and counters are maintained by SQLite triggers.",
+            obj=connection.alias,
+            id="chat.E001",
+        )
+        for connection in connections.all()
+        if connection.vendor != "sqlite"
+    ]
@@ -0,0 +1,44 @@
+"""
+Live updates of conversations over WebSockets, so that the tabs and devices showing a conversation do not poll.
+
+Clients connect to `/ws/chat/live/` (see `backend/asgi.py` and `chat.live.consumer`), authenticated by their Django
+session, and subscribe to their conversations. Views `publish` new messages, version switches and title changes once
+their transaction commits, through the broker chosen with the `CHAT_LIVE_BROKER` setting: `InProcessBroker` reaches
+the connections of the worker itself, `TCPBroker` those of every worker connected to the same broker server
+(`python manage.py run_live_broker`).
+"""
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.module_loading import import_string
+
+from chat.live.brokers import Broker, InProcessBroker, Listener, TCPBroker
+
+__all__ = ["Broker", "InProcessBroker", "Listener", "TCPBroker", "channel_name", "get_broker", "publish"]
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_broker() -> Broker:
+    return import_string(settings.CHAT_LIVE_BROKER)()
+
+
+def channel_name(conversation_id) -> str:
+    return f"conversation.{conversation_id}"
+
+
+def publish(conversation_id, event_type: str, using: str = DEFAULT_DB_ALIAS, **data) -> None:
+    """Pushes an event to the subscribers of the conversation once the current transaction commits."""
+    message = {"type": event_type, "conversation_id": str(conversation_id), **data}
+    transaction.on_commit(lambda: _publish(channel_name(conversation_id), message), using=using)
+
+
+def _publish(channel: str, message: dict) -> None:
+    # Live updates are best effort, clients still get everything from the API
+    try:
+        get_broker().publish(channel, message)
+    except OSError:
+        logger.warning("Live update on %s not delivered, the broker is unreachable", channel, exc_info=True)
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import socket
+import threading
+from collections import defaultdict
+from typing import Optional
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+__all__ = ["Broker", "InProcessBroker", "Listener", "TCPBroker"]
+
+logger = logging.getLogger(__name__)
+
+
+class Listener:
+    """The subscriptions of one WebSocket connection, created and read on the connection's event loop."""
+
+    def __init__(self, broker: "Broker"):
+        self.broker = broker
+        self.channels: set[str] = set()
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def subscribe(self, channel: str) -> None:
+        """May block on the network, call it off the event loop."""
+        if channel not in self.channels:
+            self.channels.add(channel)
+            self.broker.subscribe(channel, self)
+
+    def unsubscribe(self, channel: str) -> None:
+        """May block on the network, call it off the event loop. The subscription is dropped even if that fails."""
+        if channel in self.channels:
+            self.channels.discard(channel)
+            try:
+                self.broker.unsubscribe(channel, self)
+            except OSError:
+                logger.warning("Unsubscribing from %s failed, the broker is unreachable", channel, exc_info=True)
+
+    def close(self) -> None:
+        for channel in list(self.channels):
+            self.unsubscribe(channel)
+
+    async def get(self) -> dict:
+        return await self._queue.get()
+
+    def deliver(self, message: dict) -> None:
+        """Queues a message for the connection, from any thread."""
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+        except RuntimeError:
+            pass  # the connection's loop is closed, it is going away
+
+
+class Broker:
+    """
+    Fans the published messages out to the listeners subscribed to their channel. `publish` may be called from any
+    thread, as views run in worker threads while the WebSocket connections live on the event loop.
+    """
+
+    def __init__(self):
+        self._listeners: dict[str, set[Listener]] = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def listen(self) -> Listener:
+        return Listener(self)
+
+    def publish(self, channel: str, message: dict) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, listener: Listener) -> bool:
+        """Returns whether the listener is the first one of the channel."""
+        with self._lock:
+            first = not self._listeners[channel]
+            self._listeners[channel].add(listener)
+        return first
+
+    def unsubscribe(self, channel: str, listener: Listener) -> bool:
+        """Returns whether the listener was the last one of the channel."""
+        with self._lock:
+            self._listeners[channel].discard(listener)
+            if self._listeners[channel]:
+                return False
+            del self._listeners[channel]
+        return True
+
+    def deliver(self, channel: str, message: dict) -> None:
+        with self._lock:
+            listeners = list(self._listeners.get(channel, ()))
+        for listener in listeners:
+            listener.deliver(message)
+
+
+class InProcessBroker(Broker):
+    """Reaches the connections of this process only, enough for a single worker."""
+
+    def publish(self, channel: str, message: dict) -> None:
+        self.deliver(channel, message)
+
+
+class TCPBroker(Broker):
+    """
+    Relays through the broker server at `CHAT_LIVE_BROKER_URL` (tcp://host:port), so a message published by one worker
+    reaches the connections of all of them. Every worker keeps one connection to the server, subscribed to the
+    channels its listeners want; messages come back from the server even to the worker that published them.
+
+    The protocol is one JSON object per line: `{"op": "subscribe" | "unsubscribe" | "publish", "channel": ...,
+    "message": ...}` to the server, `{"channel": ..., "message": ...}` from it. A lost connection is opened again,
+    with the subscriptions, on the next command.
+    """
+
+    def __init__(self, url: Optional[str] = None):
+        super().__init__()
+        parts = urlsplit(url or settings.CHAT_LIVE_BROKER_URL)
+        self.address = (parts.hostname, parts.port)
+        self._socket: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+
+    def publish(self, channel: str, message: dict) -> None:
+        self._send({"op": "publish", "channel": channel, "message": message})
+
+    def subscribe(self, channel: str, listener: Listener) -> bool:
+        first = super().subscribe(channel, listener)
+        if first:
+            self._send({"op": "subscribe", "channel": channel})
+        return first
+
+    def unsubscribe(self, channel: str, listener: Listener) -> bool:
+        last = super().unsubscribe(channel, listener)
+        if last:
+            self._send({"op": "unsubscribe", "channel": channel})
+        return last
+
+    def close(self) -> None:
+        with self._send_lock:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+    def _send(self, command: dict) -> None:
+        line = _encode(command)
+        with self._send_lock:
+            if self._socket is None:
+                self._socket = self._connect()
+            try:
+                self._socket.sendall(line)
+            except OSError:
+                self._socket.close()
+                self._socket = None
+                raise
+
+    def _connect(self) -> socket.socket:
+        connection = socket.create_connection(self.address, timeout=settings.CHAT_LIVE_BROKER_TIMEOUT)
+        connection.settimeout(None)
+        with self._lock:
+            channels = list(self._listeners)
+        connection.sendall(b"".join(_encode({"op": "subscribe", "channel": channel}) for channel in channels))
+        threading.Thread(target=self._read, args=(connection,), name="chat-live-broker", daemon=True).start()
+        return connection
+
+    def _read(self, connection: socket.socket) -> None:
+        try:
+            with connection.makefile("rb") as lines:
+                for line in lines:
+                    data = json.loads(line)
+                    self.deliver(data["channel"], data["message"])
+        except (OSError, ValueError):
+            pass
+        with self._send_lock:
+            if self._socket is connection:
+                self._socket.close()
+                self._socket = None
+
+
+def _encode(data: dict) -> bytes:
+    return json.dumps(data, cls=DjangoJSONEncoder).encode() + b"\n"
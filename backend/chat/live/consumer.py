@@ -0,0 +1,116 @@
+"""
+The ASGI application of the live update WebSockets.
+
+A connection is accepted when the Django session of its cookies belongs to an active user and, for browsers, its
+`Origin` is one of `CORS_ALLOWED_ORIGINS`, so other sites cannot use the session. The client then sends
+`{"action": "subscribe", "conversation_id": ...}` (or `"unsubscribe"`) for conversations of its user and receives the
+events `publish`ed on them as JSON text frames: `{"type": "message" | "version" | "title", "conversation_id": ...}`.
+"""
+import asyncio
+import json
+from importlib import import_module
+from types import SimpleNamespace
+from uuid import UUID
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http.cookie import parse_cookie
+
+from chat.live import channel_name, get_broker
+from chat.models import Conversation
+
+__all__ = ["LIVE_PATH", "websocket_application"]
+
+LIVE_PATH = "/ws/chat/live/"
+
+# Close codes in the range reserved for applications
+UNAUTHORIZED = 4401
+NOT_FOUND = 4404
+
+
+async def websocket_application(scope, receive, send) -> None:
+    if (await receive())["type"] != "websocket.connect":
+        return
+    if scope["path"] != LIVE_PATH:
+        await send({"type": "websocket.close", "code": NOT_FOUND})
+        return
+    user = await _user(scope)
+    if not user.is_authenticated or not _origin_allowed(scope):
+        await send({"type": "websocket.close", "code": UNAUTHORIZED})
+        return
+    await send({"type": "websocket.accept"})
+
+    listener = get_broker().listen()
+    pushing = asyncio.create_task(_push(listener, send))
+    try:
+        while True:
+            event = await receive()
+            if event["type"] == "websocket.disconnect":
+                break
+            if event["type"] == "websocket.receive":
+                await _command(event, user, listener, send)
+    finally:
+        pushing.cancel()
+        await sync_to_async(listener.close, thread_sensitive=False)()
+
+
+async def _push(listener, send) -> None:
+    while True:
+        await _send_json(send, await listener.get())
+
+
+async def _command(event: dict, user, listener, send) -> None:
+    try:
+        command = json.loads(event.get("text") or event.get("bytes") or "")
+        action = command["action"]
+        conversation_id = UUID(str(command["conversation_id"]))
+    except (ValueError, KeyError, TypeError):
+        await _send_json(send, {"type": "error", "detail": "Expected an action and a conversation_id"})
+        return
+
+    if action == "subscribe":
+        if not await _owns(user, conversation_id):
+            await _send_json(send, {"type": "error", "detail": "Conversation not found"})
+            return
+        try:
+            await sync_to_async(listener.subscribe, thread_sensitive=False)(channel_name(conversation_id))
+        except OSError:
+            await _send_json(send, {"type": "error", "detail": "Live updates are unavailable"})
+            return
+        await _send_json(send, {"type": "subscribed", "conversation_id": str(conversation_id)})
+    elif action == "unsubscribe":
+        await sync_to_async(listener.unsubscribe, thread_sensitive=False)(channel_name(conversation_id))
+        await _send_json(send, {"type": "unsubscribed", "conversation_id": str(conversation_id)})
+    else:
+        await _send_json(send, {"type": "error", "detail": f"Unknown action {action}"})
+
+
+async def _send_json(send, data: dict) -> None:
+    await send({"type": "websocket.send", "text": json.dumps(data, cls=DjangoJSONEncoder)})
+
+
+@sync_to_async
+def _user(scope):
+    cookies = parse_cookie(_header(scope, b"cookie"))
+    session = import_module(settings.SESSION_ENGINE).SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    return get_user(SimpleNamespace(session=session))
+
+
+@sync_to_async
+def _owns(user, conversation_id: UUID) -> bool:
+    return Conversation.objects.filter(pk=conversation_id, user=user, deleted_at__isnull=True).exists()
+
+
+def _origin_allowed(scope) -> bool:
+    # Clients other than browsers send no Origin
+    origin = _header(scope, b"origin")
+    return not origin or origin in settings.CORS_ALLOWED_ORIGINS
+
+
+def _header(scope, name: bytes) -> str:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return ""
@@ -0,0 +1,76 @@
+"""
+The stand-in broker server `TCPBroker` connects to, for development and multi-worker tests. It relays every published
+message to the connections subscribed to its channel and keeps nothing: no persistence, no authentication, so only
+bind it to a private interface. Production deployments can plug a real broker in with another `Broker` subclass.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from typing import Optional
+
+__all__ = ["BrokerServer"]
+
+
+class BrokerServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host, self.port = host, port
+        self.subscribers: dict[str, set[asyncio.StreamWriter]] = defaultdict(set)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    async def serve_forever(self, started: Optional[threading.Event] = None) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if started is not None:
+            started.set()
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def start(self) -> str:
+        """Runs the server on a background thread and returns its URL, for tests."""
+        started = threading.Event()
+        self._thread = threading.Thread(
+            target=asyncio.run, args=(self.serve_forever(started),), name="chat-live-broker-server", daemon=True
+        )
+        self._thread.start()
+        started.wait()
+        return f"tcp://{self.host}:{self.port}"
+
+    def stop(self) -> None:
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+        if self._thread is not None:
+            self._thread.join()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        channels = set()
+        try:
+            while line := await reader.readline():
+                command = json.loads(line)
+                channel = command["channel"]
+                if command["op"] == "subscribe":
+                    self.subscribers[channel].add(writer)
+                    channels.add(channel)
+                elif command["op"] == "unsubscribe":
+                    self.subscribers[channel].discard(writer)
+                    channels.discard(channel)
+                elif command["op"] == "publish":
+                    data = json.dumps({"channel": channel, "message": command["message"]}).encode() + b"\n"
+                    for subscriber in list(self.subscribers[channel]):
+                        subscriber.write(data)
+        except (ConnectionError, ValueError, KeyError):
+            pass  # a broken or misbehaving client only loses its own connection
+        except asyncio.CancelledError:
+            pass  # the server is stopping
+        finally:
+            for channel in channels:
+                self.subscribers[channel].discard(writer)
+                if not self.subscribers[channel]:
+                    del self.subscribers[channel]
+            writer.close()
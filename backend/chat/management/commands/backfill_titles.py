@@ -0,0 +1,146 @@
+import dataclasses
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import OuterRef, Subquery
+
+from chat.models import DEFAULT_CONVERSATION_TITLE, Conversation, Message
+from src.libs import openai
+from src.utils.gpt import GPT_VERSIONS, get_gpt_title, is_upstream_failure
+
+
+class Command(BaseCommand):
+    help = (
+        f'Generates titles for conversations still titled "{DEFAULT_CONVERSATION_TITLE}" using a bounded pool of '
+        "workers, writing them back in batches. Progress is checkpointed so an interrupted run can be resumed; the "
+        "run stops at the first upstream failure or open circuit breaker, before the conversations it could not title."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent title requests")
+        parser.add_argument("--batch-size", type=int, default=100, help="Conversations per bulk_update")
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many conversations")
+        parser.add_argument("--checkpoint", type=Path, default=None, help="File storing the last processed id")
+        parser.add_argument("--include-deleted", action="store_true", help="Also title soft-deleted conversations")
+        parser.add_argument("--dry-run", action="store_true", help="Generate titles without saving them")
+        parser.add_argument("--api-base", default=None, help="Override the upstream, e.g. a local fake server")
+        parser.add_argument("--api-key", default=None)
+        parser.add_argument("--api-type", default=None)
+
+    def handle(self, *args, **options):
+        if options["api_base"]:
+            GPT_VERSIONS["gpt35"] = dataclasses.replace(
+                GPT_VERSIONS["gpt35"],
+                api_base=options["api_base"],
+                api_key=options["api_key"] or GPT_VERSIONS["gpt35"].api_key,
+                api_type=options["api_type"] or GPT_VERSIONS["gpt35"].api_type,
+            )
+
+        checkpoint = options["checkpoint"]
+        last_id = checkpoint.read_text().strip() if checkpoint and checkpoint.exists() else None
+
+        conversations = Conversation.objects.filter(title=DEFAULT_CONVERSATION_TITLE, active_version__isnull=False)
+        if not options["include_deleted"]:
+            conversations = conversations.filter(deleted_at__isnull=True)
+        if last_id:
+            conversations = conversations.filter(pk__gt=last_id)
+            self.stdout.write(f"Resuming after conversation {last_id}")
+        conversations = conversations.order_by("pk").only("id", "title", "active_version_id")
+
+        stats = {"processed": 0, "titled": 0, "skipped": 0, "failed": 0}
+        started_at = time.monotonic()
+        batch = []
+        with ThreadPoolExecutor(max_workers=options["workers"], thread_name_prefix="backfill-title") as executor:
+            for conversation in conversations.iterator(chunk_size=options["batch_size"]):
+                batch.append(conversation)
+                if len(batch) >= options["batch_size"]:
+                    self._process_batch(batch, executor, stats, options)
+                    batch = []
+                if options["limit"] and stats["processed"] + len(batch) >= options["limit"]:
+                    break
+            if batch:
+                self._process_batch(batch, executor, stats, options)
+
+        elapsed = time.monotonic() - started_at
+        rate = stats["processed"] / elapsed if elapsed else 0.0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {stats['processed']} conversations in {elapsed:.1f}s ({rate:.1f}/s): "
+                f"{stats['titled']} titled, {stats['skipped']} without messages, {stats['failed']} failed"
+            )
+        )
+
+    def _process_batch(self, batch: list[Conversation], executor: ThreadPoolExecutor, stats: dict, options: dict):
+        prompts = _first_exchanges([c.active_version_id for c in batch])
+        jobs = {}
+        for conversation in batch:
+            question, answer = prompts.get(conversation.active_version_id, (None, None))
+            if question is None:
+                stats["skipped"] += 1
+                continue
+            jobs[conversation] = executor.submit(_generate_title, question, answer or "")
+
+        titled, done, error = [], len(batch), None
+        for conversation, job in jobs.items():
+            try:
+                title = job.result()
+            except Exception as e:
+                # Conversations from here on are retried by the next run
+                if error is None:
+                    error, done = e, batch.index(conversation)
+                    for pending in jobs.values():
+                        pending.cancel()
+                continue
+            if title is None:
+                stats["failed"] += 1
+                continue
+            conversation.title = title[: Conversation._meta.get_field("title").max_length]
+            titled.append(conversation)
+
+        if titled and not options["dry_run"]:
+            # Only rows still carrying the default title are updated, so concurrent user edits win
+            Conversation.objects.filter(title=DEFAULT_CONVERSATION_TITLE).bulk_update(titled, ["title"])
+        stats["titled"] += len(titled)
+        stats["processed"] += done
+
+        if options["checkpoint"] and not options["dry_run"] and done:
+            options["checkpoint"].write_text(str(batch[done - 1].pk))
+        self.stdout.write(f"{stats['processed']} conversations processed")
+        if error is not None:
+            raise CommandError(
+                f"Stopped after {stats['processed']} conversations, the upstream failed: {error}. "
+                "Run the command again with the same --checkpoint to resume."
+            )
+
+
+def _first_exchanges(version_ids: list) -> dict:
+    """Maps each version id to its first user message and its first assistant message, in one query."""
+    first = (
+        Message.objects.filter(version_id=OuterRef("version_id"), role_id=OuterRef("role_id"))
+        .order_by("position")
+        .values("position")[:1]
+    )
+    rows = Message.objects.filter(
+        version_id__in=version_ids, role__name__in=("user", "assistant"), position=Subquery(first)
+    ).values_list("version_id", "role__name", "body__content")
+    exchanges = {}
+    for version_id, role, content in rows:
+        question, answer = exchanges.get(version_id, (None, None))
+        if role == "user":
+            question = content
+        else:
+            answer = content
+        exchanges[version_id] = (question, answer)
+    return exchanges
+
+
+def _generate_title(question: str, answer: str):
+    """The title, or None when the upstream rejects this conversation. Upstream failures are raised."""
+    try:
+        return get_gpt_title(question, answer)
+    except openai.error.OpenAIError as e:
+        if is_upstream_failure(e):
+            raise
+        return None
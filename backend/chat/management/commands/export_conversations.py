@@ -0,0 +1,42 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from chat.models import Conversation
+from chat.utils.ndjson import export_conversations
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes conversations with their versions and messages as NDJSON (see chat/utils/ndjson.py), for backups or "
+        "to move users to another environment with import_conversations. Runs in constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", type=Path, default=None, help="File to write, standard output by default")
+        parser.add_argument("--user", action="append", default=[], help="Only conversations of this email")
+        parser.add_argument("--include-deleted", action="store_true", help="Also export soft-deleted conversations")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Conversations read per query")
+
+    def handle(self, *args, **options):
+        conversations = Conversation.objects.all()
+        if options["user"]:
+            conversations = conversations.filter(user__email__in=options["user"])
+        if not options["include_deleted"]:
+            conversations = conversations.filter(deleted_at__isnull=True)
+
+        started_at = time.monotonic()
+        lines = 0
+        out = options["output"].open("w", encoding="utf-8") if options["output"] else self.stdout
+        try:
+            for line in export_conversations(conversations, chunk_size=options["chunk_size"]):
+                out.write(line)
+                lines += 1
+        finally:
+            if options["output"]:
+                out.close()
+        if options["output"]:
+            self.stdout.write(
+                self.style.SUCCESS(f"Exported {lines - 1} records in {time.monotonic() - started_at:.1f}s")
+            )
@@ -0,0 +1,79 @@
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.utils.gc import GCPolicy, collect_garbage, collect_orphan_bodies
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes versions unreachable from the active version of their conversation, and versions without messages, "
+        "one slice of conversations per run. With --checkpoint, each run continues where the previous one stopped. "
+        "The run that completes a pass also deletes the message bodies no message references any more."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--slice-size", type=int, default=None, help="Conversations looked at per slice")
+        parser.add_argument("--batch-size", type=int, default=None, help="Versions deleted per transaction")
+        parser.add_argument("--slices", type=int, default=1, help="Slices to process, 0 for a full pass")
+        parser.add_argument("--checkpoint", type=Path, default=None, help="File storing the last processed id")
+        parser.add_argument("--keep-unreachable", action="store_true", help="Only delete empty versions")
+        parser.add_argument("--keep-empty", action="store_true", help="Only delete unreachable versions")
+        parser.add_argument("--min-idle-hours", type=float, default=None, help="Skip recently modified conversations")
+        parser.add_argument("--dry-run", action="store_true", help="Count the garbage without deleting it")
+
+    def handle(self, *args, **options):
+        policy = GCPolicy.from_settings()
+        if options["keep_unreachable"]:
+            policy.unreachable = False
+        if options["keep_empty"]:
+            policy.empty = False
+        if options["min_idle_hours"] is not None:
+            policy.min_idle = timedelta(hours=options["min_idle_hours"])
+
+        checkpoint = options["checkpoint"]
+        last_id = checkpoint.read_text().strip() if checkpoint and checkpoint.exists() else ""
+        if last_id:
+            self.stdout.write(f"Resuming after conversation {last_id}")
+
+        totals = {"conversations": 0, "garbage": 0, "versions": 0, "messages": 0, "bodies": 0, "seconds": 0.0}
+        totals["orphan_bodies"] = 0
+        started_at = time.monotonic()
+        slices = 0
+        while not options["slices"] or slices < options["slices"]:
+            stats = collect_garbage(
+                after=last_id or None,
+                slice_size=options["slice_size"] or settings.CHAT_GC_SLICE_SIZE,
+                batch_size=options["batch_size"] or settings.CHAT_GC_BATCH_SIZE,
+                policy=policy,
+                dry_run=options["dry_run"],
+            )
+            slices += 1
+            for key in stats.keys() & totals.keys():
+                totals[key] += stats[key]
+            last_id = str(stats["last"] or "")
+            if checkpoint and not options["dry_run"]:
+                # An empty checkpoint starts the next run from the first conversation again
+                checkpoint.write_text(last_id)
+            self.stdout.write(
+                f"{totals['conversations']} conversations looked at, {totals['garbage']} garbage versions"
+            )
+            if not last_id:
+                # The whole bodies table is scanned, once per pass
+                totals["orphan_bodies"] = collect_orphan_bodies(
+                    batch_size=options["batch_size"] or settings.CHAT_GC_BATCH_SIZE, dry_run=options["dry_run"]
+                )
+                break
+
+        verb = "Found" if options["dry_run"] else "Deleted"
+        count = totals["garbage"] if options["dry_run"] else totals["versions"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {count} versions ({totals['messages']} messages, {totals['bodies']} message bodies) in "
+                f"{totals['conversations']} conversations and {totals['orphan_bodies']} unreferenced message bodies "
+                f"in {time.monotonic() - started_at:.1f}s, database locked for {totals['seconds']:.2f}s"
+            )
+        )
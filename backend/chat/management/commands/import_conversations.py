@@ -0,0 +1,49 @@
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.models import CustomUser
+from chat.utils.ndjson import NDJSONImportError, import_conversations
+
+
+class Command(BaseCommand):
+    help = (
+        "Reads an NDJSON export of export_conversations, keeping ids and timestamps. Conversations that already exist "
+        "are skipped, so an interrupted import can be run again. Runs in constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", type=Path, help="Export to read, - for standard input")
+        parser.add_argument("--user", default=None, help="Import every conversation for this email")
+        parser.add_argument("--batch-size", type=int, default=10_000, help="Messages written per transaction")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            try:
+                user = CustomUser.objects.get(email=options["user"])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']}")
+
+        started_at = time.monotonic()
+        path = options["input"]
+        source = sys.stdin if str(path) == "-" else path.open(encoding="utf-8")
+        try:
+            stats = import_conversations(source, user=user, batch_size=options["batch_size"])
+        except NDJSONImportError as e:
+            raise CommandError(str(e))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {stats['conversations']} conversations, {stats['versions']} versions and "
+                f"{stats['messages']} messages in {elapsed:.1f}s "
+                f"({stats['messages'] / elapsed if elapsed else 0:.0f} messages/s), "
+                f"skipped {stats['skipped']} existing conversations"
+            )
+        )
@@ -0,0 +1,52 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.utils.deletion import purge_deleted_conversations
+
+
+class Command(BaseCommand):
+    help = (
+        "Hard-deletes conversations soft-deleted more than CHAT_PURGE_RETENTION_DAYS ago, in batches of one "
+        "transaction each. Meant to be run periodically, e.g. daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=float, default=None, help="Retention, defaults to CHAT_PURGE_RETENTION_DAYS")
+        parser.add_argument("--batch-size", type=int, default=None, help="Conversations deleted per transaction")
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many conversations")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to wait between batches")
+
+    def handle(self, *args, **options):
+        days = settings.CHAT_PURGE_RETENTION_DAYS if options["days"] is None else options["days"]
+        batch_size = options["batch_size"] or settings.CHAT_PURGE_BATCH_SIZE
+
+        totals = {"conversations": 0, "versions": 0, "messages": 0, "bodies": 0}
+        lock_times = []
+        started_at = time.monotonic()
+        batches = purge_deleted_conversations(timedelta(days=days), batch_size=batch_size, limit=options["limit"])
+        for stats in batches:
+            for key in totals:
+                totals[key] += stats[key]
+            lock_times.append(stats["seconds"])
+            self.stdout.write(
+                f"{totals['conversations']} conversations purged "
+                f"({stats['messages']} messages in {stats['seconds'] * 1000:.0f}ms)"
+            )
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Purged {totals['conversations']} conversations, {totals['versions']} versions, "
+                f"{totals['messages']} messages and {totals['bodies']} message bodies in {elapsed:.1f}s"
+            )
+        )
+        if lock_times:
+            self.stdout.write(
+                f"{len(lock_times)} batches, database locked for {sum(lock_times):.2f}s in total, "
+                f"{sum(lock_times) / len(lock_times) * 1000:.0f}ms on average, {max(lock_times) * 1000:.0f}ms at most"
+            )
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Re-indexes every message with the configured CHAT_SEARCH_BACKEND, e.g. after a restore or a bulk import."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50_000, help="Messages indexed per statement")
+
+    def handle(self, *args, **options):
+        started_at = time.monotonic()
+        total = get_backend().rebuild(
+            batch_size=options["batch_size"],
+            progress=lambda done, total: self.stdout.write(f"{done}/{total} messages indexed"),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} messages in {time.monotonic() - started_at:.1f}s"))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.utils.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the denormalized counters and last message of every conversation and repairs the ones that "
+        "drifted, one transaction per slice of conversations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--slice-size", type=int, default=500, help="Conversations checked per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Count the drifted conversations without repairing")
+
+    def handle(self, *args, **options):
+        totals = {"conversations": 0, "repaired": 0}
+        started_at = time.monotonic()
+        for stats in reconcile_counters(slice_size=options["slice_size"], dry_run=options["dry_run"]):
+            for key in totals:
+                totals[key] += stats[key]
+            self.stdout.write(f"{totals['conversations']} conversations checked, {totals['repaired']} drifted")
+
+        verb = "Found" if options["dry_run"] else "Repaired"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {totals['repaired']} of {totals['conversations']} conversations "
+                f"in {time.monotonic() - started_at:.1f}s"
+            )
+        )
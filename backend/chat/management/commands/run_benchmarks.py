@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from chat.benchmarks import load_benchmarks
+from chat.benchmarks.runner import environment, find_regressions, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the registered benchmarks (branching, serializers, views, ...) on a throwaway test database, writes "
+        "the timings as JSON and fails when any median regresses beyond --threshold against --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--filter", action="append", default=[], help="Only run benchmarks containing this")
+        parser.add_argument("--quick", action="store_true", help="Only run the smallest size of each benchmark")
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"))
+        parser.add_argument("--baseline", type=Path, default=None, help="JSON results to compare against")
+        parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown, 0.25 means +25%%")
+        parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+        parser.add_argument(
+            "--use-current-db", action="store_true", help="Run against the configured database (rolled back)"
+        )
+
+    def handle(self, *args, **options):
+        benchmarks = [
+            bench
+            for name, bench in sorted(load_benchmarks().items())
+            if not options["filter"] or any(f in name for f in options["filter"])
+        ]
+        if not benchmarks:
+            raise CommandError("No benchmarks match the given filters")
+
+        setup_test_environment()
+        old_name = None
+        if not options["use_current_db"]:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self._run(benchmarks, options)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {"environment": environment(), "results": results}
+        options["output"].write_text(json.dumps(report, indent=2))
+        self.stdout.write(f"Results written to {options['output']}")
+
+        baseline_path = options["baseline"]
+        if baseline_path and options["save_baseline"]:
+            baseline_path.write_text(json.dumps(report, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {baseline_path}"))
+        elif baseline_path:
+            if not baseline_path.exists():
+                raise CommandError(f"Baseline {baseline_path} does not exist, create it with --save-baseline")
+            baseline = json.loads(baseline_path.read_text())["results"]
+            regressions = find_regressions(results, baseline, options["threshold"])
+            if regressions:
+                raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regressions beyond {options['threshold']:.0%}"))
+
+    def _run(self, benchmarks, options) -> dict:
+        results = {}
+        for bench in benchmarks:
+            sizes = bench.sizes[:1] if options["quick"] else bench.sizes
+            for size in sizes:
+                key = f"{bench.name}[{size}]"
+                results[key] = run_benchmark(bench, size, options["repeat"])
+                self.stdout.write(
+                    f"{key:<40}{results[key]['median_ms']:>12.2f} ms median{results[key]['min_ms']:>12.2f} ms min"
+                )
+        return results
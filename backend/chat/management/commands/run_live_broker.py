@@ -0,0 +1,24 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from chat.live.server import BrokerServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the stand-in broker that relays live updates between workers when CHAT_LIVE_BROKER is "
+        "chat.live.TCPBroker. For development and tests, it has no authentication."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+
+    def handle(self, *args, **options):
+        server = BrokerServer(options["host"], options["port"])
+        self.stdout.write(f"Live update broker listening on tcp://{options['host']}:{options['port']}")
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
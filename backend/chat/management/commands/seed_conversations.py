@@ -0,0 +1,119 @@
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from authentication.models import CustomUser
+from chat.benchmarks.generators import EPOCH, ConversationBuilder, grow_mixed
+from chat.models import Conversation, Message, Role, Version, VersionAncestry
+from chat.search import get_backend as get_search_backend
+from chat.utils.bulk import preserved_timestamps
+from chat.utils.changes import record_conversations
+from chat.utils.counters import refresh_counters
+from chat.utils.sqlite import suspended_triggers
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with load-test data: users named <prefix>-<n>@example.com and conversations with random "
+        "version trees spread over them. Rows are built in memory and written with batched bulk_create while the "
+        "triggers are suspended; counters, change log, reference counts and search index are then maintained once "
+        "per batch. Building the INSERTs dominates, at about 3000 messages per second, so a million messages take "
+        "about six minutes. The same --seed always produces the same rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--conversations", type=int, default=100, help="Total, spread round-robin over users")
+        parser.add_argument("--max-versions", type=int, default=6, help="Versions per conversation: 1 to this")
+        parser.add_argument("--max-messages", type=int, default=20, help="Messages in the root version: 2 to this")
+        parser.add_argument("--body-words", type=int, default=20, help="Average words per message body")
+        parser.add_argument("--batch-size", type=int, default=50_000, help="Messages written per transaction")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="seed")
+        parser.add_argument("--password", default="seed-password")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        roles = {name: Role.objects.get_or_create(name=name)[0] for name in ("user", "assistant")}
+        users = self._users(options)
+
+        stats = {"conversations": 0, "versions": 0, "messages": 0}
+        pending = ([], [], [])
+        started_at = time.monotonic()
+        for idx in range(options["conversations"]):
+            builder = ConversationBuilder(
+                users[idx % len(users)],
+                title=f"Seeded conversation {idx}",
+                start=EPOCH + timedelta(minutes=idx),
+                seed=f"{options['seed']}-{idx}",
+                roles=roles,
+                body_words=options["body_words"],
+                deterministic_ids=True,
+            )
+            first = rng.randrange(2, max(options["max_messages"], 2) + 1, 2)
+            grow_mixed(builder, size=rng.randint(0, options["max_versions"] - 1), first=first)
+            conversation, versions, messages = builder.finish()
+            pending[0].append(conversation)
+            pending[1].extend(versions)
+            pending[2].extend(messages)
+
+            if len(pending[2]) >= options["batch_size"]:
+                self._flush(pending, stats, started_at)
+                pending = ([], [], [])
+        if pending[0]:
+            self._flush(pending, stats, started_at)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {stats['conversations']} conversations, {stats['versions']} versions and "
+                f"{stats['messages']} messages for {len(users)} users in {time.monotonic() - started_at:.1f}s"
+            )
+        )
+
+    def _users(self, options: dict) -> list[CustomUser]:
+        emails = [f"{options['prefix']}-{idx}@example.com" for idx in range(options["users"])]
+        existing = {user.email: user for user in CustomUser.objects.filter(email__in=emails)}
+        # Hashing is deliberately slow, so every seeded user shares one hash
+        password = make_password(options["password"])
+        missing = [
+            CustomUser(email=email, password=password, is_active=True) for email in emails if email not in existing
+        ]
+        CustomUser.objects.bulk_create(missing)
+        existing.update({user.email: user for user in missing})
+        return [existing[email] for email in emails]
+
+    def _flush(self, pending: tuple, stats: dict, started_at: float) -> None:
+        conversations, versions, messages = pending
+        # Conversations point at their active version and versions at their root message before those rows exist;
+        # foreign keys are only checked when the transaction commits
+        # The triggers would count, log and index every row one at a time; as in the NDJSON import, the same work is
+        # done once per batch with set-based statements
+        with transaction.atomic(), suspended_triggers(), preserved_timestamps(Conversation, Message):
+            Conversation.objects.bulk_create(conversations)
+            Version.objects.bulk_create(versions)
+            Message.objects.bulk_create(messages)
+            VersionAncestry.objects.bulk_create(VersionAncestry.objects.rows_for(versions))
+            references = Counter(message.body_id for message in messages)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    "UPDATE chat_messagebody SET ref_count = ref_count + %s WHERE hash = %s",
+                    [(count, body_id) for body_id, count in references.items()],
+                )
+                pk = Conversation._meta.pk
+                conversation_ids = [pk.get_db_prep_value(conversation.pk, connection) for conversation in conversations]
+                refresh_counters(cursor, conversation_ids)
+                record_conversations(cursor, conversation_ids)
+            get_search_backend().index([message.pk for message in messages])
+        stats["conversations"] += len(conversations)
+        stats["versions"] += len(versions)
+        stats["messages"] += len(messages)
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(
+            f"{stats['conversations']} conversations, {stats['messages']} messages "
+            f"({stats['messages'] / elapsed if elapsed else 0:.0f} messages/s)"
+        )
@@ -0,0 +1,67 @@
+# Generated by Django 5.0.2 on 2026-10-19 16:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# The single-column foreign key indexes are prefixes of the new composite indexes
+REDUNDANT_INDEXES = [("conversation", "user_id"), ("message", "version_id")]
+
+
+def drop_redundant_indexes(apps, schema_editor):
+    # AlterField(db_index=False) would rebuild both tables on SQLite, dropping the indexes directly does not
+    connection = schema_editor.connection
+    for model_name, column in REDUNDANT_INDEXES:
+        model = apps.get_model("chat", model_name)
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        for name, constraint in constraints.items():
+            if constraint["index"] and constraint["columns"] == [column] and not constraint["unique"]:
+                schema_editor.remove_index(model, models.Index(fields=[column.removesuffix("_id")], name=name))
+
+
+def restore_redundant_indexes(apps, schema_editor):
+    for model_name, column in REDUNDANT_INDEXES:
+        model = apps.get_model("chat", model_name)
+        name = f"{model._meta.db_table}_{column}_idx"
+        schema_editor.add_index(model, models.Index(fields=[column.removesuffix("_id")], name=name))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="conversation",
+                    name="user",
+                    field=models.ForeignKey(
+                        db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="message",
+                    name="version",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="messages",
+                        to="chat.version",
+                    ),
+                ),
+            ],
+            database_operations=[migrations.RunPython(drop_redundant_indexes, restore_redundant_indexes)],
+        ),
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(fields=["user", "deleted_at", "-modified_at"], name="chat_conv_user_deleted_mod_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["version", "created_at"], name="chat_msg_version_created_idx"),
+        ),
+    ]
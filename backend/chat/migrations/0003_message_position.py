@@ -0,0 +1,46 @@
+# Generated by Django 5.0.2 on 2026-10-19 18:02
+
+from django.db import migrations, models
+
+# One set-based statement rather than a save() per row; ties on created_at are broken by id so the result is stable
+BACKFILL_POSITIONS = """
+UPDATE chat_message SET position = numbered.position
+FROM (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY version_id ORDER BY created_at, id) - 1 AS position
+    FROM chat_message
+) AS numbered
+WHERE numbered.id = chat_message.id
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0002_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="position",
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_POSITIONS, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name="message",
+            name="position",
+            field=models.PositiveIntegerField(editable=False),
+        ),
+        migrations.AlterModelOptions(
+            name="message",
+            options={"ordering": ["position"]},
+        ),
+        migrations.AddConstraint(
+            model_name="message",
+            constraint=models.UniqueConstraint(fields=("version", "position"), name="chat_msg_version_position_uniq"),
+        ),
+        # The unique constraint's index covers every lookup the (version, created_at) index served
+        migrations.RemoveIndex(
+            model_name="message",
+            name="chat_msg_version_created_idx",
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.2 on 2026-10-19 17:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Walks every version up to its root in one recursive statement
+BACKFILL_ANCESTRY = """
+INSERT INTO chat_versionancestry (ancestor_id, descendant_id, depth)
+WITH RECURSIVE closure (ancestor_id, descendant_id, depth) AS (
+    SELECT id, id, 0 FROM chat_version
+    UNION ALL
+    SELECT version.parent_version_id, closure.descendant_id, closure.depth + 1
+    FROM closure JOIN chat_version AS version ON version.id = closure.ancestor_id
+    WHERE version.parent_version_id IS NOT NULL
+)
+SELECT ancestor_id, descendant_id, depth FROM closure
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0003_message_position"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VersionAncestry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("depth", models.PositiveIntegerField()),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_links",
+                        to="chat.version",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_links",
+                        to="chat.version",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "version ancestries",
+                "indexes": [models.Index(fields=["descendant", "depth"], name="chat_ancestry_desc_depth_idx")],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="versionancestry",
+            constraint=models.UniqueConstraint(fields=("ancestor", "descendant"), name="chat_ancestry_uniq"),
+        ),
+        migrations.RunSQL(BACKFILL_ANCESTRY, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.0.2 on 2026-10-19 19:10
+
+from django.db import migrations
+
+# The schema as of this migration, later migrations change the triggers
+OWNER = """
+(SELECT 'u' || conversation.user_id
+ FROM chat_version AS version JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+ WHERE version.id = new.version_id)
+"""
+
+INSTALL = [
+    "CREATE TABLE chat_message_search (rowid INTEGER PRIMARY KEY, message_id char(32) NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE chat_message_fts USING fts5(content, owner, tokenize = 'unicode61 remove_diacritics 2')",
+    f"""
+    CREATE TRIGGER chat_message_search_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_search (message_id) VALUES (new.id);
+        INSERT INTO chat_message_fts (rowid, content, owner)
+        VALUES ((SELECT rowid FROM chat_message_search WHERE message_id = new.id), new.content, {OWNER});
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_search_update AFTER UPDATE OF content ON chat_message BEGIN
+        UPDATE chat_message_fts SET content = new.content
+        WHERE rowid = (SELECT rowid FROM chat_message_search WHERE message_id = new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_search_delete AFTER DELETE ON chat_message BEGIN
+        DELETE FROM chat_message_fts WHERE rowid = (SELECT rowid FROM chat_message_search WHERE message_id = old.id);
+        DELETE FROM chat_message_search WHERE message_id = old.id;
+    END
+    """,
+    "INSERT INTO chat_message_search (message_id) SELECT id FROM chat_message",
+    """
+    INSERT INTO chat_message_fts (rowid, content, owner)
+    SELECT search.rowid, message.content, 'u' || conversation.user_id
+    FROM chat_message_search AS search
+    JOIN chat_message AS message ON message.id = search.message_id
+    JOIN chat_version AS version ON version.id = message.version_id
+    JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+    """,
+]
+
+UNINSTALL = [
+    "DROP TRIGGER IF EXISTS chat_message_search_insert",
+    "DROP TRIGGER IF EXISTS chat_message_search_update",
+    "DROP TRIGGER IF EXISTS chat_message_search_delete",
+    "DROP TABLE IF EXISTS chat_message_fts",
+    "DROP TABLE IF EXISTS chat_message_search",
+]
+
+
+def install(apps, schema_editor):
+    # The FTS5 index only exists on SQLite, other databases use another CHAT_SEARCH_BACKEND
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in INSTALL:
+            schema_editor.execute(statement)
+
+
+def uninstall(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in UNINSTALL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0004_version_ancestry"),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
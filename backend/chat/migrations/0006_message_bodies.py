@@ -0,0 +1,193 @@
+# Generated by Django 5.0.2 on 2026-10-19 20:05
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 10_000
+
+# Reference counting, kept in the database so that bulk inserts and set-based deletes are counted too
+REF_COUNT_TRIGGERS = [
+    """
+    CREATE TRIGGER chat_messagebody_ref_insert AFTER INSERT ON chat_message BEGIN
+        UPDATE chat_messagebody SET ref_count = ref_count + 1 WHERE hash = new.body_id;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_messagebody_ref_update AFTER UPDATE OF body_id ON chat_message
+    WHEN old.body_id != new.body_id BEGIN
+        UPDATE chat_messagebody SET ref_count = ref_count + 1 WHERE hash = new.body_id;
+        UPDATE chat_messagebody SET ref_count = ref_count - 1 WHERE hash = old.body_id;
+        DELETE FROM chat_messagebody WHERE hash = old.body_id AND ref_count = 0;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_messagebody_ref_delete AFTER DELETE ON chat_message BEGIN
+        UPDATE chat_messagebody SET ref_count = ref_count - 1 WHERE hash = old.body_id;
+        DELETE FROM chat_messagebody WHERE hash = old.body_id AND ref_count = 0;
+    END
+    """,
+]
+
+DROP_REF_COUNT_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS chat_messagebody_ref_insert",
+    "DROP TRIGGER IF EXISTS chat_messagebody_ref_update",
+    "DROP TRIGGER IF EXISTS chat_messagebody_ref_delete",
+]
+
+# The search triggers of 0005 read chat_message.content, which goes away
+OLD_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER chat_message_search_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_search (message_id) VALUES (new.id);
+        INSERT INTO chat_message_fts (rowid, content, owner)
+        VALUES ((SELECT rowid FROM chat_message_search WHERE message_id = new.id), new.content, (
+            SELECT 'u' || conversation.user_id
+            FROM chat_version AS version JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+            WHERE version.id = new.version_id
+        ));
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_search_update AFTER UPDATE OF content ON chat_message BEGIN
+        UPDATE chat_message_fts SET content = new.content
+        WHERE rowid = (SELECT rowid FROM chat_message_search WHERE message_id = new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_search_delete AFTER DELETE ON chat_message BEGIN
+        DELETE FROM chat_message_fts WHERE rowid = (SELECT rowid FROM chat_message_search WHERE message_id = old.id);
+        DELETE FROM chat_message_search WHERE message_id = old.id;
+    END
+    """,
+]
+
+NEW_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER chat_message_search_insert AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_search (message_id) VALUES (new.id);
+        INSERT INTO chat_message_fts (rowid, content, owner)
+        VALUES (
+            (SELECT rowid FROM chat_message_search WHERE message_id = new.id),
+            (SELECT content FROM chat_messagebody WHERE hash = new.body_id),
+            (
+                SELECT 'u' || conversation.user_id
+                FROM chat_version AS version
+                JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+                WHERE version.id = new.version_id
+            )
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_search_update AFTER UPDATE OF body_id ON chat_message BEGIN
+        UPDATE chat_message_fts SET content = (SELECT content FROM chat_messagebody WHERE hash = new.body_id)
+        WHERE rowid = (SELECT rowid FROM chat_message_search WHERE message_id = new.id);
+    END
+    """,
+    OLD_SEARCH_TRIGGERS[2],
+]
+
+DROP_SEARCH_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS chat_message_search_insert",
+    "DROP TRIGGER IF EXISTS chat_message_search_update",
+    "DROP TRIGGER IF EXISTS chat_message_search_delete",
+]
+
+
+def _sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == "sqlite":
+            for statement in statements:
+                schema_editor.execute(statement)
+
+    return run
+
+
+def dedupe_bodies(apps, schema_editor):
+    """Points every message at the body of its content, one batch of messages at a time."""
+    Message = apps.get_model("chat", "Message")
+    MessageBody = apps.get_model("chat", "MessageBody")
+    messages = Message.objects.order_by("pk").values_list("pk", "content")
+
+    last_pk = None
+    while True:
+        batch = list((messages if last_pk is None else messages.filter(pk__gt=last_pk))[:BATCH_SIZE])
+        if not batch:
+            break
+        hashes = {pk: hashlib.sha256(content.encode()).hexdigest() for pk, content in batch}
+        bodies = {hashes[pk]: content for pk, content in batch}
+        MessageBody.objects.bulk_create(
+            [MessageBody(hash=hash, content=content) for hash, content in bodies.items()], ignore_conflicts=True
+        )
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                "UPDATE chat_message SET body_id = %s WHERE id = %s",
+                [
+                    (hash, Message._meta.pk.get_db_prep_value(pk, schema_editor.connection))
+                    for pk, hash in hashes.items()
+                ],
+            )
+        last_pk = batch[-1][0]
+
+    schema_editor.execute(
+        "UPDATE chat_messagebody SET ref_count = "
+        "(SELECT COUNT(*) FROM chat_message WHERE chat_message.body_id = chat_messagebody.hash)"
+    )
+
+
+def restore_content(apps, schema_editor):
+    schema_editor.execute(
+        "UPDATE chat_message SET content = (SELECT content FROM chat_messagebody WHERE hash = chat_message.body_id)"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0005_message_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MessageBody",
+            fields=[
+                ("hash", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("content", models.TextField()),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        # Table rebuilds drop triggers, the search ones go first and come back reading the body
+        migrations.RunPython(_sqlite(DROP_SEARCH_TRIGGERS), _sqlite(OLD_SEARCH_TRIGGERS)),
+        # Lets the column come back empty when unapplied, before `restore_content` fills it
+        migrations.AlterField(
+            model_name="message",
+            name="content",
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="body",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="messages",
+                to="chat.messagebody",
+            ),
+        ),
+        migrations.RunPython(dedupe_bodies, restore_content),
+        migrations.RemoveField(
+            model_name="message",
+            name="content",
+        ),
+        migrations.AlterField(
+            model_name="message",
+            name="body",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT, related_name="messages", to="chat.messagebody"
+            ),
+        ),
+        migrations.RunPython(
+            _sqlite(REF_COUNT_TRIGGERS + NEW_SEARCH_TRIGGERS), _sqlite(DROP_REF_COUNT_TRIGGERS + DROP_SEARCH_TRIGGERS)
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.0.2 on 2026-10-19 21:10
+
+from django.conf import settings
+from django.db import migrations
+
+import chat.utils.compression
+
+BATCH_SIZE = 5_000
+
+# The search triggers of 0006 reading plain bodies only. SQL cannot decompress, the text of compressed bodies is
+# indexed from Python (see `chat.search.backends.SQLiteFTS5Backend`); the bodies already indexed keep their text
+_CONTENT = "(SELECT {} FROM chat_messagebody WHERE hash = new.body_id)"
+_OWNER = """(
+    SELECT 'u' || conversation.user_id
+    FROM chat_version AS version JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+    WHERE version.id = new.version_id
+)"""
+
+
+def _search_triggers(content: str) -> list[str]:
+    return [
+        f"""
+        CREATE TRIGGER chat_message_search_insert AFTER INSERT ON chat_message BEGIN
+            INSERT INTO chat_message_search (message_id) VALUES (new.id);
+            INSERT INTO chat_message_fts (rowid, content, owner)
+            VALUES ((SELECT rowid FROM chat_message_search WHERE message_id = new.id), {content}, {_OWNER});
+        END
+        """,
+        f"""
+        CREATE TRIGGER chat_message_search_update AFTER UPDATE OF body_id ON chat_message BEGIN
+            UPDATE chat_message_fts SET content = {content}
+            WHERE rowid = (SELECT rowid FROM chat_message_search WHERE message_id = new.id);
+        END
+        """,
+    ]
+
+
+DROP_SEARCH_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS chat_message_search_insert",
+    "DROP TRIGGER IF EXISTS chat_message_search_update",
+]
+
+
+def _sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == "sqlite":
+            for statement in statements:
+                schema_editor.execute(statement)
+
+    return run
+
+
+def compress_bodies(apps, schema_editor):
+    """Compresses the plain bodies above the threshold, one batch at a time in primary key order."""
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    threshold = settings.CHAT_BODY_COMPRESSION_THRESHOLD
+    last_hash = ""
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                "SELECT hash, content FROM chat_messagebody "
+                "WHERE hash > %s AND typeof(content) = 'text' AND length(CAST(content AS BLOB)) >= %s "
+                "ORDER BY hash LIMIT %s",
+                [last_hash, threshold, BATCH_SIZE],
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            updates = [(chat.utils.compression.compress(content), hash) for hash, content in rows]
+            cursor.executemany(
+                "UPDATE chat_messagebody SET content = %s WHERE hash = %s",
+                [(value, hash) for value, hash in updates if isinstance(value, bytes)],
+            )
+            last_hash = rows[-1][0]
+
+
+def decompress_bodies(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(
+                "SELECT hash, content FROM chat_messagebody WHERE typeof(content) = 'blob' LIMIT %s", [BATCH_SIZE]
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                "UPDATE chat_messagebody SET content = %s WHERE hash = %s",
+                [(chat.utils.compression.decompress(content), hash) for hash, content in rows],
+            )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0006_message_bodies"),
+    ]
+
+    operations = [
+        # Same column type, only the values change; altering it would rebuild the table for nothing
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="messagebody",
+                    name="content",
+                    field=chat.utils.compression.CompressedTextField(),
+                ),
+            ],
+        ),
+        migrations.RunPython(
+            _sqlite(
+                DROP_SEARCH_TRIGGERS
+                + _search_triggers(_CONTENT.format("CASE WHEN typeof(content) = 'text' THEN content END"))
+            ),
+            _sqlite(DROP_SEARCH_TRIGGERS + _search_triggers(_CONTENT.format("content"))),
+        ),
+        migrations.RunPython(compress_bodies, decompress_bodies),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.0.2 on 2026-10-19 22:30
+
+from django.db import migrations
+
+_OWNER = """(
+    SELECT 'u' || conversation.user_id
+    FROM chat_version AS version JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+    WHERE version.id = new.version_id
+)"""
+_CONTENT = "(SELECT CASE WHEN typeof(content) = 'text' THEN content END FROM chat_messagebody WHERE hash = new.body_id)"
+
+# `chat.utils.sqlite.suspended_triggers()` holds a row here for the length of its block, plain SQL so that the triggers
+# run the same from dbshell or the sqlite3 CLI
+CONTROL_TABLE = ["CREATE TABLE chat_triggers_suspended (id INTEGER PRIMARY KEY)"]
+DROP_CONTROL_TABLE = ["DROP TABLE IF EXISTS chat_triggers_suspended"]
+_ENABLED = "NOT EXISTS (SELECT 1 FROM chat_triggers_suspended)"
+
+
+def _triggers(enabled: str) -> list[str]:
+    """The reference count triggers of 0006 and the search triggers of 0007, under the condition `enabled`."""
+    return [
+        f"""
+        CREATE TRIGGER chat_messagebody_ref_insert AFTER INSERT ON chat_message WHEN {enabled} BEGIN
+            UPDATE chat_messagebody SET ref_count = ref_count + 1 WHERE hash = new.body_id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER chat_messagebody_ref_update AFTER UPDATE OF body_id ON chat_message
+        WHEN {enabled} AND old.body_id != new.body_id BEGIN
+            UPDATE chat_messagebody SET ref_count = ref_count + 1 WHERE hash = new.body_id;
+            UPDATE chat_messagebody SET ref_count = ref_count - 1 WHERE hash = old.body_id;
+            DELETE FROM chat_messagebody WHERE hash = old.body_id AND ref_count = 0;
+        END
+        """,
+        f"""
+        CREATE TRIGGER chat_messagebody_ref_delete AFTER DELETE ON chat_message WHEN {enabled} BEGIN
+            UPDATE chat_messagebody SET ref_count = ref_count - 1 WHERE hash = old.body_id;
+            DELETE FROM chat_messagebody WHERE hash = old.body_id AND ref_count = 0;
+        END
+        """,
+        f"""
+        CREATE TRIGGER chat_message_search_insert AFTER INSERT ON chat_message WHEN {enabled} BEGIN
+            INSERT INTO chat_message_search (message_id) VALUES (new.id);
+            INSERT INTO chat_message_fts (rowid, content, owner)
+            VALUES ((SELECT rowid FROM chat_message_search WHERE message_id = new.id), {_CONTENT}, {_OWNER});
+        END
+        """,
+        f"""
+        CREATE TRIGGER chat_message_search_update AFTER UPDATE OF body_id ON chat_message WHEN {enabled} BEGIN
+            UPDATE chat_message_fts SET content = {_CONTENT}
+            WHERE rowid = (SELECT rowid FROM chat_message_search WHERE message_id = new.id);
+        END
+        """,
+        f"""
+        CREATE TRIGGER chat_message_search_delete AFTER DELETE ON chat_message WHEN {enabled} BEGIN
+            DELETE FROM chat_message_fts
+            WHERE rowid = (SELECT rowid FROM chat_message_search WHERE message_id = old.id);
+            DELETE FROM chat_message_search WHERE message_id = old.id;
+        END
+        """,
+    ]
+
+
+DROP_TRIGGERS = [
+    f"DROP TRIGGER IF EXISTS {name}"
+    for name in (
+        "chat_messagebody_ref_insert",
+        "chat_messagebody_ref_update",
+        "chat_messagebody_ref_delete",
+        "chat_message_search_insert",
+        "chat_message_search_update",
+        "chat_message_search_delete",
+    )
+]
+
+
+def _sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == "sqlite":
+            for statement in statements:
+                schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0007_compressed_message_bodies"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _sqlite(CONTROL_TABLE + DROP_TRIGGERS + _triggers(_ENABLED)),
+            # `WHEN 1` behaves like the unconditioned triggers of 0006 and 0007
+            _sqlite(DROP_TRIGGERS + _triggers("1") + DROP_CONTROL_TABLE),
+        ),
+    ]
@@ -0,0 +1,132 @@
+# Generated by Django 5.0.2 on 2026-10-19 23:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+_COLUMNS = "chat_change (user_id, conversation_id, kind, object_id, deleted, changed_at)"
+# The triggers are skipped while `chat.utils.sqlite.suspended_triggers()` holds a row in this table
+_ENABLED = "NOT EXISTS (SELECT 1 FROM chat_triggers_suspended)"
+
+
+def _message_change(row: str, deleted: int) -> str:
+    return f"""
+    INSERT OR REPLACE INTO {_COLUMNS}
+    SELECT conversation.user_id, conversation.id, 'message', {row}.id, {deleted}, {_NOW}
+    FROM chat_version AS version JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+    WHERE version.id = {row}.version_id;
+    """
+
+
+def _version_change(row: str, deleted: int) -> str:
+    return f"""
+    INSERT OR REPLACE INTO {_COLUMNS}
+    SELECT user_id, id, 'version', {row}.id, {deleted}, {_NOW} FROM chat_conversation WHERE id = {row}.conversation_id;
+    """
+
+
+_CONVERSATION_CHANGE = f"""
+    INSERT OR REPLACE INTO {_COLUMNS}
+    VALUES (new.user_id, new.id, 'conversation', new.id, new.deleted_at IS NOT NULL, {_NOW});
+"""
+
+TRIGGERS = (
+    [
+        f"""
+    CREATE TRIGGER chat_change_conversation_{event} AFTER {event.upper()} ON chat_conversation
+    WHEN {_ENABLED} BEGIN {_CONVERSATION_CHANGE} END
+    """
+        for event in ("insert", "update")
+    ]
+    + [
+        f"""
+    CREATE TRIGGER chat_change_conversation_delete AFTER DELETE ON chat_conversation WHEN {_ENABLED}
+    BEGIN
+        DELETE FROM chat_change WHERE conversation_id = old.id;
+        INSERT INTO {_COLUMNS} VALUES (old.user_id, old.id, 'conversation', old.id, 1, {_NOW});
+    END
+    """,
+    ]
+    + [
+        f"""
+    CREATE TRIGGER chat_change_{table}_{event} AFTER {event.upper()} ON chat_{table} WHEN {_ENABLED}
+    BEGIN {change(row, int(event == "delete"))} END
+    """
+        for table, change in (("version", _version_change), ("message", _message_change))
+        for event, row in (("insert", "new"), ("update", "new"), ("delete", "old"))
+    ]
+)
+
+DROP_TRIGGERS = [
+    f"DROP TRIGGER IF EXISTS chat_change_{table}_{event}"
+    for table in ("conversation", "version", "message")
+    for event in ("insert", "update", "delete")
+]
+
+# Every existing object, as of its last known modification
+BACKFILL = [
+    f"""
+    INSERT INTO {_COLUMNS}
+    SELECT user_id, id, 'conversation', id, deleted_at IS NOT NULL, modified_at FROM chat_conversation
+    """,
+    f"""
+    INSERT INTO {_COLUMNS}
+    SELECT conversation.user_id, conversation.id, 'version', version.id, 0, conversation.modified_at
+    FROM chat_version AS version JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+    """,
+    f"""
+    INSERT INTO {_COLUMNS}
+    SELECT conversation.user_id, conversation.id, 'message', message.id, 0, message.created_at
+    FROM chat_message AS message
+    JOIN chat_version AS version ON version.id = message.version_id
+    JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+    ORDER BY message.created_at
+    """,
+]
+
+
+def _sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == "sqlite":
+            for statement in statements:
+                schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0009_conversation_deleted_at_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Change",
+            fields=[
+                ("revision", models.BigAutoField(primary_key=True, serialize=False)),
+                ("conversation_id", models.UUIDField(db_index=True)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("conversation", "Conversation"), ("version", "Version"), ("message", "Message")],
+                        max_length=12,
+                    ),
+                ),
+                ("object_id", models.UUIDField(unique=True)),
+                ("deleted", models.BooleanField(default=False)),
+                ("changed_at", models.DateTimeField()),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["user", "revision"], name="chat_change_user_rev_idx")],
+            },
+        ),
+        migrations.RunPython(_sqlite(BACKFILL + TRIGGERS), _sqlite(DROP_TRIGGERS)),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.0.2 on 2026-10-20 00:15
+
+from django.db import migrations
+
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+_COLUMNS = "chat_change (user_id, conversation_id, kind, object_id, deleted, changed_at)"
+# The triggers are skipped while `chat.utils.sqlite.suspended_triggers()` holds a row in this table
+_ENABLED = "NOT EXISTS (SELECT 1 FROM chat_triggers_suspended)"
+
+
+def _triggers(owner_check: bool) -> list[str]:
+    """
+    The change log triggers of 0010. With `owner_check`, nothing is logged for rows whose user is already gone: when a
+    user is deleted, their conversations can go after them (`flush`) and the change would point at a missing user.
+    """
+    owner = "JOIN authentication_customuser AS owner ON owner.id = conversation.user_id" if owner_check else ""
+
+    def conversation_owner(row: str) -> str:
+        return f" AND EXISTS (SELECT 1 FROM authentication_customuser WHERE id = {row}.user_id)" if owner_check else ""
+
+    def message_change(row: str, deleted: int) -> str:
+        return f"""
+        INSERT OR REPLACE INTO {_COLUMNS}
+        SELECT conversation.user_id, conversation.id, 'message', {row}.id, {deleted}, {_NOW}
+        FROM chat_version AS version JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+        {owner}
+        WHERE version.id = {row}.version_id;
+        """
+
+    def version_change(row: str, deleted: int) -> str:
+        return f"""
+        INSERT OR REPLACE INTO {_COLUMNS}
+        SELECT conversation.user_id, conversation.id, 'version', {row}.id, {deleted}, {_NOW}
+        FROM chat_conversation AS conversation {owner}
+        WHERE conversation.id = {row}.conversation_id;
+        """
+
+    return (
+        [
+            f"""
+        CREATE TRIGGER chat_change_conversation_{event} AFTER {event.upper()} ON chat_conversation
+        WHEN {_ENABLED}{conversation_owner("new")} BEGIN
+            INSERT OR REPLACE INTO {_COLUMNS}
+            VALUES (new.user_id, new.id, 'conversation', new.id, new.deleted_at IS NOT NULL, {_NOW});
+        END
+        """
+            for event in ("insert", "update")
+        ]
+        + [
+            f"""
+        CREATE TRIGGER chat_change_conversation_delete AFTER DELETE ON chat_conversation
+        WHEN {_ENABLED}{conversation_owner("old")} BEGIN
+            DELETE FROM chat_change WHERE conversation_id = old.id;
+            INSERT INTO {_COLUMNS} VALUES (old.user_id, old.id, 'conversation', old.id, 1, {_NOW});
+        END
+        """,
+        ]
+        + [
+            f"""
+        CREATE TRIGGER chat_change_{table}_{event} AFTER {event.upper()} ON chat_{table} WHEN {_ENABLED}
+        BEGIN {change(row, int(event == "delete"))} END
+        """
+            for table, change in (("version", version_change), ("message", message_change))
+            for event, row in (("insert", "new"), ("update", "new"), ("delete", "old"))
+        ]
+    )
+
+
+# Tombstones logged while the user's conversations are deleted go with the user. Not suspendable, it keeps the foreign
+# key of the log intact
+USER_DELETE = """
+CREATE TRIGGER chat_change_user_delete AFTER DELETE ON authentication_customuser BEGIN
+    DELETE FROM chat_change WHERE user_id = old.id;
+END
+"""
+
+DROP_TRIGGERS = [
+    f"DROP TRIGGER IF EXISTS chat_change_{table}_{event}"
+    for table in ("conversation", "version", "message")
+    for event in ("insert", "update", "delete")
+] + ["DROP TRIGGER IF EXISTS chat_change_user_delete"]
+
+
+def _sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == "sqlite":
+            for statement in statements:
+                schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("authentication", "0001_initial"),
+        ("chat", "0010_change_log"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _sqlite(DROP_TRIGGERS + _triggers(owner_check=True) + [USER_DELETE]),
+            _sqlite(DROP_TRIGGERS + _triggers(owner_check=False)),
+        ),
+    ]
@@ -0,0 +1,155 @@
+# Generated by Django 5.0.2 on 2026-10-20 00:50
+
+from django.db import migrations, models
+
+# Adding the columns rebuilds chat_conversation, which drops its own triggers, and renaming the rebuilt table fails
+# while triggers of other tables read it: they are all set aside for the rebuild, as they are in the database
+_set_aside: list[str] = []
+
+
+def _set_aside_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+            "AND (tbl_name = 'chat_conversation' OR sql LIKE '%chat_conversation%')"
+        )
+        triggers = cursor.fetchall()
+    for name, sql in triggers:
+        schema_editor.execute(f"DROP TRIGGER {name}")
+        _set_aside.append(sql)
+
+
+def _restore_triggers(apps, schema_editor):
+    while _set_aside:
+        schema_editor.execute(_set_aside.pop(0))
+
+
+# The triggers are skipped while `chat.utils.sqlite.suspended_triggers()` holds a row in this table
+_ENABLED = "NOT EXISTS (SELECT 1 FROM chat_triggers_suspended)"
+_LAST_MESSAGE = "FROM chat_message WHERE version_id = {version} ORDER BY position DESC LIMIT 1"
+# Compressed bodies have no preview until 0014
+_TEXT = "CASE WHEN typeof(content) = 'text' THEN content END"
+_PREVIEW = f"(SELECT substr({_TEXT}, 1, 120) FROM chat_messagebody WHERE hash = {{body}})"
+_IS_LAST = "NOT EXISTS (SELECT 1 FROM chat_message WHERE version_id = {row}.version_id AND position > {row}.position)"
+
+
+def _last_message(version: str) -> str:
+    """Assignments of the last message fields from the messages of `version`."""
+    last = _LAST_MESSAGE.format(version=version)
+    return (
+        f"last_message_at = (SELECT created_at {last}), "
+        f"last_message_preview = COALESCE({_PREVIEW.format(body=f'(SELECT body_id {last})')}, '')"
+    )
+
+
+COUNTER_TRIGGERS = [
+    f"""
+    CREATE TRIGGER chat_counters_version_insert AFTER INSERT ON chat_version WHEN {_ENABLED} BEGIN
+        UPDATE chat_conversation SET version_count = version_count + 1 WHERE id = new.conversation_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER chat_counters_version_delete AFTER DELETE ON chat_version WHEN {_ENABLED} BEGIN
+        UPDATE chat_conversation SET version_count = max(version_count - 1, 0) WHERE id = old.conversation_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER chat_counters_message_insert AFTER INSERT ON chat_message WHEN {_ENABLED} BEGIN
+        UPDATE chat_conversation SET
+            message_count = message_count + 1,
+            last_message_at = CASE WHEN {_IS_LAST.format(row="new")} THEN new.created_at ELSE last_message_at END,
+            last_message_preview = CASE
+                WHEN {_IS_LAST.format(row="new")} THEN COALESCE({_PREVIEW.format(body="new.body_id")}, '')
+                ELSE last_message_preview
+            END
+        WHERE active_version_id = new.version_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER chat_counters_message_update AFTER UPDATE OF body_id ON chat_message
+    WHEN {_ENABLED} AND old.body_id != new.body_id AND {_IS_LAST.format(row="new")} BEGIN
+        UPDATE chat_conversation SET last_message_preview = COALESCE({_PREVIEW.format(body="new.body_id")}, '')
+        WHERE active_version_id = new.version_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER chat_counters_message_delete AFTER DELETE ON chat_message WHEN {_ENABLED} BEGIN
+        UPDATE chat_conversation SET message_count = max(message_count - 1, 0), {_last_message("old.version_id")}
+        WHERE active_version_id = old.version_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER chat_counters_conversation_switch AFTER UPDATE OF active_version_id ON chat_conversation
+    WHEN {_ENABLED} AND old.active_version_id IS NOT new.active_version_id BEGIN
+        UPDATE chat_conversation SET
+            message_count = (SELECT COUNT(*) FROM chat_message WHERE version_id = new.active_version_id),
+            {_last_message("new.active_version_id")}
+        WHERE id = new.id;
+    END
+    """,
+]
+DROP_COUNTER_TRIGGERS = [
+    f"DROP TRIGGER IF EXISTS chat_counters_{name}"
+    for name in (
+        "version_insert",
+        "version_delete",
+        "message_insert",
+        "message_update",
+        "message_delete",
+        "conversation_switch",
+    )
+]
+
+BACKFILL = [
+    f"""
+    UPDATE chat_conversation AS conversation SET
+        version_count = (SELECT COUNT(*) FROM chat_version WHERE conversation_id = conversation.id),
+        message_count = (SELECT COUNT(*) FROM chat_message WHERE version_id = conversation.active_version_id),
+        {_last_message("conversation.active_version_id")}
+    """
+]
+
+
+def _sqlite(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == "sqlite":
+            for statement in statements:
+                schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0011_change_log_user_deletes"),
+    ]
+
+    operations = [
+        migrations.RunPython(_set_aside_triggers, _restore_triggers),
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="last_message_preview",
+            field=models.CharField(blank=True, db_default="", default="", editable=False, max_length=120),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="message_count",
+            field=models.PositiveIntegerField(db_default=0, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="version_count",
+            field=models.PositiveIntegerField(
+                db_default=0, default=0, editable=False, verbose_name="number of versions"
+            ),
+        ),
+        migrations.RunPython(_restore_triggers, _set_aside_triggers),
+        migrations.RunPython(_sqlite(COUNTER_TRIGGERS + BACKFILL), _sqlite(DROP_COUNTER_TRIGGERS)),
+    ]
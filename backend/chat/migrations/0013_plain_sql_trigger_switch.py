@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-20 09:10
+
+from django.db import migrations
+
+# The triggers of 0008 and 0010 to 0012 used to call `chat_triggers_enabled()`, a function only the app registers on its
+# connections, and now read the `chat_triggers_suspended` table. This rewrites them in databases migrated before
+_OLD = "chat_triggers_enabled()"
+_NEW = "NOT EXISTS (SELECT 1 FROM chat_triggers_suspended)"
+
+
+def _rewrite(old: str, new: str):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        schema_editor.execute("CREATE TABLE IF NOT EXISTS chat_triggers_suspended (id INTEGER PRIMARY KEY)")
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND sql LIKE %s", [f"%{old}%"])
+            triggers = cursor.fetchall()
+        for name, sql in triggers:
+            schema_editor.execute(f"DROP TRIGGER {name}")
+            schema_editor.execute(sql.replace(old, new))
+
+    return run
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0012_conversation_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(_rewrite(_OLD, _NEW), migrations.RunPython.noop),
+    ]
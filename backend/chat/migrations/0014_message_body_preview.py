@@ -0,0 +1,83 @@
+# Generated by Django 5.0.2 on 2026-10-20 10:05
+
+from django.db import migrations, models
+
+import chat.utils.compression
+
+BATCH_SIZE = 5_000
+
+# The search triggers read plain bodies only, the counter triggers the previews stored with the bodies. 0007, 0008 and
+# 0012 used to call `chat_body_text()` instead, a function only the app registers on its connections, and databases
+# migrated before still have such triggers
+_TEXT = "CASE WHEN typeof(content) = 'text' THEN content END"
+FORWARD = [
+    ("substr(chat_body_text(content), 1, 120)", "preview"),
+    (f"substr({_TEXT}, 1, 120)", "preview"),
+    ("chat_body_text(content)", _TEXT),
+]
+BACKWARD = [("SELECT preview FROM", f"SELECT substr({_TEXT}, 1, 120) FROM")]
+
+_PREVIEW = """COALESCE((
+    SELECT preview FROM chat_messagebody WHERE hash = (
+        SELECT body_id FROM chat_message WHERE version_id = conversation.active_version_id ORDER BY position DESC LIMIT 1
+    )
+), '')"""
+REFRESH_PREVIEWS = f"""
+UPDATE chat_conversation AS conversation SET last_message_preview = {_PREVIEW}
+WHERE last_message_preview != {_PREVIEW}
+"""
+
+
+def fill_previews(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute("SELECT hash, content FROM chat_messagebody WHERE preview IS NULL LIMIT %s", [BATCH_SIZE])
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                "UPDATE chat_messagebody SET preview = %s WHERE hash = %s",
+                [(chat.utils.compression.decompress(content)[:120], hash) for hash, content in rows],
+            )
+
+
+def _rewrite_triggers(replacements: list[tuple[str, str]]):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")
+            triggers = cursor.fetchall()
+        for name, sql in triggers:
+            rewritten = sql
+            for old, new in replacements:
+                rewritten = rewritten.replace(old, new)
+            if rewritten != sql:
+                schema_editor.execute(f"DROP TRIGGER {name}")
+                schema_editor.execute(rewritten)
+
+    return run
+
+
+def refresh_previews(apps, schema_editor):
+    """The last messages with a compressed body had no preview before."""
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(REFRESH_PREVIEWS)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0013_plain_sql_trigger_switch"),
+    ]
+
+    operations = [
+        # Nullable, so SQLite adds the column without rebuilding the table
+        migrations.AddField(
+            model_name="messagebody",
+            name="preview",
+            field=models.CharField(editable=False, max_length=120, null=True),
+        ),
+        migrations.RunPython(fill_previews, migrations.RunPython.noop),
+        migrations.RunPython(_rewrite_triggers(FORWARD), _rewrite_triggers(BACKWARD)),
+        migrations.RunPython(refresh_previews, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,18 @@
+import hashlib
 import uuid
 
-from django.db import models
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import Max
+from django.db.models.functions import Coalesce
 
 from authentication.models import CustomUser
+from chat.utils.compression import CompressedTextField
+
+DEFAULT_CONVERSATION_TITLE = "Mock title"
+LAST_MESSAGE_PREVIEW_LENGTH = 120
+POSITION_RETRIES = 3
 
 
 class Role(models.Model):
@@ -14,22 +24,50 @@ class Role(models.Model):
 
 class Conversation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    title = models.CharField(max_length=100, blank=False, null=False, default="Mock title")
+    title = models.CharField(max_length=100, blank=False, null=False, default=DEFAULT_CONVERSATION_TITLE)
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
     active_version = models.ForeignKey(
         "Version", null=True, blank=True, on_delete=models.CASCADE, related_name="current_version_conversations"
     )
     deleted_at = models.DateTimeField(null=True, blank=True)
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    # Covered by the (user, deleted_at, -modified_at) index below
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_index=False)
+    # Denormalized for conversation lists and maintained by triggers, see `chat/utils/counters.py`. The message
+    # fields are those of the active version
+    version_count = models.PositiveIntegerField(
+        default=0, db_default=0, editable=False, verbose_name="number of versions"
+    )
+    message_count = models.PositiveIntegerField(default=0, db_default=0, editable=False)
+    last_message_at = models.DateTimeField(null=True, blank=True, editable=False)
+    last_message_preview = models.CharField(
+        max_length=LAST_MESSAGE_PREVIEW_LENGTH, blank=True, default="", db_default="", editable=False
+    )
+
+    COUNTER_FIELDS = ("version_count", "message_count", "last_message_at", "last_message_preview")
+
+    class Meta:
+        indexes = [
+            # The conversation list: a user's non-deleted conversations, most recently modified first
+            models.Index(fields=["user", "deleted_at", "-modified_at"], name="chat_conv_user_deleted_mod_idx"),
+            # The retention purge: soft-deleted conversations, oldest first
+            models.Index(
+                fields=["deleted_at"], name="chat_conv_deleted_at_idx", condition=models.Q(deleted_at__isnull=False)
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
-    def version_count(self):
-        return self.versions.count()
-
-    version_count.short_description = "Number of versions"
+    def save(self, *args, **kwargs):
+        # The counters loaded with the instance may be stale by now, only the database writes them
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
 
 class Version(models.Model):
@@ -40,6 +78,23 @@ class Version(models.Model):
         "Message", null=True, blank=True, on_delete=models.SET_NULL, related_name="root_message_versions"
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_version_id = instance.__dict__.get("parent_version_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                VersionAncestry.objects.link(self)
+            # Instances not loaded from the database have an unknown previous parent, they are re-linked to be safe
+            elif self.parent_version_id != getattr(self, "_loaded_parent_version_id", object()):
+                VersionAncestry.objects.move(self)
+        self._loaded_parent_version_id = self.parent_version_id
+
     def __str__(self):
         if self.root_message:
             return f"Version of `{self.conversation.title}` created at `{self.root_message.created_at}`"
@@ -47,19 +102,231 @@ class Version(models.Model):
             return f"Version of `{self.conversation.title}` with no root message yet"
 
 
+class VersionAncestryManager(models.Manager):
+    def rows_for(self, versions: list["Version"]) -> list["VersionAncestry"]:
+        """Closure rows of unsaved versions, for bulk writers; parents must come before their children."""
+        ancestors: dict = {}
+        rows = []
+        for version in versions:
+            chain = [(version.pk, 0)]
+            chain += [(pk, depth + 1) for pk, depth in ancestors.get(version.parent_version_id, [])]
+            ancestors[version.pk] = chain
+            rows += [VersionAncestry(ancestor_id=pk, descendant_id=version.pk, depth=depth) for pk, depth in chain]
+        return rows
+
+    def link(self, version: "Version") -> None:
+        """Adds a new version below the ancestors of its parent."""
+        rows = [VersionAncestry(ancestor_id=version.pk, descendant_id=version.pk, depth=0)]
+        if version.parent_version_id is not None:
+            above = self.filter(descendant_id=version.parent_version_id).values_list("ancestor_id", "depth")
+            rows += [VersionAncestry(ancestor_id=pk, descendant_id=version.pk, depth=depth + 1) for pk, depth in above]
+        self.bulk_create(rows)
+
+    def detach(self, version: "Version") -> None:
+        """
+        Cuts the subtree below a version about to be deleted off from its ancestors: the children become roots, as
+        `parent_version` is `SET_NULL`. The rows of the version itself go with it.
+        """
+        above = self.filter(descendant_id=version.pk).values("ancestor_id")
+        below = self.filter(ancestor_id=version.pk, depth__gt=0).values("descendant_id")
+        self.filter(ancestor_id__in=above, descendant_id__in=below).delete()
+
+    def move(self, version: "Version") -> None:
+        """Re-attaches the subtree of a version whose parent changed under the ancestors of the new parent."""
+        subtree = dict(self.filter(ancestor_id=version.pk).values_list("descendant_id", "depth"))
+        if version.parent_version_id in subtree:
+            raise ValidationError("A version cannot be moved below one of its descendants")
+        self.filter(descendant_id__in=subtree).exclude(ancestor_id__in=subtree).delete()
+        if version.parent_version_id is None:
+            return
+        above = self.filter(descendant_id=version.parent_version_id).values_list("ancestor_id", "depth")
+        self.bulk_create(
+            VersionAncestry(ancestor_id=pk, descendant_id=descendant, depth=depth + below + 1)
+            for pk, depth in above
+            for descendant, below in subtree.items()
+        )
+
+
+def detach_deleted_version(sender, instance: Version, using: str, **kwargs) -> None:
+    """`pre_delete` receiver of `Version`, see `ChatConfig.ready`; set-based deletes do the same in one statement."""
+    VersionAncestry.objects.db_manager(using).detach(instance)
+
+
+class VersionAncestry(models.Model):
+    """
+    Closure table of the version tree: one row for every version and each of its ancestors, including the version
+    itself at depth 0, so ancestor and subtree questions are a single indexed lookup (see `chat.utils.ancestry`).
+    """
+
+    # Covered by the (ancestor, descendant) unique constraint below
+    ancestor = models.ForeignKey(Version, related_name="descendant_links", on_delete=models.CASCADE, db_index=False)
+    # Covered by the (descendant, depth) index below
+    descendant = models.ForeignKey(Version, related_name="ancestor_links", on_delete=models.CASCADE, db_index=False)
+    depth = models.PositiveIntegerField()
+
+    objects = VersionAncestryManager()
+
+    class Meta:
+        verbose_name_plural = "version ancestries"
+        constraints = [
+            models.UniqueConstraint(fields=["ancestor", "descendant"], name="chat_ancestry_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["descendant", "depth"], name="chat_ancestry_desc_depth_idx"),
+        ]
+
+
+class MessageBody(models.Model):
+    """
+    A message text, stored once however many messages share it and keyed by its SHA-256. `ref_count` is the number
+    of messages pointing at it. Triggers on `chat_message` maintain it on every insert, update and delete, bulk ones
+    included, and drop bodies that are no longer referenced (see `chat/migrations/0006_message_bodies.py`); they are
+    SQLite only, see `chat.checks`. Bodies a failed write left at 0 go with `chat.utils.gc.collect_orphan_bodies`.
+    """
+
+    hash = models.CharField(max_length=64, primary_key=True)
+    # Large bodies are stored compressed, see `chat/utils/compression.py`
+    content = CompressedTextField()
+    # The start of the text, stored plain so that SQL (the conversation counters) never has to decompress
+    preview = models.CharField(max_length=LAST_MESSAGE_PREVIEW_LENGTH, null=True, editable=False)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    @staticmethod
+    def hash_of(content: str) -> str:
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    @staticmethod
+    def preview_of(content: str) -> str:
+        return content[:LAST_MESSAGE_PREVIEW_LENGTH]
+
+    @classmethod
+    def for_content(cls, content: str) -> "MessageBody":
+        return cls(hash=cls.hash_of(content), content=content, preview=cls.preview_of(content))
+
+    @staticmethod
+    def may_be_compressed(content: str) -> bool:
+        """False when `content` is stored plain for sure, see `chat.utils.compression.compress`."""
+        if settings.CHAT_BODY_COMPRESSION_CODEC == "none":
+            return False
+        return len(content.encode()) >= settings.CHAT_BODY_COMPRESSION_THRESHOLD
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.ref_count} references)"
+
+
+class MessageQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        # Bodies set through `content` are unsaved, they go first; bodies that already exist are left as they are
+        objs = list(objs)
+        bodies = {message.body_id: message.body for message in objs if Message.body.is_cached(message)}
+        # In the transaction of the messages, so no body is left unreferenced or deleted in between
+        with transaction.atomic(using=self.db):
+            MessageBody.objects.using(self.db).bulk_create(bodies.values(), ignore_conflicts=True)
+            objs = super().bulk_create(objs, *args, **kwargs)
+            _index_compressed(objs)
+        return objs
+
+
+class MessageManager(models.Manager.from_queryset(MessageQuerySet)):
+    def get_queryset(self):
+        # The content lives in the body, which is read whenever a message is
+        return super().get_queryset().select_related("body")
+
+
 class Message(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    content = models.TextField(blank=False, null=False)
+    body = models.ForeignKey(MessageBody, related_name="messages", on_delete=models.PROTECT)
     role = models.ForeignKey(Role, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
-    version = models.ForeignKey("Version", related_name="messages", on_delete=models.CASCADE)
+    # Covered by the (version, position) unique constraint below
+    version = models.ForeignKey("Version", related_name="messages", on_delete=models.CASCADE, db_index=False)
+    # 0-based index of the message within its version, dense and assigned on insert
+    position = models.PositiveIntegerField(editable=False)
+
+    objects = MessageManager()
 
     class Meta:
-        ordering = ["created_at"]
+        ordering = ["position"]
+        constraints = [
+            # Also the index for a version's messages in order, prefixes before a branch point and tails
+            models.UniqueConstraint(fields=["version", "position"], name="chat_msg_version_position_uniq"),
+        ]
+
+    @property
+    def content(self) -> str:
+        return self.body.content
+
+    @content.setter
+    def content(self, value: str) -> None:
+        self.body = MessageBody.for_content(value)
 
     def save(self, *args, **kwargs):
-        self.version.conversation.save()
-        super().save(*args, **kwargs)
+        # The body is inserted with `ref_count` 0 and only referenced by the message insert: outside of one
+        # transaction, a concurrent delete of its last message could drop it in between, and a failed insert would
+        # leave it unreferenced
+        with transaction.atomic():
+            self.version.conversation.save()
+            if Message.body.is_cached(self) and self.body._state.adding:
+                MessageBody.objects.bulk_create([self.body], ignore_conflicts=True)
+            if self.position is not None or not self._state.adding:
+                super().save(*args, **kwargs)
+            else:
+                self._insert_at_next_position(*args, **kwargs)
+            _index_compressed([self])
+
+    def _insert_at_next_position(self, *args, **kwargs):
+        # Concurrent inserts into the same version can pick the same position, the loser retries with the next one
+        for attempt in range(POSITION_RETRIES):
+            self.position = self.version.messages.aggregate(next=Coalesce(Max("position") + 1, 0))["next"]
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if attempt == POSITION_RETRIES - 1:
+                    raise
 
     def __str__(self):
         return f"{self.role}: {self.content[:20]}..."
+
+
+def _index_compressed(messages: list[Message]) -> None:
+    """The search triggers skip compressed bodies, their text is indexed here (see `chat.search`)."""
+    # chat.search imports the models
+    from chat.search import get_backend
+
+    ids = [
+        message.pk
+        for message in messages
+        if not Message.body.is_cached(message) or MessageBody.may_be_compressed(message.body.content)
+    ]
+    if ids:
+        get_backend().index_compressed(ids)
+
+
+class Change(models.Model):
+    """
+    The sync change log: the latest change of every conversation, version and message, keyed by a revision that only
+    ever grows. Triggers on the three tables keep it up to date and replace the previous row of an object, so the log
+    holds one row per object, deletions included as tombstones (see `chat/utils/changes.py`).
+    """
+
+    KINDS = [("conversation", "Conversation"), ("version", "Version"), ("message", "Message")]
+
+    revision = models.BigAutoField(primary_key=True)
+    # Covered by the (user, revision) index below
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_index=False)
+    # Not foreign keys: the rows outlive the objects
+    conversation_id = models.UUIDField(db_index=True)
+    kind = models.CharField(max_length=12, choices=KINDS)
+    object_id = models.UUIDField(unique=True)
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "revision"], name="chat_change_user_rev_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.revision}: {self.kind} {self.object_id}{' deleted' if self.deleted else ''}"
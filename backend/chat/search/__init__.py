@@ -0,0 +1,20 @@
+"""
+Full-text search over message content.
+
+The backend is chosen with the `CHAT_SEARCH_BACKEND` setting (a dotted path to a `SearchBackend` subclass). Searches
+only return messages of the user's non-deleted conversations that belong to the conversation's active version, best
+match first.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from chat.search.backends import ContainsSearchBackend, SearchBackend, SearchHit, SQLiteFTS5Backend
+
+__all__ = ["ContainsSearchBackend", "SQLiteFTS5Backend", "SearchBackend", "SearchHit", "get_backend"]
+
+
+@lru_cache(maxsize=None)
+def get_backend() -> SearchBackend:
+    return import_string(settings.CHAT_SEARCH_BACKEND)()
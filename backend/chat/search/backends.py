@@ -0,0 +1,246 @@
+import html
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+from uuid import UUID
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import F
+
+from chat.models import Message
+from chat.utils.bulk import parameter_list
+from chat.utils.compression import decompress
+
+__all__ = ["ContainsSearchBackend", "SQLiteFTS5Backend", "SearchBackend", "SearchHit"]
+
+# Private-use characters mark the matches inside snippets until the text has been escaped
+_MARK_START, _MARK_END = "\ue000", "\ue001"
+
+
+@dataclass
+class SearchHit:
+    message_id: UUID
+    version_id: UUID
+    conversation_id: UUID
+    conversation_title: str
+    role: str
+    created_at: datetime
+    snippet: str  # HTML-escaped, matches wrapped in <mark>
+    rank: float  # lower is better
+
+
+class SearchBackend:
+    """
+    Keeping the index in sync with `chat_message` on insert, update and delete is up to each backend, so that it also
+    covers `bulk_create` and set-based deletes.
+    """
+
+    def search(self, user, query: str, limit: int) -> list[SearchHit]:
+        raise NotImplementedError
+
+    def rebuild(self, batch_size: int = 50_000, progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """Re-indexes every message and returns how many there are; `progress` is called with (done, total)."""
+        return 0
+
+    def index(self, message_ids: list[UUID]) -> None:
+        """Indexes messages inserted inside `chat.utils.sqlite.suspended_triggers()`."""
+
+    def index_compressed(self, message_ids: list[UUID]) -> None:
+        """Adds the text of compressed bodies to the entries the triggers wrote for these messages, if any."""
+
+    def unindex(self, message_ids: list[UUID], using: str = DEFAULT_DB_ALIAS) -> None:
+        """Drops messages about to be deleted inside `chat.utils.sqlite.suspended_triggers()`."""
+
+
+class ContainsSearchBackend(SearchBackend):
+    """
+    Unindexed substring matching, for databases without a full-text index. Ranks by recency.
+
+    Bodies are matched in Python, after the field has decompressed them, so it needs no SQL function and works on any
+    database; it reads the user's messages newest first until `limit` match, so it slows down with their history.
+    """
+
+    chunk_size = 500
+
+    def search(self, user, query: str, limit: int) -> list[SearchHit]:
+        terms = _terms(query)
+        if not terms:
+            return []
+
+        messages = Message.objects.filter(
+            version__conversation__user=user,
+            version__conversation__deleted_at__isnull=True,
+            version__conversation__active_version=F("version"),
+        )
+        messages = messages.select_related("role", "version__conversation").order_by("-created_at")
+        lowered = [term.lower() for term in terms]
+        hits = []
+        for message in messages.iterator(chunk_size=self.chunk_size):
+            content = message.content.lower()
+            if all(term in content for term in lowered):
+                hits.append(_hit(message, _contains_snippet(message.content, terms), float(len(hits))))
+                if len(hits) == limit:
+                    break
+        return hits
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    An FTS5 table over message content, ranked with bm25.
+
+    `chat_message_search` maps every message to the rowid of its FTS row, and triggers on `chat_message` keep both
+    tables in sync (the migrations own the schema, see `chat/migrations/0005_message_search.py` and the later ones).
+    The triggers only read plain bodies, SQL cannot decompress: the text of compressed ones is added from Python, by
+    `index_compressed` after the ORM writes a message and by `index` and `rebuild`. Every FTS row also holds a
+    `u<user id>` owner token, so a search only intersects the posting lists of the user's own messages.
+    """
+
+    chunk_size = 500
+
+    def search(self, user, query: str, limit: int) -> list[SearchHit]:
+        terms = _terms(query)
+        if not terms:
+            return []
+
+        phrases = [f'content : "{term}"' for term in terms]
+        phrases[-1] += "*"  # the last word may still be being typed
+        match = f'owner : "u{user.pk}" AND ' + " AND ".join(phrases)
+        with connection.cursor() as cursor:
+            cursor.execute(SEARCH, [_MARK_START, _MARK_END, match, user.pk, limit])
+            rows = cursor.fetchall()
+        messages = Message.objects.select_related("role", "version__conversation").in_bulk([UUID(r[0]) for r in rows])
+        hits = []
+        for message_id, snippet, rank in rows:
+            message = messages[UUID(message_id)]
+            hits.append(_hit(message, _highlight(snippet), rank))
+        return hits
+
+    def rebuild(self, batch_size: int = 50_000, progress: Optional[Callable[[int, int], None]] = None) -> int:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("DELETE FROM chat_message_fts")
+            cursor.execute("DELETE FROM chat_message_search")
+            cursor.execute("INSERT INTO chat_message_search (message_id) SELECT id FROM chat_message")
+            cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM chat_message_search")
+            total = cursor.fetchone()[0]
+            for start in range(0, total, batch_size):
+                _index_batch(cursor, start, start + batch_size)
+                if progress is not None:
+                    progress(min(start + batch_size, total), total)
+            cursor.execute("INSERT INTO chat_message_fts (chat_message_fts) VALUES ('optimize')")
+        return total
+
+    def index(self, message_ids: list[UUID]) -> None:
+        pk = Message._meta.pk
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM chat_message_search")
+            start = cursor.fetchone()[0]
+            cursor.executemany(
+                "INSERT INTO chat_message_search (message_id) VALUES (%s)",
+                [(pk.get_db_prep_value(message_id, connection),) for message_id in message_ids],
+            )
+            _index_batch(cursor, start, start + len(message_ids))
+
+    def index_compressed(self, message_ids: list[UUID]) -> None:
+        pk = Message._meta.pk
+        ids = [pk.get_db_prep_value(message_id, connection) for message_id in message_ids]
+        with connection.cursor() as cursor:
+            for start in range(0, len(ids), self.chunk_size):
+                end = start + self.chunk_size
+                chunk = ids[start:end]
+                cursor.execute(COMPRESSED_ENTRIES.format(ids=parameter_list(chunk)), chunk)
+                rows = cursor.fetchall()
+                cursor.executemany(
+                    "UPDATE chat_message_fts SET content = %s WHERE rowid = %s",
+                    [(decompress(content), rowid) for rowid, content in rows],
+                )
+
+    def unindex(self, message_ids: list[UUID], using: str = DEFAULT_DB_ALIAS) -> None:
+        connection = connections[using]
+        pk = Message._meta.pk
+        params = [(pk.get_db_prep_value(message_id, connection),) for message_id in message_ids]
+        with connection.cursor() as cursor:
+            cursor.executemany(UNINDEX, params)
+            cursor.executemany("DELETE FROM chat_message_search WHERE message_id = %s", params)
+
+
+def _index_batch(cursor, start: int, end: int) -> None:
+    """Writes the FTS rows of the `chat_message_search` rowids in (start, end]."""
+    # One statement, much cheaper than a row at a time for FTS5; compressed bodies are decompressed in Python
+    cursor.execute(REBUILD_BATCH, [start, end])
+    cursor.execute(REBUILD_BATCH_COMPRESSED, [start, end])
+    rows = cursor.fetchall()
+    cursor.executemany(
+        "INSERT INTO chat_message_fts (rowid, content, owner) VALUES (%s, %s, %s)",
+        [(rowid, decompress(content), owner) for rowid, content, owner in rows],
+    )
+
+
+def _hit(message: Message, snippet: str, rank: float) -> SearchHit:
+    return SearchHit(
+        message_id=message.id,
+        version_id=message.version_id,
+        conversation_id=message.version.conversation_id,
+        conversation_title=message.version.conversation.title,
+        role=message.role.name,
+        created_at=message.created_at,
+        snippet=snippet,
+        rank=rank,
+    )
+
+
+def _terms(query: str) -> list[str]:
+    return re.findall(r"\w+", query)[:16]
+
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def _contains_snippet(content: str, terms: list[str], width: int = 60) -> str:
+    first = min((content.lower().find(term.lower()) for term in terms), key=lambda idx: (idx < 0, idx))
+    start = max(first - width // 2, 0)
+    end = start + width
+    snippet = content[start:end]
+    snippet = re.sub(
+        "|".join(re.escape(term) for term in terms), lambda m: f"{_MARK_START}{m[0]}{_MARK_END}", snippet, flags=re.I
+    )
+    return ("…" if start else "") + _highlight(snippet) + ("…" if end < len(content) else "")
+
+
+_BATCH = """
+SELECT search.rowid, body.content, 'u' || conversation.user_id
+FROM chat_message_search AS search
+JOIN chat_message AS message ON message.id = search.message_id
+JOIN chat_messagebody AS body ON body.hash = message.body_id
+JOIN chat_version AS version ON version.id = message.version_id
+JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+WHERE search.rowid > %s AND search.rowid <= %s AND typeof(body.content) = '{storage}'
+"""
+REBUILD_BATCH = "INSERT INTO chat_message_fts (rowid, content, owner)" + _BATCH.format(storage="text")
+REBUILD_BATCH_COMPRESSED = _BATCH.format(storage="blob")
+
+COMPRESSED_ENTRIES = """
+SELECT search.rowid, body.content
+FROM chat_message_search AS search
+JOIN chat_message AS message ON message.id = search.message_id
+JOIN chat_messagebody AS body ON body.hash = message.body_id
+WHERE message.id IN ({ids}) AND typeof(body.content) = 'blob'
+"""
+
+UNINDEX = "DELETE FROM chat_message_fts WHERE rowid = (SELECT rowid FROM chat_message_search WHERE message_id = %s)"
+
+SEARCH = """
+SELECT message.id, snippet(chat_message_fts, 0, %s, %s, '…', 16), bm25(chat_message_fts, 1.0, 0.0) AS rank
+FROM chat_message_fts
+JOIN chat_message_search AS search ON search.rowid = chat_message_fts.rowid
+JOIN chat_message AS message ON message.id = search.message_id
+JOIN chat_version AS version ON version.id = message.version_id
+JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id
+WHERE chat_message_fts MATCH %s
+  AND conversation.user_id = %s
+  AND conversation.deleted_at IS NULL
+  AND conversation.active_version_id = version.id
+ORDER BY rank
+LIMIT %s
+"""
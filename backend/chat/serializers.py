@@ -1,7 +1,12 @@
+from typing import Optional
+
 from django.core.exceptions import ValidationError
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 from rest_framework import serializers
 
+from backend.profiling import timed
 from chat.models import Conversation, Message, Role, Version
 
 
@@ -14,12 +19,32 @@ class TitleSerializer(serializers.Serializer):
     title = serializers.CharField(max_length=100, required=True)
 
 
+class TimedSerializerMixin:
+    """Reports the time spent serializing to the request's `serializer` timing span."""
+
+    def to_representation(self, instance):
+        with timed("serializer"):
+            return super().to_representation(instance)
+
+
+class SearchHitSerializer(serializers.Serializer):
+    message_id = serializers.UUIDField()
+    version_id = serializers.UUIDField()
+    conversation_id = serializers.UUIDField()
+    conversation_title = serializers.CharField()
+    role = serializers.CharField()
+    created_at = serializers.DateTimeField()
+    snippet = serializers.CharField()
+    rank = serializers.FloatField()
+
+
 class VersionTimeIdSerializer(serializers.Serializer):
     id = serializers.UUIDField()
     created_at = serializers.DateTimeField()
 
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    content = serializers.CharField()
     role = serializers.SlugRelatedField(slug_field="name", queryset=Role.objects.all())
 
     class Meta:
@@ -29,8 +54,9 @@ class MessageSerializer(serializers.ModelSerializer):
             "content",
             "role",  # required
             "created_at",  # DB, read-only
+            "position",  # DB, read-only
         ]
-        read_only_fields = ["id", "created_at", "version"]
+        read_only_fields = ["id", "created_at", "position", "version"]
 
     def create(self, validated_data):
         message = Message.objects.create(**validated_data)
@@ -42,11 +68,12 @@ class MessageSerializer(serializers.ModelSerializer):
         return representation
 
 
-class VersionSerializer(serializers.ModelSerializer):
+class VersionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     messages = MessageSerializer(many=True)
     active = serializers.SerializerMethodField()
     conversation_id = serializers.UUIDField(source="conversation.id")
     created_at = serializers.SerializerMethodField()
+    root_position = serializers.SerializerMethodField()
 
     class Meta:
         model = Version
@@ -54,6 +81,7 @@ class VersionSerializer(serializers.ModelSerializer):
             "id",
             "conversation_id",  # DB
             "root_message",
+            "root_position",  # read-only, where the version branches off its parent
             "messages",
             "active",
             "created_at",  # DB, read-only
@@ -61,9 +89,29 @@ class VersionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id", "conversation"]
 
+    @staticmethod
+    def setup_eager_loading(versions, last_messages: Optional[int] = None):
+        """
+        Prefetches everything the serializer reads, so serializing many versions costs a fixed number of queries. With
+        `last_messages`, every version only gets its last `last_messages` messages.
+        """
+        messages = Message.objects.select_related("role")
+        if last_messages is not None:
+            from_end = Window(RowNumber(), partition_by=F("version_id"), order_by=F("position").desc())
+            messages = messages.alias(from_end=from_end).filter(from_end__lte=last_messages)
+        messages = Prefetch("messages", queryset=messages)
+        if isinstance(versions, list):
+            prefetch_related_objects(versions, "conversation", "root_message", messages)
+            return versions
+        return versions.select_related("conversation", "root_message").prefetch_related(messages)
+
     @staticmethod
     def get_active(obj):
-        return obj == obj.conversation.active_version
+        return obj.pk == obj.conversation.active_version_id
+
+    @staticmethod
+    def get_root_position(obj):
+        return None if obj.root_message is None else obj.root_message.position
 
     @staticmethod
     def get_created_at(obj):
@@ -108,7 +156,7 @@ class VersionSerializer(serializers.ModelSerializer):
         return instance
 
 
-class ConversationSerializer(serializers.ModelSerializer):
+class ConversationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     versions = VersionSerializer(many=True)
 
     class Meta:
@@ -121,6 +169,11 @@ class ConversationSerializer(serializers.ModelSerializer):
             "modified_at",  # DB, read-only
         ]
 
+    @staticmethod
+    def setup_eager_loading(queryset, last_messages: Optional[int] = None):
+        versions = VersionSerializer.setup_eager_loading(Version.objects.all(), last_messages)
+        return queryset.prefetch_related(Prefetch("versions", queryset=versions))
+
     def create(self, validated_data):
         versions_data = validated_data.pop("versions", [])
         conversation = Conversation.objects.create(**validated_data)
@@ -150,3 +203,47 @@ class ConversationSerializer(serializers.ModelSerializer):
                 version_serializer.save(conversation=instance)
 
         return instance
+
+
+class ConversationSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Conversation
+        fields = [
+            "id",
+            "title",
+            "active_version",
+            "created_at",
+            "modified_at",
+            # Denormalized, see `chat.utils.counters`
+            "version_count",
+            "message_count",
+            "last_message_at",
+            "last_message_preview",
+        ]
+
+
+class SyncVersionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Version
+        fields = ["id", "conversation", "parent_version", "root_message"]
+
+
+class SyncMessageSerializer(serializers.ModelSerializer):
+    role = serializers.SlugRelatedField(slug_field="name", read_only=True)
+
+    class Meta:
+        model = Message
+        fields = ["id", "version", "role", "content", "position", "created_at"]
+
+
+class SyncSerializer(serializers.Serializer):
+    """The result of `chat.utils.changes.changes_since`."""
+
+    revision = serializers.IntegerField()
+    more = serializers.BooleanField()
+    conversations = ConversationSummarySerializer(many=True)
+    versions = SyncVersionSerializer(many=True)
+    messages = SyncMessageSerializer(many=True)
+    deleted_conversations = serializers.ListField(child=serializers.UUIDField())
+    deleted_versions = serializers.ListField(child=serializers.UUIDField())
+    deleted_messages = serializers.ListField(child=serializers.UUIDField())
@@ -0,0 +1,129 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from chat.benchmarks.generators import ConversationBuilder, make_mixed
+from chat.models import Conversation, Message, Role, Version, VersionAncestry
+from chat.utils.ancestry import ancestors, descendants, is_descendant, path_from_root, versions_sharing
+
+
+class VersionAncestryTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        builder = ConversationBuilder(cls.mock_user, "Ancestry")
+        root = builder.append(builder.root, 6)
+        cls.child = builder.branch(root, at_index=4, tail=1)
+        cls.grandchild = builder.branch(cls.child, at_index=2, tail=1)
+        cls.sibling = builder.branch(root, at_index=2, tail=1)
+        cls.conversation = builder.save()
+        cls.root = root
+
+    def _closure(self, versions):
+        rows = VersionAncestry.objects.filter(descendant__in=versions)
+        return set(rows.values_list("ancestor_id", "descendant_id", "depth"))
+
+    def test_queries(self):
+        self.assertEqual(list(ancestors(self.grandchild)), [self.child, self.root])
+        self.assertEqual(list(path_from_root(self.grandchild)), [self.root, self.child, self.grandchild])
+        self.assertEqual(list(descendants(self.root))[-1], self.grandchild)
+        self.assertEqual(set(descendants(self.root)), {self.child, self.grandchild, self.sibling})
+        self.assertEqual(list(descendants(self.grandchild, include_self=True)), [self.grandchild])
+        self.assertTrue(is_descendant(self.grandchild, self.root))
+        self.assertFalse(is_descendant(self.root, self.grandchild))
+        self.assertFalse(is_descendant(self.root, self.root))
+
+    def test_versions_sharing(self):
+        messages = list(self.root.messages.all())
+
+        # The sibling branches at message 2, the child at message 4 and the grandchild at the child's message 2
+        self.assertEqual(set(versions_sharing(messages[0])), {self.root, self.child, self.grandchild, self.sibling})
+        self.assertEqual(set(versions_sharing(messages[2])), {self.root, self.child})
+        self.assertEqual(set(versions_sharing(messages[4])), {self.root})
+        self.assertEqual(set(versions_sharing(self.grandchild.messages.last())), {self.grandchild})
+
+    def test_deleting_a_version_detaches_its_subtree(self):
+        Conversation.objects.filter(pk=self.conversation.pk).update(active_version=self.root)
+
+        self.child.delete()
+
+        self.grandchild.refresh_from_db()
+        self.assertIsNone(self.grandchild.parent_version)
+        self.assertEqual(self._closure([self.grandchild]), {(self.grandchild.pk, self.grandchild.pk, 0)})
+        self.assertFalse(is_descendant(self.grandchild, self.root))
+        self.assertEqual(set(descendants(self.root)), {self.sibling})
+
+    def test_add_version_links_the_new_version(self):
+        self.client.force_login(self.mock_user)
+        Conversation.objects.filter(pk=self.conversation.pk).update(active_version=self.grandchild)
+        root_message = self.grandchild.messages.last()
+
+        response = self.client.post(
+            reverse("conversation_add_version", kwargs={"pk": self.conversation.pk}),
+            data=json.dumps({"root_message_id": str(root_message.id)}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        version = Version.objects.get(pk=response.data["id"])
+        self.assertEqual(list(path_from_root(version)), [self.root, self.child, self.grandchild, version])
+
+    def test_bulk_rows_match_saved_versions(self):
+        role = Role.objects.create(name="user")
+        root = Version.objects.create(conversation=self.conversation)
+        message = Message.objects.create(version=root, role=role, content="Hi")
+        child = Version.objects.create(conversation=self.conversation, parent_version=root, root_message=message)
+        grandchild = Version.objects.create(conversation=self.conversation, parent_version=child)
+
+        rows = VersionAncestry.objects.rows_for(
+            [
+                Version(pk=root.pk),
+                Version(pk=child.pk, parent_version=root),
+                Version(pk=grandchild.pk, parent_version=child),
+            ]
+        )
+        self.assertEqual(
+            {(row.ancestor_id, row.descendant_id, row.depth) for row in rows}, self._closure([root, child, grandchild])
+        )
+
+    def test_moving_a_version_moves_its_subtree(self):
+        self.child.parent_version = self.sibling
+        self.child.save()
+
+        self.assertEqual(list(path_from_root(self.grandchild)), [self.root, self.sibling, self.child, self.grandchild])
+        self.assertEqual(set(descendants(self.sibling)), {self.child, self.grandchild})
+
+        self.child.parent_version = None
+        self.child.save()
+        self.assertEqual(list(path_from_root(self.grandchild)), [self.child, self.grandchild])
+
+    def test_moving_a_version_below_its_descendant(self):
+        self.child.parent_version = self.grandchild
+
+        with self.assertRaises(ValidationError):
+            self.child.save()
+
+    def test_deleting_a_version_drops_its_rows(self):
+        self.sibling.delete()
+
+        self.assertFalse(VersionAncestry.objects.filter(descendant=self.sibling.pk).exists())
+        self.assertFalse(VersionAncestry.objects.filter(ancestor=self.sibling.pk).exists())
+
+
+class VersionAdminTests(APITestCase):
+    def test_changelist(self):
+        admin = CustomUser.objects.create(email="admin@email.com", is_active=True, is_staff=True, is_superuser=True)
+        make_mixed(admin, 5)
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse("admin:chat_version_changelist"), {"o": "5"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        version = Version.objects.filter(parent_version__isnull=False).first()
+        response = self.client.get(reverse("admin:chat_version_change", args=[version.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, str(version.parent_version_id))
@@ -0,0 +1,127 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from authentication.models import CustomUser
+from chat.management.commands.backfill_titles import _first_exchanges
+from chat.models import DEFAULT_CONVERSATION_TITLE, Conversation, Message, Role, Version
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from src.utils.gpt import GPT_VERSIONS, is_upstream_failure, upstream_breakers
+
+
+class BackfillTitlesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_role = Role.objects.create(name="user")
+        cls.assistant_role = Role.objects.create(name="assistant")
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+
+    def setUp(self):
+        self.server = FakeOpenAIServer(FakeOpenAIConfig(reply="Generated title")).start()
+        self.addCleanup(self.server.stop)
+        patcher = mock.patch.dict(GPT_VERSIONS)  # the command swaps the gpt35 deployment in place
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.untitled = [self._make_conversation(DEFAULT_CONVERSATION_TITLE) for _ in range(5)]
+        self.titled = self._make_conversation("Already titled")
+
+    def _make_conversation(self, title: str) -> Conversation:
+        conversation = Conversation.objects.create(title=title, user=self.mock_user)
+        version = Version.objects.create(conversation=conversation)
+        Message.objects.create(version=version, content="Hi", role=self.user_role)
+        Message.objects.create(version=version, content="Hello!", role=self.assistant_role)
+        conversation.active_version = version
+        conversation.save()
+        return conversation
+
+    def _backfill(self, *args):
+        out = StringIO()
+        call_command(
+            "backfill_titles",
+            "--api-base",
+            self.server.url,
+            "--api-key",
+            "test",
+            "--api-type",
+            "open_ai",
+            *args,
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def test_backfill_titles(self):
+        output = self._backfill("--batch-size", "2", "--workers", "2")
+
+        titles = set(Conversation.objects.values_list("title", flat=True))
+        self.assertEqual(titles, {"Generated title", "Already titled"})
+        self.assertEqual(self.server.stats.requests, 5)
+        self.assertIn("5 titled", output)
+
+    def test_backfill_resumes_from_checkpoint(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = Path(tmp) / "checkpoint"
+            self._backfill("--batch-size", "2", "--limit", "2", "--checkpoint", str(checkpoint))
+            self.assertEqual(Conversation.objects.filter(title="Generated title").count(), 2)
+
+            self._backfill("--batch-size", "2", "--checkpoint", str(checkpoint))
+
+        self.assertEqual(Conversation.objects.filter(title="Generated title").count(), 5)
+        self.assertEqual(self.server.stats.requests, 5)
+
+    def test_stops_before_upstream_failures(self):
+        breaker = CircuitBreaker("test", is_failure=is_upstream_failure)
+        patcher = mock.patch.dict(upstream_breakers, {"gpt35": breaker})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = Path(tmp) / "checkpoint"
+            self._backfill("--batch-size", "2", "--limit", "2", "--checkpoint", str(checkpoint))
+            self.server.config.error_rate = 1.0
+            with self.assertRaisesMessage(CommandError, "Stopped after 0 conversations"):
+                self._backfill("--batch-size", "2", "--workers", "1", "--checkpoint", str(checkpoint))
+            self.assertEqual(checkpoint.read_text(), str(sorted(c.pk for c in self.untitled)[1]))
+
+            self.server.config.error_rate = 0.0
+            self._backfill("--batch-size", "2", "--checkpoint", str(checkpoint))
+
+        self.assertEqual(Conversation.objects.filter(title="Generated title").count(), 5)
+
+    def test_stops_when_the_breaker_is_open(self):
+        breaker = CircuitBreaker("test", min_calls=1)
+        breaker.record_failure()
+        with mock.patch.dict(upstream_breakers, {"gpt35": breaker}):
+            with self.assertRaisesMessage(CommandError, "Circuit `test` is open"):
+                self._backfill()
+
+        self.assertEqual(self.server.stats.requests, 0)
+
+    def test_rejected_conversations_are_skipped(self):
+        self.server.config.error_rate = 1.0
+        self.server.config.error_status = 400
+
+        output = self._backfill("--batch-size", "2")
+
+        self.assertIn("5 failed", output)
+        self.assertEqual(Conversation.objects.filter(title=DEFAULT_CONVERSATION_TITLE).count(), 5)
+
+    def test_first_exchange(self):
+        conversation = self.untitled[0]
+        system = Role.objects.create(name="system")
+        version = Version.objects.create(conversation=conversation)
+        for role, content in ((system, "Be brief"), (self.assistant_role, "Welcome"), (self.user_role, "Hi")):
+            Message.objects.create(version=version, content=content, role=role)
+        Message.objects.create(version=version, content="Again", role=self.user_role)
+
+        self.assertEqual(_first_exchanges([version.pk]), {version.pk: ("Hi", "Welcome")})
+
+    def test_dry_run(self):
+        self._backfill("--dry-run")
+
+        self.assertEqual(Conversation.objects.filter(title=DEFAULT_CONVERSATION_TITLE).count(), 5)
@@ -0,0 +1,55 @@
+from django.test import TestCase
+
+from authentication.models import CustomUser
+from chat.benchmarks import load_benchmarks
+from chat.benchmarks.generators import make_deep_linear, make_mixed, make_nested_edits, make_wide_fanout
+from chat.benchmarks.runner import find_regressions, run_benchmark
+from chat.models import Conversation
+from chat.serializers import ConversationSerializer
+from chat.utils.branching import make_branched_conversation
+
+
+class BenchmarkGeneratorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+
+    def test_shapes_are_branchable(self):
+        for make_conversation, expected_versions in (
+            (make_deep_linear, 1),
+            (make_wide_fanout, 6),
+            (make_nested_edits, 6),
+            (make_mixed, 6),
+        ):
+            with self.subTest(shape=make_conversation.__name__):
+                conversation = make_conversation(self.mock_user, 5)
+                data = ConversationSerializer(conversation).data
+                make_branched_conversation(data)
+                self.assertEqual(len(data["versions"]), expected_versions)
+
+    def test_generators_are_deterministic(self):
+        first = ConversationSerializer(make_mixed(self.mock_user, 10)).data
+        second = ConversationSerializer(make_mixed(self.mock_user, 10)).data
+
+        def shape(data):
+            return sorted([m["content"] for m in v["messages"]] for v in data["versions"])
+
+        self.assertEqual(shape(first), shape(second))
+
+    def test_run_benchmark_rolls_back(self):
+        bench = load_benchmarks()["view.deep_linear"]
+        result = run_benchmark(bench, 10, repeat=2)
+
+        self.assertEqual(result["repeat"], 2)
+        self.assertFalse(Conversation.objects.exists())
+
+
+class FindRegressionsTests(TestCase):
+    def test_threshold(self):
+        baseline = {"a[1]": {"median_ms": 10.0}, "b[1]": {"median_ms": 10.0}}
+        results = {"a[1]": {"median_ms": 12.0}, "b[1]": {"median_ms": 13.0}, "c[1]": {"median_ms": 99.0}}
+
+        regressions = find_regressions(results, baseline, threshold=0.25)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("b[1]"))
@@ -0,0 +1,121 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from authentication.models import CustomUser
+from chat.models import Conversation, Message, MessageBody, Role, Version
+from chat.search import ContainsSearchBackend, SQLiteFTS5Backend
+from chat.utils import compression
+from chat.utils.compression import compress, decompress
+
+LONG_TEXT = "Deploy the service behind nginx and scale the workers with kubernetes. " * 100
+
+
+class CompressTests(TestCase):
+    def test_short_text_is_kept(self):
+        self.assertEqual(compress("Hello", codec="zlib", threshold=16), "Hello")
+
+    def test_incompressible_text_is_kept(self):
+        # Above the threshold, but the zlib header and checksum outweigh the savings
+        self.assertEqual(compress("abcdefghijklmnopqrst", codec="zlib", threshold=16), "abcdefghijklmnopqrst")
+
+    def test_zlib_round_trip(self):
+        value = compress(LONG_TEXT, codec="zlib", threshold=16)
+
+        self.assertIsInstance(value, bytes)
+        self.assertLess(len(value), len(LONG_TEXT) // 10)
+        self.assertEqual(decompress(value), LONG_TEXT)
+
+    @skipUnless(compression.zstandard, "zstandard is not installed")
+    def test_zstd_round_trip(self):
+        value = compress(LONG_TEXT, codec="zstd", threshold=16)
+
+        self.assertEqual(value[:1], b"s")
+        self.assertEqual(decompress(value), LONG_TEXT)
+
+    def test_none_codec(self):
+        self.assertEqual(compress(LONG_TEXT, codec="none", threshold=16), LONG_TEXT)
+
+    def test_unknown_codec_tag(self):
+        with self.assertRaises(ValueError):
+            decompress(b"?abc")
+
+
+@override_settings(CHAT_BODY_COMPRESSION_THRESHOLD=1024, CHAT_BODY_COMPRESSION_CODEC="zlib")
+class CompressedBodyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name="user")
+        cls.user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.conversation = Conversation.objects.create(title="Compression", user=cls.user)
+        cls.version = Version.objects.create(conversation=cls.conversation)
+        cls.conversation.active_version = cls.version
+        cls.conversation.save()
+
+    def setUp(self):
+        self.message = Message.objects.create(version=self.version, role=self.role, content=LONG_TEXT)
+        self.short = Message.objects.create(version=self.version, role=self.role, content="Hello")
+
+    def _storage_class(self, message):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT typeof(content) FROM chat_messagebody WHERE hash = %s", [message.body_id])
+            return cursor.fetchone()[0]
+
+    def test_only_large_bodies_are_compressed(self):
+        self.assertEqual(self._storage_class(self.message), "blob")
+        self.assertEqual(self._storage_class(self.short), "text")
+
+    def test_reads_give_back_the_text(self):
+        self.assertEqual(Message.objects.get(pk=self.message.pk).content, LONG_TEXT)
+        self.assertEqual(MessageBody.objects.values_list("content", flat=True).get(pk=self.message.body_id), LONG_TEXT)
+
+    def test_serializer_gives_back_the_text(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("version_messages", kwargs={"pk": self.version.pk}))
+
+        self.assertEqual([m["content"] for m in response.data["messages"]], [LONG_TEXT, "Hello"])
+
+    def test_same_large_content_is_deduplicated(self):
+        other = Message.objects.create(version=self.version, role=self.role, content=LONG_TEXT)
+
+        self.assertEqual(other.body_id, self.message.body_id)
+        self.assertEqual(MessageBody.objects.get(pk=other.body_id).ref_count, 2)
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 is SQLite only")
+    def test_search_indexes_the_text(self):
+        for backend in (SQLiteFTS5Backend(), ContainsSearchBackend()):
+            with self.subTest(backend=type(backend).__name__):
+                hits = backend.search(self.user, "kubernetes", 10)
+                self.assertEqual([hit.message_id for hit in hits], [self.message.id])
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 is SQLite only")
+    def test_search_indexes_copies_edits_and_rebuilds(self):
+        backend = SQLiteFTS5Backend()
+        copy = Message.objects.bulk_create(
+            [Message(version=self.version, role=self.role, body_id=self.message.body_id, position=9)]
+        )
+        self.short.content = LONG_TEXT.replace("kubernetes", "terraform")
+        self.short.save()
+
+        expected = {self.message.id, copy[0].id}
+        self.assertEqual({hit.message_id for hit in backend.search(self.user, "kubernetes", 10)}, expected)
+        self.assertEqual([hit.message_id for hit in backend.search(self.user, "terraform", 10)], [self.short.id])
+
+        backend.rebuild()
+        self.assertEqual({hit.message_id for hit in backend.search(self.user, "kubernetes", 10)}, expected)
+
+    def test_preview_of_a_compressed_last_message(self):
+        last = Message.objects.create(version=self.version, role=self.role, content=LONG_TEXT)
+
+        self.assertEqual(self._storage_class(last), "blob")
+        self.assertEqual(MessageBody.objects.get(pk=last.body_id).preview, LONG_TEXT[:120])
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_preview, LONG_TEXT[:120])
+
+    @skipUnless(connection.vendor == "sqlite", "triggers are SQLite only")
+    def test_triggers_never_decompress(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND sql LIKE '%chat_body_text%'")
+            self.assertEqual(cursor.fetchall(), [])
@@ -0,0 +1,107 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from chat.models import Conversation, Message, Role, Version
+from chat.utils.deletion import delete_conversations, delete_versions
+from chat.utils.ndjson import export_conversations, import_conversations
+
+
+class ConversationCounterTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_role = Role.objects.create(name="user")
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+
+        cls.conversation = Conversation.objects.create(title="Counters", user=cls.mock_user)
+        cls.version = Version.objects.create(conversation=cls.conversation)
+        cls.conversation.active_version = cls.version
+        cls.conversation.save()
+        cls.first = Message.objects.create(version=cls.version, role=cls.user_role, content="First")
+        cls.last = Message.objects.create(version=cls.version, role=cls.user_role, content="Second")
+
+    def _counters(self):
+        conversation = Conversation.objects.get(pk=self.conversation.pk)
+        return (
+            conversation.version_count,
+            conversation.message_count,
+            conversation.last_message_at,
+            conversation.last_message_preview,
+        )
+
+    def test_messages(self):
+        self.assertEqual(self._counters(), (1, 2, self.last.created_at, "Second"))
+
+        self.last.content = "Edited"
+        self.last.save()
+        self.assertEqual(self._counters()[3], "Edited")
+
+        self.last.delete()
+        self.assertEqual(self._counters(), (1, 1, self.first.created_at, "First"))
+
+    def test_preview_is_truncated(self):
+        Message.objects.create(version=self.version, role=self.user_role, content="x" * 500)
+
+        self.assertEqual(self._counters()[3], "x" * 120)
+
+    def test_active_version_switch(self):
+        version = Version.objects.create(conversation=self.conversation)
+        Message.objects.create(version=version, role=self.user_role, content="Elsewhere")
+        self.assertEqual(self._counters()[:2], (2, 2))
+
+        self.conversation.active_version = version
+        self.conversation.save()
+        self.assertEqual(self._counters()[1:], (1, version.messages.get().created_at, "Elsewhere"))
+
+        self.conversation.active_version = self.version
+        self.conversation.save()
+        version.delete()
+        self.assertEqual(self._counters(), (1, 2, self.last.created_at, "Second"))
+
+    def test_save_keeps_the_counters(self):
+        stale = Conversation.objects.get(pk=self.conversation.pk)
+        Message.objects.create(version=self.version, role=self.user_role, content="Third")
+
+        stale.title = "Renamed"
+        stale.save()
+
+        self.assertEqual(self._counters()[1], 3)
+        self.assertEqual(Conversation.objects.get(pk=self.conversation.pk).title, "Renamed")
+
+    def test_bulk_writers(self):
+        version = Version.objects.create(conversation=self.conversation)
+        delete_versions([version.pk])
+        self.assertEqual(self._counters()[:2], (1, 2))
+
+        export = "".join(export_conversations(Conversation.objects.filter(pk=self.conversation.pk)))
+        delete_conversations([self.conversation.pk])
+        import_conversations(export.splitlines(), user=self.mock_user)
+        self.assertEqual(self._counters(), (1, 2, self.last.created_at, "Second"))
+
+    def test_reconcile(self):
+        Conversation.objects.filter(pk=self.conversation.pk).update(message_count=7, last_message_preview="Wrong")
+        stdout = StringIO()
+
+        call_command("reconcile_counters", dry_run=True, stdout=stdout)
+        self.assertIn("Found 1 of 1 conversations", stdout.getvalue())
+        self.assertEqual(self._counters()[1], 7)
+
+        call_command("reconcile_counters", slice_size=1, stdout=stdout)
+        self.assertIn("Repaired 1 of 1 conversations", stdout.getvalue())
+        self.assertEqual(self._counters(), (1, 2, self.last.created_at, "Second"))
+
+    def test_summaries(self):
+        self.client.force_login(self.mock_user)
+
+        response = self.client.get(reverse("get_conversation_summaries"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        summary = response.json()[0]
+        self.assertEqual(summary["id"], str(self.conversation.pk))
+        self.assertEqual((summary["version_count"], summary["message_count"]), (1, 2))
+        self.assertEqual(summary["last_message_preview"], "Second")
+        self.assertNotIn("versions", summary)
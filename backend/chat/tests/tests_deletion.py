@@ -0,0 +1,204 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from chat.benchmarks.generators import make_mixed, make_nested_edits, make_wide_fanout
+from chat.models import Conversation, Message, MessageBody, Version, VersionAncestry
+from chat.utils.deletion import delete_conversations, delete_versions
+
+
+def _snapshot() -> dict:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM chat_message_search")
+        search_rows = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM chat_message_fts")
+        fts_rows = cursor.fetchone()[0]
+    return {
+        "conversations": sorted(Conversation.objects.values_list("id", "active_version_id")),
+        "versions": sorted(Version.objects.values_list("id", "parent_version_id", "root_message_id")),
+        "messages": sorted(Message.objects.values_list("id", "body_id")),
+        "bodies": sorted(MessageBody.objects.values_list("hash", "ref_count")),
+        "ancestry": sorted(VersionAncestry.objects.values_list("ancestor_id", "descendant_id", "depth")),
+        "search": (search_rows, fts_rows),
+    }
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _expected_after(conversations) -> dict:
+    """The state after Django's own cascading delete, rolled back."""
+    try:
+        with transaction.atomic():
+            for conversation in Conversation.objects.filter(pk__in=[c.pk for c in conversations]):
+                conversation.delete()
+            expected = _snapshot()
+            raise _Rollback
+    except _Rollback:
+        return expected
+
+
+class DeleteConversationsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_conversations", users=2, conversations=6, seed=7, prefix="delete", stdout=StringIO())
+        cls.conversations = list(Conversation.objects.order_by("id"))
+
+    def test_same_result_as_the_collector(self):
+        doomed = self.conversations[:2]
+        before = _snapshot()
+        expected = _expected_after(doomed)
+
+        stats = delete_conversations([c.pk for c in doomed])
+
+        self.assertEqual(_snapshot(), expected)
+        self.assertEqual(stats["conversations"], 2)
+        self.assertEqual(stats["messages"], len(before["messages"]) - len(expected["messages"]))
+
+    def test_links_from_kept_conversations_are_cleared(self):
+        doomed, kept = self.conversations[0], self.conversations[1]
+        version = kept.versions.first()
+        version.parent_version = doomed.active_version
+        version.root_message = doomed.active_version.messages.first()
+        version.save()
+        expected = _expected_after([doomed])
+
+        delete_conversations([doomed.pk])
+
+        self.assertEqual(_snapshot(), expected)
+        version.refresh_from_db()
+        self.assertIsNone(version.parent_version_id)
+        self.assertIsNone(version.root_message_id)
+
+    def test_conversations_pointing_at_deleted_versions_cascade(self):
+        doomed, other = self.conversations[0], self.conversations[1]
+        Conversation.objects.filter(pk=other.pk).update(active_version=doomed.active_version)
+
+        stats = delete_conversations([doomed.pk])
+
+        self.assertEqual(stats["conversations"], 2)
+        self.assertFalse(Conversation.objects.filter(pk__in=[doomed.pk, other.pk]).exists())
+        self.assertFalse(Version.objects.filter(conversation=other).exists())
+
+    def test_shared_bodies_are_kept(self):
+        doomed = self.conversations[0]
+        message = Message.objects.filter(version__conversation=doomed).first()
+        Message.objects.create(version=self.conversations[1].active_version, role=message.role, content=message.content)
+
+        delete_conversations([doomed.pk])
+
+        self.assertEqual(MessageBody.objects.get(pk=message.body_id).ref_count, 1)
+
+    def test_deleting_a_parent_detaches_the_versions_below(self):
+        # A root version with children, which is not the active one
+        root = Version.objects.filter(parent_version__isnull=True, version__isnull=False).exclude(
+            current_version_conversations__isnull=False
+        )[0]
+        children = set(Version.objects.filter(parent_version=root).values_list("pk", flat=True))
+
+        stats = delete_versions([root.pk])
+
+        self.assertEqual((stats["conversations"], stats["versions"]), (0, 1))
+        parents = dict(Version.objects.filter(conversation_id=root.conversation_id).values_list("pk", "parent_version"))
+        self.assertLessEqual(children, {pk for pk, parent in parents.items() if parent is None})
+        # The closure rows are those of the remaining parent links
+        expected = set()
+        for pk in parents:
+            ancestor, depth = pk, 0
+            while ancestor is not None:
+                expected.add((ancestor, pk, depth))
+                ancestor, depth = parents[ancestor], depth + 1
+        rows = VersionAncestry.objects.filter(descendant__conversation_id=root.conversation_id)
+        self.assertEqual(set(rows.values_list("ancestor_id", "descendant_id", "depth")), expected)
+
+    def test_nothing_to_delete(self):
+        self.assertEqual(delete_conversations([])["conversations"], 0)
+
+
+class PurgeConversationsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_conversations", users=1, conversations=5, seed=2, prefix="purge", stdout=StringIO())
+        conversations = list(Conversation.objects.order_by("id"))
+        now = timezone.now()
+        cls.expired = conversations[:3]
+        cls.recent = conversations[3]
+        Conversation.objects.filter(pk__in=[c.pk for c in cls.expired]).update(deleted_at=now - timedelta(days=40))
+        Conversation.objects.filter(pk=cls.recent.pk).update(deleted_at=now - timedelta(days=1))
+
+    def test_purges_expired_conversations_in_batches(self):
+        stdout = StringIO()
+        call_command("purge_conversations", days=30, batch_size=2, stdout=stdout)
+
+        self.assertEqual(Conversation.objects.count(), 2)
+        self.assertFalse(Conversation.objects.filter(pk__in=[c.pk for c in self.expired]).exists())
+        self.assertTrue(Conversation.objects.filter(pk=self.recent.pk).exists())
+        output = stdout.getvalue()
+        self.assertIn("Purged 3 conversations", output)
+        self.assertIn("2 batches", output)
+
+    def test_limit(self):
+        call_command("purge_conversations", days=30, limit=1, stdout=StringIO())
+
+        self.assertEqual(Conversation.objects.count(), 4)
+
+    def test_nothing_expired(self):
+        stdout = StringIO()
+        call_command("purge_conversations", days=60, stdout=stdout)
+
+        self.assertEqual(Conversation.objects.count(), 5)
+        self.assertIn("Purged 0 conversations", stdout.getvalue())
+
+
+class LargeTreeDeleteTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        # Re-read, the builders' instances hold their whole trees
+        cls.small, cls.mixed, cls.fanout, cls.nested = (
+            Conversation.objects.get(pk=conversation.pk)
+            for conversation in (
+                make_mixed(cls.mock_user, 5, seed=1),
+                make_mixed(cls.mock_user, 300, seed=2),
+                make_wide_fanout(cls.mock_user, 200),
+                make_nested_edits(cls.mock_user, 100),
+            )
+        )
+
+    def test_same_result_as_the_collector(self):
+        for conversation in (self.mixed, self.fanout, self.nested):
+            with self.subTest(conversation=conversation.title):
+                expected = _expected_after([conversation])
+
+                delete_conversations([conversation.pk])
+
+                self.assertEqual(_snapshot(), expected)
+
+    def test_statement_count_does_not_grow_with_the_tree(self):
+        counts = []
+        for conversation in (self.small, self.mixed):
+            with CaptureQueriesContext(connection) as queries:
+                delete_conversations([conversation.pk])
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_delete_view(self):
+        self.client.force_login(self.mock_user)
+        url = reverse("conversation_manage", kwargs={"pk": self.mixed.pk})
+
+        response = self.client.delete(url)
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Version.objects.filter(conversation_id=self.mixed.pk).exists())
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_404_NOT_FOUND)
@@ -403,6 +403,23 @@ class LoggedInConversationTests(APITestCase):
             self.assertEqual(new_msg.version.conversation.id, self.conversation.id)
             self.assertTrue(new_msg.created_at > old_msg.created_at)
 
+    def test_conversation_add_version_copies_from_the_root_messages_version(self):
+        root_message = self.messages[2]
+        url = reverse("conversation_add_version", kwargs={"pk": self.conversation.id})
+        self.client.post(
+            url, data=json.dumps({"root_message_id": str(self.messages[0].id)}), content_type="application/json"
+        )
+
+        # The active version is now the branch, the new one still copies the original version's prefix
+        response = self.client.post(
+            url, data=json.dumps({"root_message_id": str(root_message.id)}), content_type="application/json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        new_messages = Version.objects.get(id=response.data["id"]).messages.all()
+        self.assertEqual([m.content for m in new_messages], [m.content for m in self.messages[:2]])
+        self.assertEqual([m.position for m in new_messages], [0, 1])
+
     def test_conversation_add_version_multiple_branches_from_same_root_message(self):
         initial_versions_count = len(self.conversation.versions.all())
         root_message_id = str(self.messages[-1].id)
@@ -614,6 +631,18 @@ class LoggedInConversationTests(APITestCase):
         self.version.refresh_from_db()
         self.assertEqual(len(self.version.messages.all()), messages_count + 1)
 
+    def test_version_add_message_appends_at_the_next_position(self):
+        url = reverse("version_add_message", kwargs={"pk": self.version.id})
+        response = self.client.post(
+            url,
+            data=json.dumps({"role": "user", "content": "Test message"}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([m.position for m in self.version.messages.all()], [0, 1, 2, 3, 4])
+        self.assertEqual(self.version.messages.last().content, "Test message")
+
     def test_version_add_message_no_content(self):
         messages_count = len(self.version.messages.all())
         url = reverse("version_add_message", kwargs={"pk": self.version.id})
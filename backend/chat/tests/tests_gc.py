@@ -0,0 +1,138 @@
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from authentication.models import CustomUser
+from chat.benchmarks.generators import ConversationBuilder
+from chat.models import Conversation, Message, MessageBody, Version, VersionAncestry
+from chat.utils.gc import GCPolicy, collect_garbage, collect_orphan_bodies, find_garbage
+
+NOW = GCPolicy(min_idle=timedelta(0))
+
+
+def _build(user, title: str):
+    """
+    A tree with the active version, an abandoned branch, an empty leaf and a detached subtree (orphan -> orphan_child)
+    whose parent was deleted.
+    """
+    builder = ConversationBuilder(user, title)
+    root = builder.append(builder.root, 6)
+    abandoned = builder.branch(root, at_index=2, tail=1)
+    active = builder.branch(root, at_index=4, tail=1)
+    empty = builder._new_version(parent=active)
+    orphan = builder.append(builder._new_version(), 2)
+    orphan_child = builder.branch(orphan, at_index=0, tail=1)
+    conversation = builder.save(active=active)
+    return conversation, {
+        "root": root.pk,
+        "abandoned": abandoned.pk,
+        "active": active.pk,
+        "empty": empty.pk,
+        "orphan": orphan.pk,
+        "orphan_child": orphan_child.pk,
+    }
+
+
+class FindGarbageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        conversation, cls.versions = _build(cls.user, "GC")
+        cls.active_versions = {conversation.pk: conversation.active_version_id}
+
+    def _garbage(self, **policy):
+        garbage = set(find_garbage(self.active_versions, GCPolicy(**policy)))
+        return {name for name, pk in self.versions.items() if pk in garbage}
+
+    def test_default_policy(self):
+        # The abandoned branch can still be switched to, it stays
+        self.assertEqual(self._garbage(), {"empty", "orphan", "orphan_child"})
+
+    def test_policy_switches(self):
+        self.assertEqual(self._garbage(empty=False), {"orphan", "orphan_child"})
+        self.assertEqual(self._garbage(unreachable=False), {"empty"})
+
+    def test_empty_active_version_is_kept(self):
+        Conversation.objects.filter(pk__in=self.active_versions).update(active_version=self.versions["empty"])
+        self.active_versions = {pk: self.versions["empty"] for pk in self.active_versions}
+
+        self.assertEqual(self._garbage(), {"orphan", "orphan_child"})
+
+
+class CollectGarbageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.trees = [_build(cls.user, f"GC {i}") for i in range(3)]
+
+    def test_deletes_the_garbage_only(self):
+        stats = collect_garbage(slice_size=10, policy=NOW)
+
+        self.assertEqual(stats["conversations"], 3)
+        self.assertEqual(stats["versions"], 9)
+        self.assertIsNone(stats["last"])
+        for conversation, versions in self.trees:
+            kept = set(Version.objects.filter(conversation=conversation).values_list("pk", flat=True))
+            self.assertEqual(kept, {versions["root"], versions["abandoned"], versions["active"]})
+            self.assertFalse(Message.objects.filter(version_id=versions["orphan"]).exists())
+        self.assertFalse(VersionAncestry.objects.exclude(descendant__in=Version.objects.all()).exists())
+
+    def test_dry_run(self):
+        stats = collect_garbage(slice_size=10, policy=NOW, dry_run=True)
+
+        self.assertEqual(stats["garbage"], 9)
+        self.assertEqual(Version.objects.count(), 18)
+
+    def test_recently_modified_conversations_are_skipped(self):
+        conversation = self.trees[0][0]
+        Conversation.objects.filter(pk=conversation.pk).update(modified_at=timezone.now())
+
+        stats = collect_garbage(slice_size=10, policy=GCPolicy(min_idle=timedelta(hours=1)))
+
+        self.assertEqual(stats["versions"], 6)
+        self.assertEqual(Version.objects.filter(conversation=conversation).count(), 6)
+
+    def test_command_resumes_from_the_checkpoint(self):
+        first, second, third = sorted(conversation.pk for conversation, _ in self.trees)
+        with TemporaryDirectory() as directory:
+            checkpoint = Path(directory) / "gc.checkpoint"
+            options = {"slice_size": 2, "batch_size": 2, "min_idle_hours": 0, "checkpoint": checkpoint}
+
+            call_command("gc_versions", stdout=StringIO(), **options)
+            self.assertEqual(checkpoint.read_text(), str(second))
+            self.assertEqual(Version.objects.filter(conversation_id=third).count(), 6)
+
+            stdout = StringIO()
+            call_command("gc_versions", stdout=stdout, **options)
+            self.assertEqual(checkpoint.read_text(), "")
+            self.assertEqual(Version.objects.filter(conversation_id=third).count(), 3)
+            self.assertIn(f"Resuming after conversation {second}", stdout.getvalue())
+
+    def test_command_full_pass(self):
+        stdout = StringIO()
+        call_command("gc_versions", slices=0, slice_size=1, min_idle_hours=0, stdout=stdout)
+
+        self.assertEqual(Version.objects.count(), 9)
+        self.assertIn("Deleted 9 versions", stdout.getvalue())
+
+    def test_orphan_bodies(self):
+        MessageBody.for_content("Never referenced").save()
+        bodies = MessageBody.objects.count()
+
+        self.assertEqual(collect_orphan_bodies(dry_run=True), 1)
+        self.assertEqual(collect_orphan_bodies(batch_size=1), 1)
+
+        self.assertEqual(MessageBody.objects.count(), bodies - 1)
+        self.assertEqual(collect_orphan_bodies(), 0)
+
+    def test_command_pass_collects_orphan_bodies(self):
+        MessageBody.for_content("Never referenced").save()
+        stdout = StringIO()
+        call_command("gc_versions", slices=0, min_idle_hours=0, stdout=stdout)
+
+        self.assertIn("1 unreferenced message bodies", stdout.getvalue())
@@ -0,0 +1,60 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from authentication.models import CustomUser
+from chat.benchmarks import load_benchmarks
+from chat.benchmarks.generators import make_mixed
+from chat.benchmarks.runner import run_benchmark
+from chat.models import Conversation, Message
+
+
+@skipUnless(connection.vendor == "sqlite", "Asserts on SQLite's EXPLAIN QUERY PLAN output")
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.conversation = make_mixed(cls.mock_user, 5)
+        cls.version = cls.conversation.active_version
+
+    def assertUsesIndex(self, queryset, index: str):
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index}", plan)
+        self.assertNotIn("TEMP B-TREE", plan, "the index should also provide the ordering")
+
+    @staticmethod
+    def _position_index() -> str:
+        # SQLite builds the unique constraint inline, so its index gets an automatic name
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA index_list({Message._meta.db_table})")
+            for _, name, unique, *_ in cursor.fetchall():
+                cursor.execute(f"PRAGMA index_info({name})")
+                if unique and [row[2] for row in cursor.fetchall()] == ["version_id", "position"]:
+                    return name
+        raise AssertionError("No unique (version_id, position) index")
+
+    def test_messages_of_version(self):
+        self.assertUsesIndex(Message.objects.filter(version=self.version), self._position_index())
+
+    def test_messages_before_branch_point(self):
+        root_message = self.version.messages.last()
+        queryset = Message.objects.filter(version=self.version, position__lt=root_message.position)
+        self.assertUsesIndex(queryset, self._position_index())
+
+    def test_messages_tail(self):
+        queryset = Message.objects.filter(version=self.version).order_by("-position")[:3]
+        self.assertUsesIndex(queryset, self._position_index())
+
+    def test_conversation_list(self):
+        queryset = Conversation.objects.filter(user=self.mock_user, deleted_at__isnull=True).order_by("-modified_at")
+        self.assertUsesIndex(queryset, "chat_conv_user_deleted_mod_idx")
+
+    def test_fk_index_benchmark_restores_the_indexes(self):
+        result = run_benchmark(load_benchmarks()["queries.conversation_list.fk_index"], 20, repeat=1)
+
+        self.assertEqual(result["repeat"], 1)
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Conversation._meta.db_table)
+        self.assertIn("chat_conv_user_deleted_mod_idx", constraints)
+        self.assertNotIn("bench_conv_user_idx", constraints)
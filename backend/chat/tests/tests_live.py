@@ -0,0 +1,163 @@
+import asyncio
+import json
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from authentication.models import CustomUser
+from chat.live import InProcessBroker, TCPBroker, channel_name, get_broker
+from chat.live.consumer import LIVE_PATH, UNAUTHORIZED, websocket_application
+from chat.live.server import BrokerServer
+from chat.models import Conversation, Message, Role, Version
+
+
+class BrokerTests(SimpleTestCase):
+    async def test_in_process(self):
+        broker = InProcessBroker()
+        listener, other = broker.listen(), broker.listen()
+        listener.subscribe("a")
+        other.subscribe("b")
+
+        await sync_to_async(broker.publish, thread_sensitive=False)("a", {"n": 1})
+
+        self.assertEqual(await asyncio.wait_for(listener.get(), 1), {"n": 1})
+        self.assertTrue(other._queue.empty())
+        listener.close()
+        broker.publish("a", {"n": 2})
+        self.assertTrue(listener._queue.empty())
+
+    async def test_across_workers(self):
+        server = BrokerServer()
+        url = server.start()
+        self.addCleanup(server.stop)
+        publisher, subscriber = TCPBroker(url), TCPBroker(url)
+        self.addCleanup(publisher.close)
+        self.addCleanup(subscriber.close)
+
+        listener = subscriber.listen()
+        await sync_to_async(listener.subscribe, thread_sensitive=False)("a")
+        while "a" not in server.subscribers:
+            await asyncio.sleep(0.01)
+        await sync_to_async(publisher.publish, thread_sensitive=False)("a", {"n": 1})
+        await sync_to_async(publisher.publish, thread_sensitive=False)("b", {"n": 2})
+
+        self.assertEqual(await asyncio.wait_for(listener.get(), 1), {"n": 1})
+        await asyncio.sleep(0.05)
+        self.assertTrue(listener._queue.empty())
+
+    async def test_close_when_the_broker_is_gone(self):
+        server = BrokerServer()
+        url = server.start()
+        broker = TCPBroker(url)
+        self.addCleanup(broker.close)
+        listener = broker.listen()
+        for channel in ("a", "b"):
+            await sync_to_async(listener.subscribe, thread_sensitive=False)(channel)
+        server.stop()
+
+        with self.assertLogs("chat.live.brokers", "WARNING"):
+            await sync_to_async(listener.close, thread_sensitive=False)()
+
+        self.assertEqual((listener.channels, dict(broker._listeners)), (set(), {}))
+
+
+class WebSocketTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Role.objects.create(name="user")
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.other_user = CustomUser.objects.create(email="other@email.com", is_active=True)
+        cls.conversation = Conversation.objects.create(title="Live", user=cls.mock_user)
+        cls.version = Version.objects.create(conversation=cls.conversation)
+        cls.conversation.active_version = cls.version
+        cls.conversation.save()
+        cls.other = Conversation.objects.create(title="Not mine", user=cls.other_user)
+
+    def setUp(self):
+        get_broker.cache_clear()
+        self.addCleanup(get_broker.cache_clear)
+        self.client.force_login(self.mock_user)
+
+    async def _connect(self, cookie=True, origin=settings.FRONTEND_URL):
+        headers = [(b"origin", origin.encode())]
+        if cookie:
+            session = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+            headers.append((b"cookie", f"{settings.SESSION_COOKIE_NAME}={session}".encode()))
+        communicator = ApplicationCommunicator(
+            websocket_application, {"type": "websocket", "path": LIVE_PATH, "headers": headers}
+        )
+        await communicator.send_input({"type": "websocket.connect"})
+        return communicator
+
+    async def _receive(self, communicator):
+        return json.loads((await communicator.receive_output(timeout=1))["text"])
+
+    async def _subscribe(self, communicator, conversation):
+        await communicator.send_input(
+            {
+                "type": "websocket.receive",
+                "text": json.dumps({"action": "subscribe", "conversation_id": str(conversation.pk)}),
+            }
+        )
+        return await self._receive(communicator)
+
+    def _request(self, method, url, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url, data, content_type="application/json")
+
+    async def test_authentication(self):
+        for communicator in (await self._connect(cookie=False), await self._connect(origin="https://evil.example")):
+            self.assertEqual(
+                await communicator.receive_output(timeout=1), {"type": "websocket.close", "code": UNAUTHORIZED}
+            )
+
+    async def test_pushes_updates(self):
+        communicator = await self._connect()
+        self.assertEqual(await communicator.receive_output(timeout=1), {"type": "websocket.accept"})
+        self.assertEqual((await self._subscribe(communicator, self.conversation))["type"], "subscribed")
+
+        url = reverse("conversation_add_message", kwargs={"pk": self.conversation.pk})
+        await sync_to_async(self._request)("post", url, {"role": "user", "content": "Hello"})
+        event = await self._receive(communicator)
+        self.assertEqual((event["type"], event["message"]["content"]), ("message", "Hello"))
+        self.assertEqual(event["conversation_id"], str(self.conversation.pk))
+
+        url = reverse("conversation_change_title", kwargs={"pk": self.conversation.pk})
+        await sync_to_async(self._request)("put", url, {"title": "Renamed"})
+        self.assertEqual(
+            await self._receive(communicator),
+            {"type": "title", "conversation_id": str(self.conversation.pk), "title": "Renamed"},
+        )
+
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait(timeout=1)
+        self.assertEqual(get_broker()._listeners, {})
+
+    async def test_only_own_conversations(self):
+        communicator = await self._connect()
+        await communicator.receive_output(timeout=1)
+
+        self.assertEqual((await self._subscribe(communicator, self.other))["type"], "error")
+        self.assertNotIn(channel_name(self.other.pk), get_broker()._listeners)
+
+    def test_other_users_conversation_is_not_changed(self):
+        version = Version.objects.create(conversation=self.other)
+        for method, url, data in (
+            (
+                "put",
+                reverse("conversation_switch_version", kwargs={"pk": self.other.pk, "version_id": version.pk}),
+                None,
+            ),
+            ("post", reverse("version_add_message", kwargs={"pk": version.pk}), {"role": "user", "content": "Hi"}),
+        ):
+            with self.subTest(url=url), mock.patch("chat.views.live.publish") as publish:
+                self.assertEqual(self._request(method, url, data).status_code, 404)
+                publish.assert_not_called()
+
+        self.other.refresh_from_db()
+        self.assertIsNone(self.other.active_version_id)
+        self.assertFalse(Message.objects.filter(version=version).exists())
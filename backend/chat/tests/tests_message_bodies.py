@@ -0,0 +1,114 @@
+from unittest import mock, skipUnless
+
+from django.db import IntegrityError, connection
+from django.db.models.deletion import ProtectedError
+from django.test import TestCase
+from django.urls import reverse
+
+from authentication.models import CustomUser
+from chat.checks import check_database_vendor
+from chat.models import Conversation, Message, MessageBody, Role, Version
+
+
+@skipUnless(connection.vendor == "sqlite", "Reference counts are maintained by SQLite triggers")
+class MessageBodyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(name="user")
+        user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.conversation = Conversation.objects.create(title="Bodies", user=user)
+        cls.version = Version.objects.create(conversation=cls.conversation)
+
+    def _message(self, content, version=None):
+        return Message.objects.create(version=version or self.version, role=self.role, content=content)
+
+    def _ref_count(self, content):
+        body = MessageBody.objects.filter(pk=MessageBody.for_content(content).pk).first()
+        return body.ref_count if body else 0
+
+    def test_same_content_is_stored_once(self):
+        first = self._message("Hello")
+        second = self._message("Hello")
+
+        self.assertEqual(first.body_id, second.body_id)
+        self.assertEqual(MessageBody.objects.count(), 1)
+        self.assertEqual(self._ref_count("Hello"), 2)
+        self.assertEqual(Message.objects.get(pk=second.pk).content, "Hello")
+
+    def test_bulk_create_counts_references(self):
+        Message.objects.bulk_create(
+            [Message(version=self.version, role=self.role, content="Bulk", position=idx) for idx in range(3)]
+        )
+
+        self.assertEqual(self._ref_count("Bulk"), 3)
+
+    def test_delete_releases_body(self):
+        first = self._message("Hello")
+        second = self._message("Hello")
+
+        first.delete()
+        self.assertEqual(self._ref_count("Hello"), 1)
+        second.delete()
+        self.assertFalse(MessageBody.objects.exists())
+
+    def test_set_based_delete_releases_bodies(self):
+        for content in ("Hello", "Hello", "Bye"):
+            self._message(content)
+
+        Message.objects.filter(version=self.version).delete()
+
+        self.assertFalse(MessageBody.objects.exists())
+
+    def test_content_update_moves_reference(self):
+        message = self._message("Hello")
+        self._message("Bye")
+
+        message.content = "Bye"
+        message.save()
+
+        self.assertEqual(self._ref_count("Bye"), 2)
+        self.assertFalse(MessageBody.objects.filter(pk=MessageBody.for_content("Hello").pk).exists())
+
+    def test_referenced_body_cannot_be_deleted(self):
+        message = self._message("Hello")
+
+        with self.assertRaises(ProtectedError):
+            message.body.delete()
+
+    def test_new_version_shares_bodies(self):
+        root = self._message("Question")
+        self._message("Answer")
+        branch_point = self._message("Follow up")
+        self.conversation.active_version = self.version
+        self.conversation.save()
+
+        self.client.force_login(self.conversation.user)
+        response = self.client.post(
+            reverse("conversation_add_version", kwargs={"pk": self.conversation.pk}),
+            {"root_message_id": str(branch_point.pk)},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self._ref_count("Question"), 2)
+        self.assertEqual(self._ref_count("Follow up"), 1)
+        self.assertEqual(MessageBody.objects.count(), 3)
+        self.assertTrue(Message.objects.filter(body_id=root.body_id).exclude(pk=root.pk).exists())
+
+    def test_failed_insert_leaves_no_body(self):
+        self._message("Hello")
+
+        with self.assertRaises(IntegrityError):
+            Message.objects.create(version=self.version, role=self.role, content="Lost", position=0)
+
+        self.assertFalse(MessageBody.objects.filter(pk=MessageBody.for_content("Lost").pk).exists())
+
+
+class DatabaseVendorCheckTests(TestCase):
+    def test_other_databases_are_refused(self):
+        self.assertEqual(check_database_vendor(None), [])
+
+        with mock.patch.object(connection, "vendor", "postgresql"):
+            errors = check_database_vendor(None)
+
+        self.assertEqual([error.id for error in errors], ["chat.E001"])
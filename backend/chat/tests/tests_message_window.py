@@ -0,0 +1,94 @@
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from chat.benchmarks.generators import ConversationBuilder, make_deep_linear
+
+
+class VersionMessagesTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.other_user = CustomUser.objects.create(email="other@email.com", is_active=True)
+        cls.conversation = make_deep_linear(cls.mock_user, 25)
+        cls.version = cls.conversation.active_version
+
+    def setUp(self):
+        self.client.force_login(self.mock_user)
+        self.url = reverse("version_messages", kwargs={"pk": self.version.pk})
+
+    def test_returns_the_last_messages_oldest_first(self):
+        response = self.client.get(self.url, {"limit": 10})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m["position"] for m in response.data["messages"]], list(range(15, 25)))
+        self.assertEqual(response.data["previous_cursor"], 15)
+
+    def test_pages_backwards_to_the_first_message(self):
+        positions, cursor = [], None
+        while True:
+            params = {"limit": 10} if cursor is None else {"limit": 10, "before": cursor}
+            response = self.client.get(self.url, params)
+            positions = [m["position"] for m in response.data["messages"]] + positions
+            cursor = response.data["previous_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(positions, list(range(25)))
+
+    @override_settings(CHAT_MESSAGE_WINDOW=5, CHAT_MESSAGE_WINDOW_MAX=8)
+    def test_default_and_maximum_limit(self):
+        self.assertEqual(len(self.client.get(self.url).data["messages"]), 5)
+        self.assertEqual(len(self.client.get(self.url, {"limit": 100}).data["messages"]), 8)
+
+    def test_invalid_parameters(self):
+        for params in ({"limit": 0}, {"limit": "ten"}, {"before": -1}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_before_zero_is_an_empty_window(self):
+        response = self.client.get(self.url, {"before": 0})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["messages"], [])
+
+    def test_other_users_version(self):
+        self.client.force_login(self.other_user)
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class WindowedBranchedConversationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        builder = ConversationBuilder(cls.mock_user, "Windowed")
+        builder.append(builder.root, 10)
+        branch = builder.branch(builder.root, at_index=8, tail=1)
+        builder.branch(branch, at_index=2, tail=1)
+        cls.conversation = builder.save()
+
+    def setUp(self):
+        self.client.force_login(self.mock_user)
+        self.url = reverse("get_branched_conversation", kwargs={"pk": self.conversation.pk})
+
+    def test_versions_hold_the_tail_of_the_full_response(self):
+        full = self.client.get(self.url).data
+        windowed = self.client.get(self.url, {"last_messages": 4}).data
+
+        for full_version, windowed_version in zip(full["versions"], windowed["versions"]):
+            with self.subTest(version=full_version["id"]):
+                self.assertEqual(windowed_version["messages"], full_version["messages"][-4:])
+                self.assertEqual(windowed_version["previous_cursor"], max(len(full_version["messages"]) - 4, 0) or None)
+        self.assertNotIn("previous_cursor", full["versions"][0])
+
+    def test_branch_point_older_than_the_window(self):
+        windowed = self.client.get(self.url, {"last_messages": 1}).data
+
+        for version in windowed["versions"]:
+            self.assertEqual(len(version["messages"]), 1)
+
+    def test_invalid_window(self):
+        self.assertEqual(self.client.get(self.url, {"last_messages": "x"}).status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,323 @@
+import json
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+from uuid import uuid4
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.transaction import TransactionManagementError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from chat.models import Conversation, Message, MessageBody, Role, Version, VersionAncestry
+from chat.search import SQLiteFTS5Backend
+from chat.utils.bulk import insert_rows
+from chat.utils.ndjson import NDJSONImportError, export_conversations, import_conversations
+from chat.utils.sqlite import suspended_triggers
+
+
+def _snapshot() -> dict:
+    return {
+        "conversations": list(
+            Conversation.objects.order_by("id").values_list(
+                "id", "user__email", "title", "created_at", "modified_at", "deleted_at", "active_version_id"
+            )
+        ),
+        "versions": list(
+            Version.objects.order_by("id").values_list("id", "conversation_id", "parent_version_id", "root_message_id")
+        ),
+        "messages": list(
+            Message.objects.order_by("id").values_list(
+                "id", "version_id", "role__name", "body__content", "position", "created_at"
+            )
+        ),
+        "ancestry": sorted(VersionAncestry.objects.values_list("ancestor_id", "descendant_id", "depth")),
+    }
+
+
+class NDJSONRoundTripTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_conversations", users=2, conversations=8, seed=3, prefix="ndjson", stdout=StringIO())
+        Conversation.objects.filter(pk=Conversation.objects.order_by("id").first().pk).update(
+            deleted_at="2024-01-02T03:04:05Z"
+        )
+
+    def _export(self, **options) -> str:
+        stdout = StringIO()
+        call_command("export_conversations", stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def _clear(self):
+        Conversation.objects.all().delete()
+        self.assertFalse(Message.objects.exists())
+
+    def test_round_trip_keeps_ids_timestamps_and_trees(self):
+        before = _snapshot()
+        export = self._export(include_deleted=True)
+        self._clear()
+
+        stats = import_conversations(export.splitlines(), batch_size=25)
+
+        self.assertEqual(_snapshot(), before)
+        self.assertEqual(
+            stats,
+            {
+                "conversations": len(before["conversations"]),
+                "versions": len(before["versions"]),
+                "messages": len(before["messages"]),
+                "skipped": 0,
+            },
+        )
+        self.assertEqual(
+            list(MessageBody.objects.values_list("ref_count", flat=True).order_by("hash")),
+            [
+                Message.objects.filter(body_id=pk).count()
+                for pk in MessageBody.objects.values_list("pk", flat=True).order_by("hash")
+            ],
+        )
+
+    def test_export_skips_deleted_conversations_by_default(self):
+        records = [json.loads(line) for line in self._export().splitlines()]
+
+        self.assertEqual(records[0], {"type": "header", "format": "chat.conversations", "version": 1})
+        exported = [r["id"] for r in records if r["type"] == "conversation"]
+        self.assertEqual(len(exported), Conversation.objects.filter(deleted_at__isnull=True).count())
+
+    def test_export_groups_records_by_conversation(self):
+        records = [json.loads(line) for line in self._export(chunk_size=3).splitlines()[1:]]
+
+        conversation, versions = None, set()
+        for record in records:
+            if record["type"] == "conversation":
+                conversation, versions = record["id"], set()
+            elif record["type"] == "version":
+                self.assertEqual(record["conversation"], conversation)
+                versions.add(record["id"])
+            else:
+                self.assertIn(record["version"], versions)
+
+    def test_existing_conversations_are_skipped(self):
+        export = self._export()
+        count = Message.objects.count()
+
+        stats = import_conversations(export.splitlines())
+
+        self.assertEqual(stats["conversations"], 0)
+        self.assertEqual(stats["skipped"], Conversation.objects.filter(deleted_at__isnull=True).count())
+        self.assertEqual(Message.objects.count(), count)
+
+    def test_import_command_for_another_user(self):
+        export = self._export(user=["ndjson-0@example.com"])
+        self._clear()
+        other = CustomUser.objects.create(email="other@example.com", is_active=True)
+
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / "export.ndjson"
+            path.write_text(export)
+            call_command("import_conversations", str(path), user="other@example.com", stdout=StringIO())
+
+        self.assertTrue(Conversation.objects.exists())
+        self.assertEqual(set(Conversation.objects.values_list("user", flat=True)), {other.pk})
+
+    def test_imported_messages_are_searchable(self):
+        export = self._export()
+        word = Message.objects.filter(version__conversation__deleted_at__isnull=True).first().content.split()[0]
+        self._clear()
+
+        import_conversations(export.splitlines())
+
+        user = CustomUser.objects.get(email="ndjson-0@example.com")
+        self.assertTrue(SQLiteFTS5Backend().search(user, word, 5))
+
+
+class SuspendedTriggersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_conversations", users=1, conversations=1, seed=1, prefix="triggers", stdout=StringIO())
+        cls.message = Message.objects.first()
+
+    def _insert_copy(self, position=99):
+        insert_rows(
+            Message,
+            ["id", "version", "role", "body", "position", "created_at"],
+            [
+                (
+                    uuid4(),
+                    self.message.version_id,
+                    self.message.role_id,
+                    self.message.body_id,
+                    position,
+                    self.message.created_at,
+                )
+            ],
+        )
+
+    def _ref_count(self):
+        return MessageBody.objects.get(pk=self.message.body_id).ref_count
+
+    def test_triggers_run_by_default(self):
+        count = self._ref_count()
+        self._insert_copy()
+        self.assertEqual(self._ref_count(), count + 1)
+
+    def test_suspended_triggers_are_skipped(self):
+        count = self._ref_count()
+        with suspended_triggers():
+            self._insert_copy()
+        self.assertEqual(self._ref_count(), count)
+        self.assertFalse(connection.chat_triggers_suspended)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM chat_triggers_suspended")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_nested_blocks_keep_the_triggers_suspended(self):
+        count = self._ref_count()
+        with suspended_triggers():
+            with suspended_triggers():
+                self._insert_copy(97)
+            self._insert_copy(98)
+        self.assertEqual(self._ref_count(), count)
+        self._insert_copy()
+        self.assertEqual(self._ref_count(), count + 1)
+
+    def test_requires_a_transaction(self):
+        with mock.patch.object(connection, "in_atomic_block", False), self.assertRaises(TransactionManagementError):
+            with suspended_triggers():
+                pass
+
+    def test_triggers_call_no_app_functions(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND sql LIKE '%chat_triggers_enabled%'"
+            )
+            self.assertEqual(cursor.fetchall(), [])
+
+
+class NDJSONImportErrorTests(TestCase):
+    header = json.dumps({"type": "header", "format": "chat.conversations", "version": 1})
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+
+    def _import(self, *records):
+        return import_conversations([self.header, *(json.dumps(r) for r in records)], user=self.user)
+
+    def test_rejects_other_formats(self):
+        for lines in ([], ['{"type": "header", "format": "other"}'], ["not json"]):
+            with self.subTest(lines=lines), self.assertRaises(NDJSONImportError):
+                import_conversations(lines)
+
+    def test_rejects_links_outside_of_the_conversation(self):
+        conversation = {"type": "conversation", "id": "00000000-0000-0000-0000-000000000001", "title": "Imported"}
+        version = {
+            "type": "version",
+            "id": "00000000-0000-0000-0000-000000000002",
+            "conversation": conversation["id"],
+            "parent_version": "00000000-0000-0000-0000-000000000009",
+        }
+
+        with self.assertRaisesMessage(NDJSONImportError, "links to versions or messages outside of it"):
+            self._import(conversation, version)
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_reports_the_line_of_invalid_records(self):
+        with self.assertRaisesMessage(NDJSONImportError, "Line 2: invalid conversation record"):
+            self._import({"type": "conversation", "title": "No id"})
+
+    def test_rejects_unknown_roles(self):
+        conversation = {"type": "conversation", "id": "00000000-0000-0000-0000-000000000001", "title": "Imported"}
+        version = {"type": "version", "id": "00000000-0000-0000-0000-000000000002", "conversation": conversation["id"]}
+        message = {
+            "type": "message",
+            "id": "00000000-0000-0000-0000-000000000003",
+            "version": version["id"],
+            "role": "admin",
+            "content": "Hello",
+            "position": 0,
+        }
+
+        with self.assertRaisesMessage(NDJSONImportError, "Line 4: unknown role admin"):
+            self._import(conversation, version, message)
+        self.assertFalse(Role.objects.exists())
+
+    def test_command_reports_errors(self):
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / "export.ndjson"
+            path.write_text("{}\n")
+            with self.assertRaises(CommandError):
+                call_command("import_conversations", str(path), stdout=StringIO())
+
+
+@override_settings(CHAT_BODY_COMPRESSION_THRESHOLD=64)
+class NDJSONViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed_conversations", users=1, conversations=3, seed=5, prefix="ndjson", stdout=StringIO())
+        cls.user = CustomUser.objects.get(email="ndjson-0@example.com")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_export_then_import(self):
+        response = self.client.get(reverse("export_conversations"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        export = b"".join(response.streaming_content)
+        before = _snapshot()
+        Conversation.objects.all().delete()
+
+        response = self.client.post(reverse("import_conversations"), data=export, content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        self.assertEqual(response.data["conversations"], 3)
+        self.assertEqual(_snapshot(), before)
+
+    def test_invalid_import_is_rolled_back(self):
+        export = b"".join(self.client.get(reverse("export_conversations")).streaming_content)
+        Conversation.objects.all().delete()
+
+        response = self.client.post(
+            reverse("import_conversations"), data=export + b"garbage\n", content_type="application/x-ndjson"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("not valid JSON", response.data["detail"])
+        self.assertFalse(Conversation.objects.exists())
+
+    async def test_export_streams_over_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        pulled = []
+
+        def export(conversations):
+            for line in export_conversations(conversations):
+                pulled.append(line)
+                yield line
+
+        with mock.patch("chat.utils.ndjson.export_conversations", export), mock.patch(
+            "chat.views.EXPORT_STREAM_LINES", 10
+        ):
+            response = await self.async_client.get(reverse("export_conversations"))
+            chunks = aiter(response)
+            first = await anext(chunks)
+            self.assertEqual(len(pulled), 10)
+            rest = [chunk async for chunk in chunks]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(len(pulled), 10)
+        self.assertEqual(b"".join([first, *rest]).decode(), "".join(pulled))
+
+    def test_export_is_limited_to_the_user(self):
+        other = CustomUser.objects.create(email="other@example.com", is_active=True)
+        self.client.force_login(other)
+
+        export = b"".join(self.client.get(reverse("export_conversations")).streaming_content)
+
+        self.assertEqual(len(export.splitlines()), 1)
+        self.assertEqual(len(list(export_conversations(Conversation.objects.filter(user=other)))), 1)
@@ -0,0 +1,82 @@
+import os
+import pstats
+import tempfile
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from chat.benchmarks.generators import make_mixed
+
+
+def _server_timing(response) -> dict:
+    metrics = {}
+    for metric in response["Server-Timing"].split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+class ProfilingMiddlewareTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.mock_user.set_password("password")
+        cls.mock_user.save()
+        cls.conversation = make_mixed(cls.mock_user, 3)
+
+    def setUp(self):
+        is_logged_in = self.client.login(email="mock@email.com", password="password")
+        assert is_logged_in, "User login failed"
+
+        self.dump_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dump_dir.cleanup)
+        patcher = override_settings(PROFILING_ENABLED=True, PROFILING_DUMP_DIR=self.dump_dir.name)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def test_server_timing_header(self):
+        CustomUser.objects.filter(pk=self.mock_user.pk).update(is_staff=True)
+        response = self.client.get(reverse("get_branched_conversation", args=[self.conversation.id]))
+
+        metrics = _server_timing(response)
+        self.assertEqual(set(metrics), {"db", "serializer", "branching", "total"})
+        self.assertRegex(metrics["db"]["desc"], r'"\d+ queries"')
+        self.assertGreater(float(metrics["total"]["dur"]), float(metrics["branching"]["dur"]))
+        self.assertEqual(os.listdir(self.dump_dir.name), [])
+
+    def test_server_timing_header_requires_staff(self):
+        self.assertNotIn("Server-Timing", self.client.get(reverse("get_conversations")))
+
+        with override_settings(DEBUG=True):
+            self.assertIn("Server-Timing", self.client.get(reverse("get_conversations")))
+
+    @override_settings(PROFILING_LOG=True)
+    def test_structured_log(self):
+        with self.assertLogs("backend.profiling", level="INFO") as logs:
+            self.client.get(reverse("get_conversations"))
+
+        self.assertIn('"path": "/chat/conversations/"', logs.output[0])
+        self.assertIn('"queries": ', logs.output[0])
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_sampled_requests_are_profiled(self):
+        self.client.get(reverse("get_conversations"))
+
+        (dump,) = os.listdir(self.dump_dir.name)
+        stats = pstats.Stats(os.path.join(self.dump_dir.name, dump))
+        self.assertTrue(any(func[2] == "get_conversations" for func in stats.stats))
+
+    def test_profile_header_requires_staff(self):
+        self.client.get(reverse("get_conversations"), HTTP_X_PROFILE="1")
+        self.assertEqual(os.listdir(self.dump_dir.name), [])
+
+        CustomUser.objects.filter(pk=self.mock_user.pk).update(is_staff=True)
+        self.client.get(reverse("get_conversations"), HTTP_X_PROFILE="1")
+        self.assertEqual(len(os.listdir(self.dump_dir.name)), 1)
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(reverse("get_conversations"))
+        self.assertNotIn("Server-Timing", response)
@@ -0,0 +1,202 @@
+"""
+Query-count regression harness.
+
+Every route of `chat/urls.py` and `gpt/urls.py` is called once against a small and once against a large data set
+owned by the same user, and the number of SQL queries must be the same for both, so N+1 patterns (e.g. a serializer
+touching a relation per row) fail here before they reach production. A JSON report with the query counts and wall
+times per endpoint is written to `$QUERY_COUNT_REPORT` (default: `query_counts.json` in the temp directory).
+"""
+import json
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+import chat.urls
+import gpt.urls
+from authentication.models import CustomUser
+from chat.benchmarks.generators import make_deep_linear, make_mixed
+from chat.models import Conversation
+from src.utils.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from src.utils.gpt import GPT_VERSIONS, GPTVersion
+
+
+@dataclass
+class Fixture:
+    conversation: Conversation
+
+    @property
+    def version(self):
+        return self.conversation.active_version
+
+    @property
+    def last_user_message(self):
+        return self.version.messages.filter(role__name="user").last()
+
+
+@dataclass
+class RouteSpec:
+    method: str
+    kwargs: Callable[[Fixture], dict] = lambda fixture: {}
+    body: Optional[Callable[[Fixture], Union[dict, str]]] = None  # strings are sent as they are
+    expected_status: int = 200
+    query: str = ""
+
+
+CONVERSATION_PK = lambda fixture: {"pk": fixture.conversation.pk}  # noqa: E731
+MESSAGE = {"role": "user", "content": "Query count message"}
+IMPORT = "\n".join(
+    json.dumps(record)
+    for record in [
+        {"type": "header", "format": "chat.conversations", "version": 1},
+        {
+            "type": "conversation",
+            "id": "7b0f3c1e-3a52-4a4e-9a6a-0c6f4c1b2d01",
+            "title": "Imported",
+            "active_version": None,
+        },
+        {
+            "type": "version",
+            "id": "7b0f3c1e-3a52-4a4e-9a6a-0c6f4c1b2d02",
+            "conversation": "7b0f3c1e-3a52-4a4e-9a6a-0c6f4c1b2d01",
+        },
+        {
+            "type": "message",
+            "id": "7b0f3c1e-3a52-4a4e-9a6a-0c6f4c1b2d03",
+            "version": "7b0f3c1e-3a52-4a4e-9a6a-0c6f4c1b2d02",
+        }
+        | MESSAGE
+        | {"position": 0},
+    ]
+)
+GPT_CONVERSATION = {"conversation": [{"role": "user", "content": "Hi"}], "model": "gpt35"}
+
+# Keyed by "<app>:<route pattern>"; every route must have an entry.
+ROUTE_SPECS = {
+    "chat:": RouteSpec("get"),
+    "chat:conversations/": RouteSpec("get"),
+    "chat:conversations/summaries/": RouteSpec("get"),
+    "chat:conversations_branched/": RouteSpec("get"),
+    "chat:conversation_branched/<uuid:pk>/": RouteSpec("get", CONVERSATION_PK),
+    "chat:conversations/add/": RouteSpec(
+        "post", body=lambda fixture: {"title": "New", "messages": [MESSAGE, MESSAGE]}, expected_status=201
+    ),
+    "chat:conversations/export/": RouteSpec("get"),
+    "chat:conversations/import/": RouteSpec("post", body=lambda fixture: IMPORT, expected_status=201),
+    "chat:conversations/<uuid:pk>/": RouteSpec("get", CONVERSATION_PK),
+    "chat:conversations/<uuid:pk>/change_title/": RouteSpec(
+        "put", CONVERSATION_PK, lambda fixture: {"title": "Renamed"}, 204
+    ),
+    "chat:conversations/<uuid:pk>/add_message/": RouteSpec("post", CONVERSATION_PK, lambda fixture: MESSAGE, 201),
+    "chat:conversations/<uuid:pk>/add_version/": RouteSpec(
+        "post", CONVERSATION_PK, lambda fixture: {"root_message_id": str(fixture.last_user_message.id)}, 201
+    ),
+    "chat:conversations/<uuid:pk>/switch_version/<uuid:version_id>/": RouteSpec(
+        "put",
+        lambda fixture: {"pk": fixture.conversation.pk, "version_id": fixture.conversation.versions.first().pk},
+        expected_status=204,
+    ),
+    "chat:conversations/<uuid:pk>/delete/": RouteSpec("put", CONVERSATION_PK, expected_status=204),
+    "chat:versions/<uuid:pk>/add_message/": RouteSpec(
+        "post", lambda fixture: {"pk": fixture.version.pk}, lambda fixture: MESSAGE, 201
+    ),
+    "chat:versions/<uuid:pk>/messages/": RouteSpec("get", lambda fixture: {"pk": fixture.version.pk}),
+    "chat:search/": RouteSpec("get", query="q=message"),
+    "chat:sync/": RouteSpec("get", query="since=0"),
+    "gpt:": RouteSpec("get"),
+    "gpt:title/": RouteSpec("post", body=lambda fixture: {"user_question": "Hi", "chatbot_response": "Hello"}),
+    "gpt:question/": RouteSpec("post", body=lambda fixture: {"user_question": "Hi"}),
+    "gpt:conversation/": RouteSpec("post", body=lambda fixture: GPT_CONVERSATION),
+    "gpt:circuit_breaker/": RouteSpec("get"),
+    "gpt:scheduler/": RouteSpec("get"),
+}
+
+PREFIXES = {"chat": "/chat/", "gpt": "/gpt/"}
+ROUTES = [("chat", pattern) for pattern in chat.urls.urlpatterns] + [
+    ("gpt", pattern) for pattern in gpt.urls.urlpatterns
+]
+
+
+def _route_key(app: str, pattern) -> str:
+    return f"{app}:{pattern.pattern}"
+
+
+class QueryCountTests(APITestCase):
+    report: dict = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        # Staff, so the operational state routes answer too
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True, is_staff=True)
+        cls.mock_user.set_password("password")
+        cls.mock_user.save()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        path = os.environ.get("QUERY_COUNT_REPORT", os.path.join(tempfile.gettempdir(), "query_counts.json"))
+        with open(path, "w") as f:
+            json.dump(cls.report, f, indent=2, sort_keys=True)
+
+    def setUp(self):
+        is_logged_in = self.client.login(email="mock@email.com", password="password")
+        assert is_logged_in, "User login failed"
+
+        self.server = FakeOpenAIServer(FakeOpenAIConfig(reply="Hello there")).start()
+        self.addCleanup(self.server.stop)
+        version = GPTVersion("gpt35", "fake-engine", api_base=self.server.url, api_key="test", api_type="open_ai")
+        patcher = mock.patch.dict(GPT_VERSIONS, {"gpt35": version})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _small_fixture(self) -> Fixture:
+        return Fixture(make_mixed(self.mock_user, 1))
+
+    def _large_fixture(self) -> Fixture:
+        for _ in range(3):
+            make_mixed(self.mock_user, 10)
+        make_deep_linear(self.mock_user, 60)
+        return Fixture(make_mixed(self.mock_user, 15))
+
+    def _measure(self, app: str, pattern, spec: RouteSpec, make_fixture: Callable[[], Fixture]) -> dict:
+        with transaction.atomic():
+            fixture = make_fixture()
+            kwargs = spec.kwargs(fixture)
+            path = PREFIXES[app] + re.sub(r"<(?:\w+:)?(\w+)>", lambda m: str(kwargs[m.group(1)]), str(pattern.pattern))
+            path += f"?{spec.query}" if spec.query else ""
+            body = spec.body(fixture) if spec.body else None
+            body = json.dumps(body) if isinstance(body, dict) else body
+
+            with CaptureQueriesContext(connection) as queries:
+                started_at = time.perf_counter()
+                response = getattr(self.client, spec.method)(path, data=body, content_type="application/json")
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                elapsed = time.perf_counter() - started_at
+
+            self.assertEqual(response.status_code, spec.expected_status, f"{spec.method.upper()} {path}")
+            transaction.set_rollback(True)
+        return {"queries": len(queries), "ms": round(elapsed * 1000, 2)}
+
+    def test_every_route_has_a_spec(self):
+        missing = [_route_key(app, pattern) for app, pattern in ROUTES if _route_key(app, pattern) not in ROUTE_SPECS]
+        self.assertEqual(missing, [], "Add a RouteSpec for new routes")
+
+    def test_query_counts_do_not_grow_with_data(self):
+        for app, pattern in ROUTES:
+            key = _route_key(app, pattern)
+            spec = ROUTE_SPECS.get(key)
+            if spec is None:
+                continue
+            with self.subTest(route=key):
+                small = self._measure(app, pattern, spec, self._small_fixture)
+                large = self._measure(app, pattern, spec, self._large_fixture)
+                self.report[key] = {"method": spec.method.upper(), "small": small, "large": large}
+                self.assertEqual(small["queries"], large["queries"], f"{key} issues more queries on more data")
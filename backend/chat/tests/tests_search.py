@@ -0,0 +1,163 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from chat.models import Conversation, Message, Role, Version
+from chat.search import ContainsSearchBackend, SQLiteFTS5Backend, get_backend
+
+
+class SearchFixtureMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_role = Role.objects.create(name="user")
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.other_user = CustomUser.objects.create(email="other@email.com", is_active=True)
+
+        cls.conversation = Conversation.objects.create(title="Deployments", user=cls.mock_user)
+        cls.version = Version.objects.create(conversation=cls.conversation)
+        cls.message = cls._message(cls.version, "How do I deploy Django behind nginx?")
+        cls._message(cls.version, "Use gunicorn and proxy_pass to the socket.")
+        cls.conversation.active_version = cls.version
+        cls.conversation.save()
+
+    @classmethod
+    def _message(cls, version, content):
+        return Message.objects.create(version=version, role=cls.user_role, content=content)
+
+
+class SearchBackendTestsMixin(SearchFixtureMixin):
+    backend_class = None
+
+    def setUp(self):
+        self.backend = self.backend_class()
+
+    def _search(self, query, user=None):
+        return [hit.message_id for hit in self.backend.search(user or self.mock_user, query, 10)]
+
+    def test_finds_messages(self):
+        hits = self.backend.search(self.mock_user, "django nginx", 10)
+
+        self.assertEqual([hit.message_id for hit in hits], [self.message.id])
+        self.assertEqual(hits[0].conversation_id, self.conversation.id)
+        self.assertEqual(hits[0].conversation_title, "Deployments")
+        self.assertIn("<mark>", hits[0].snippet)
+
+    def test_prefix_of_the_last_word(self):
+        self.assertEqual(self._search("deplo"), [self.message.id])
+
+    def test_only_the_users_conversations(self):
+        self.assertEqual(self._search("django", user=self.other_user), [])
+
+    def test_skips_deleted_conversations(self):
+        Conversation.objects.filter(pk=self.conversation.pk).update(deleted_at=timezone.now())
+
+        self.assertEqual(self._search("django"), [])
+
+    def test_only_active_versions(self):
+        branch = Version.objects.create(conversation=self.conversation, parent_version=self.version)
+        copy = self._message(branch, "How do I deploy Django behind nginx?")
+
+        self.assertEqual(self._search("django"), [self.message.id])
+        Conversation.objects.filter(pk=self.conversation.pk).update(active_version=branch)
+        self.assertEqual(self._search("django"), [copy.id])
+
+    def test_snippets_are_escaped(self):
+        self._message(self.version, "<script>alert('django')</script>")
+
+        snippets = [hit.snippet for hit in self.backend.search(self.mock_user, "alert", 10)]
+        self.assertEqual(len(snippets), 1)
+        self.assertNotIn("<script>", snippets[0])
+        self.assertIn("<mark>alert</mark>", snippets[0])
+
+    def test_query_syntax_is_not_interpreted(self):
+        for query in ['"django', "django OR", "content:django", "*", "NEAR(django"]:
+            with self.subTest(query=query):
+                self.backend.search(self.mock_user, query, 10)
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5 is SQLite only")
+class SQLiteFTS5BackendTests(SearchBackendTestsMixin, APITestCase):
+    backend_class = SQLiteFTS5Backend
+
+    def test_sync_on_update_and_delete(self):
+        self.message.content = "How do I deploy Flask?"
+        self.message.save()
+        self.assertEqual(self._search("django"), [])
+        self.assertEqual(self._search("flask"), [self.message.id])
+
+        Message.objects.filter(pk=self.message.pk).delete()
+        self.assertEqual(self._search("flask"), [])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM chat_message_search")
+            self.assertEqual(cursor.fetchone()[0], Message.objects.count())
+
+    def test_bulk_created_messages_are_indexed(self):
+        Message.objects.bulk_create(
+            [Message(version=self.version, role=self.user_role, content="Bulk kubernetes", position=5)]
+        )
+
+        self.assertEqual(len(self._search("kubernetes")), 1)
+
+    def test_ranks_better_matches_first(self):
+        better = self._message(self.version, "django django django")
+
+        self.assertEqual(self._search("django")[0], better.id)
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM chat_message_fts")
+        self.assertEqual(self._search("django"), [])
+
+        progress = []
+        self.assertEqual(self.backend.rebuild(batch_size=1, progress=lambda *args: progress.append(args)), 2)
+
+        self.assertEqual(self._search("django"), [self.message.id])
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM chat_message_fts")
+
+        call_command("rebuild_search_index", stdout=StringIO())
+
+        self.assertEqual(self._search("django"), [self.message.id])
+
+
+class ContainsSearchBackendTests(SearchBackendTestsMixin, APITestCase):
+    backend_class = ContainsSearchBackend
+
+    def test_needs_no_sql_functions(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._search("django"), [self.message.id])
+
+        self.assertNotIn("chat_body_text", " ".join(query["sql"] for query in queries))
+
+
+class SearchViewTests(SearchFixtureMixin, APITestCase):
+    def setUp(self):
+        self.client.force_login(self.mock_user)
+
+    def test_search(self):
+        response = self.client.get(reverse("search_messages"), {"q": "nginx"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([hit["message_id"] for hit in response.data["results"]], [str(self.message.id)])
+
+    def test_missing_query(self):
+        self.assertEqual(self.client.get(reverse("search_messages")).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(CHAT_SEARCH_BACKEND="chat.search.ContainsSearchBackend")
+    def test_backend_setting(self):
+        get_backend.cache_clear()
+        self.addCleanup(get_backend.cache_clear)
+
+        self.assertIsInstance(get_backend(), ContainsSearchBackend)
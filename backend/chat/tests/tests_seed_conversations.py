@@ -0,0 +1,65 @@
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from authentication.models import CustomUser
+from chat.models import Change, Conversation, Message, MessageBody, Version
+from chat.search import SQLiteFTS5Backend
+from chat.utils.counters import reconcile_counters
+
+
+class SeedConversationsTests(TestCase):
+    def _seed(self, **options):
+        options = {"users": 3, "conversations": 12, "batch-size": 50, "seed": 7, **options}
+        args = [f"--{name}={value}" for name, value in options.items()]
+        call_command("seed_conversations", *args, stdout=StringIO())
+
+    def test_seeds_users_and_conversation_trees(self):
+        self._seed()
+
+        users = CustomUser.objects.filter(email__startswith="seed-")
+        self.assertEqual(users.count(), 3)
+        self.assertTrue(all(user.is_active and user.check_password("seed-password") for user in users))
+        self.assertEqual(Conversation.objects.count(), 12)
+        self.assertEqual(set(Conversation.objects.values_list("user__email", flat=True)), set(u.email for u in users))
+
+        for conversation in Conversation.objects.all():
+            self.assertEqual(conversation.active_version.conversation_id, conversation.id)
+            self.assertTrue(conversation.active_version.messages.exists())
+        for version in Version.objects.filter(parent_version__isnull=False):
+            self.assertEqual(version.root_message.version_id, version.parent_version_id)
+
+    def test_same_seed_gives_same_rows(self):
+        self._seed()
+        first = list(Message.objects.order_by("id").values_list("id", "body__content", "created_at"))
+        Conversation.objects.all().delete()
+
+        self._seed()
+
+        self.assertEqual(list(Message.objects.order_by("id").values_list("id", "body__content", "created_at")), first)
+        self.assertEqual(CustomUser.objects.filter(email__startswith="seed-").count(), 3)
+
+    @skipUnless(connection.vendor == "sqlite", "the triggers are SQLite only")
+    def test_derived_data_is_maintained(self):
+        self._seed()
+
+        self.assertEqual(sum(stats["repaired"] for stats in reconcile_counters(dry_run=True)), 0)
+        self.assertEqual(
+            list(MessageBody.objects.values_list("ref_count", flat=True).order_by("hash")),
+            [
+                Message.objects.filter(body_id=pk).count()
+                for pk in MessageBody.objects.values_list("pk", flat=True).order_by("hash")
+            ],
+        )
+        self.assertEqual(
+            set(Change.objects.values_list("conversation_id", flat=True)),
+            set(Conversation.objects.values_list("id", flat=True)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM chat_message_fts")
+            self.assertEqual(cursor.fetchone()[0], Message.objects.count())
+        message = Message.objects.select_related("version__conversation__user").first()
+        self.assertTrue(SQLiteFTS5Backend().search(message.version.conversation.user, message.content.split()[0], 5))
@@ -0,0 +1,171 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from chat.models import Change, Conversation, Message, Role, Version
+from chat.utils.changes import changes_since
+from chat.utils.deletion import delete_conversations, delete_versions, purge_deleted_conversations
+from chat.utils.ndjson import export_conversations, import_conversations
+
+
+class ChangeFeedTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_role = Role.objects.create(name="user")
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.other_user = CustomUser.objects.create(email="other@email.com", is_active=True)
+
+        cls.conversation = Conversation.objects.create(title="Sync", user=cls.mock_user)
+        cls.version = Version.objects.create(conversation=cls.conversation)
+        cls.message = Message.objects.create(version=cls.version, role=cls.user_role, content="First")
+        cls.conversation.active_version = cls.version
+        cls.conversation.save()
+        cls.other = Conversation.objects.create(title="Not mine", user=cls.other_user)
+
+    def _revision(self):
+        return changes_since(self.mock_user)["revision"]
+
+    def test_everything_on_the_first_sync(self):
+        changes = changes_since(self.mock_user)
+
+        self.assertFalse(changes["more"])
+        self.assertEqual(changes["conversations"], [self.conversation])
+        self.assertEqual(changes["versions"], [self.version])
+        self.assertEqual(changes["messages"], [self.message])
+        self.assertEqual(changes["deleted_conversations"], [])
+
+    def test_only_the_changes_since_the_revision(self):
+        revision = self._revision()
+        message = Message.objects.create(version=self.version, role=self.user_role, content="Second")
+        self.message.content = "Edited"
+        self.message.save()
+
+        changes = changes_since(self.mock_user, revision)
+
+        self.assertGreater(changes["revision"], revision)
+        self.assertEqual(changes["versions"], [])
+        self.assertEqual([m.pk for m in changes["messages"]], [self.message.pk, message.pk])
+        self.assertEqual(changes_since(self.mock_user, changes["revision"])["messages"], [])
+
+    def test_other_users_changes_are_not_visible(self):
+        Version.objects.create(conversation=self.other)
+
+        changes = changes_since(self.mock_user)
+
+        self.assertNotIn(self.other, changes["conversations"])
+        self.assertEqual(len(changes["versions"]), 1)
+
+    def test_paging(self):
+        for i in range(4):
+            Message.objects.create(version=self.version, role=self.user_role, content=f"Message {i}")
+
+        seen, revision, more = [], 0, True
+        while more:
+            changes = changes_since(self.mock_user, revision, limit=2)
+            revision, more = changes["revision"], changes["more"]
+            seen += changes["messages"]
+
+        self.assertEqual(len(seen), 5)
+
+    def test_soft_delete_is_a_deletion(self):
+        revision = self._revision()
+        self.conversation.deleted_at = timezone.now()
+        self.conversation.save()
+
+        changes = changes_since(self.mock_user, revision)
+
+        self.assertEqual(changes["conversations"], [])
+        self.assertEqual(changes["deleted_conversations"], [self.conversation.pk])
+
+    def test_hard_delete_leaves_one_tombstone(self):
+        revision = self._revision()
+        delete_conversations([self.conversation.pk])
+
+        changes = changes_since(self.mock_user, revision)
+
+        self.assertEqual(changes["deleted_conversations"], [self.conversation.pk])
+        self.assertEqual(Change.objects.filter(conversation_id=self.conversation.pk).count(), 1)
+
+    def test_collector_delete_leaves_one_tombstone(self):
+        revision = self._revision()
+        Conversation.objects.get(pk=self.conversation.pk).delete()
+
+        changes = changes_since(self.mock_user, revision)
+
+        self.assertEqual(changes["deleted_conversations"], [self.conversation.pk])
+        self.assertEqual(Change.objects.filter(conversation_id=self.conversation.pk).count(), 1)
+
+    def test_deleted_versions(self):
+        branch = Version.objects.create(conversation=self.conversation, parent_version=self.version)
+        message = Message.objects.create(version=branch, role=self.user_role, content="Branch")
+        revision = self._revision()
+
+        delete_versions([branch.pk])
+
+        changes = changes_since(self.mock_user, revision)
+        self.assertEqual(changes["deleted_versions"], [branch.pk])
+        self.assertFalse(Change.objects.filter(object_id=message.pk).exists())
+
+    def test_purge(self):
+        Conversation.objects.filter(pk=self.conversation.pk).update(deleted_at=timezone.now() - timedelta(days=40))
+
+        list(purge_deleted_conversations(timedelta(days=30)))
+
+        self.assertEqual(changes_since(self.mock_user)["deleted_conversations"], [self.conversation.pk])
+
+    def test_deleting_the_user(self):
+        CustomUser.objects.get(pk=self.mock_user.pk).delete()
+
+        # The foreign keys are deferred to the commit, which never comes in a test
+        connection.check_constraints()
+        self.assertFalse(Change.objects.filter(user_id=self.mock_user.pk).exists())
+
+    def test_imports_are_logged(self):
+        export = "".join(export_conversations(Conversation.objects.filter(pk=self.conversation.pk)))
+        delete_conversations([self.conversation.pk])
+        revision = self._revision()
+
+        import_conversations(export.splitlines(), user=self.mock_user)
+
+        changes = changes_since(self.mock_user, revision)
+        self.assertEqual([c.pk for c in changes["conversations"]], [self.conversation.pk])
+        self.assertEqual([m.pk for m in changes["messages"]], [self.message.pk])
+
+
+class SyncViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.conversation = Conversation.objects.create(title="Sync", user=cls.mock_user)
+
+    def setUp(self):
+        self.client.force_login(self.mock_user)
+
+    def test_sync(self):
+        response = self.client.get(reverse("sync_changes"), {"since": 0})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c["id"] for c in response.data["conversations"]], [str(self.conversation.pk)])
+        self.assertGreater(response.data["revision"], 0)
+
+        response = self.client.get(reverse("sync_changes"), {"since": response.data["revision"]})
+        self.assertEqual(response.data["conversations"], [])
+
+    def test_since_time(self):
+        response = self.client.get(reverse("sync_changes"), {"since_time": timezone.now().isoformat()})
+        self.assertEqual(response.data["conversations"], [])
+
+        before = (timezone.now() - timedelta(minutes=1)).isoformat()
+        response = self.client.get(reverse("sync_changes"), {"since_time": before})
+        self.assertEqual(len(response.data["conversations"]), 1)
+
+    def test_invalid_parameters(self):
+        for query in ({"since": "x"}, {"since_time": "yesterday"}, {"since_time": "2024-13-01T00:00"}, {"limit": 0}):
+            with self.subTest(query=query):
+                response = self.client.get(reverse("sync_changes"), query)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -5,9 +5,12 @@ from chat import views
 urlpatterns = [
     path("", views.chat_root_view, name="chat_root_view"),
     path("conversations/", views.get_conversations, name="get_conversations"),
+    path("conversations/summaries/", views.get_conversation_summaries, name="get_conversation_summaries"),
     path("conversations_branched/", views.get_conversations_branched, name="get_branched_conversations"),
     path("conversation_branched/<uuid:pk>/", views.get_conversation_branched, name="get_branched_conversation"),
     path("conversations/add/", views.add_conversation, name="add_conversation"),
+    path("conversations/export/", views.export_conversations, name="export_conversations"),
+    path("conversations/import/", views.import_conversations, name="import_conversations"),
     path("conversations/<uuid:pk>/", views.conversation_manage, name="conversation_manage"),
     path("conversations/<uuid:pk>/change_title/", views.conversation_change_title, name="conversation_change_title"),
     path("conversations/<uuid:pk>/add_message/", views.conversation_add_message, name="conversation_add_message"),
@@ -19,4 +22,7 @@ urlpatterns = [
     ),
     path("conversations/<uuid:pk>/delete/", views.conversation_soft_delete, name="conversation_delete"),
     path("versions/<uuid:pk>/add_message/", views.version_add_message, name="version_add_message"),
+    path("versions/<uuid:pk>/messages/", views.version_messages, name="version_messages"),
+    path("search/", views.search_messages, name="search_messages"),
+    path("sync/", views.sync_changes, name="sync_changes"),
 ]
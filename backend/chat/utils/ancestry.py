@@ -0,0 +1,48 @@
+"""
+Ancestry queries on the version tree, each a single lookup in the `VersionAncestry` closure table instead of a walk
+along `parent_version` links.
+"""
+from django.db.models import Exists, OuterRef, QuerySet
+
+from chat.models import Message, Version, VersionAncestry
+
+__all__ = ["ancestors", "descendants", "is_descendant", "path_from_root", "versions_sharing"]
+
+
+def ancestors(version: Version, include_self: bool = False) -> QuerySet:
+    """The ancestors of a version, nearest first."""
+    min_depth = 0 if include_self else 1
+    versions = Version.objects.filter(descendant_links__descendant=version, descendant_links__depth__gte=min_depth)
+    return versions.order_by("descendant_links__depth")
+
+
+def path_from_root(version: Version) -> QuerySet:
+    """The versions from the root of the tree down to, and including, this version."""
+    return ancestors(version, include_self=True).reverse()
+
+
+def descendants(version: Version, include_self: bool = False) -> QuerySet:
+    """The subtree below a version, closest first."""
+    min_depth = 0 if include_self else 1
+    versions = Version.objects.filter(ancestor_links__ancestor=version, ancestor_links__depth__gte=min_depth)
+    return versions.order_by("ancestor_links__depth")
+
+
+def is_descendant(version: Version, ancestor: Version) -> bool:
+    return VersionAncestry.objects.filter(ancestor=ancestor, descendant=version, depth__gte=1).exists()
+
+
+def versions_sharing(message: Message) -> QuerySet:
+    """
+    The versions holding a copy of a message: its own version and every descendant that did not branch off at or
+    before the message on the way down.
+    """
+    # A version on the path from the message's version (excluded) down to the candidate (included) whose root
+    # message sits at or before the message's position
+    branched_before = VersionAncestry.objects.filter(
+        ancestor__ancestor_links__ancestor_id=message.version_id,
+        ancestor__ancestor_links__depth__gte=1,
+        ancestor__root_message__position__lte=message.position,
+        descendant=OuterRef("pk"),
+    )
+    return descendants(message.version, include_self=True).exclude(Exists(branched_before))
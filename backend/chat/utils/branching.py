@@ -1,14 +1,15 @@
 from bisect import insort
 from collections import OrderedDict
-from itertools import zip_longest
 from operator import itemgetter
 from typing import Optional
 
+from backend.profiling import timed_function
 from chat.serializers import VersionTimeIdSerializer
 
 __all__ = ["make_branched_conversation"]
 
 
+@timed_function("branching")
 def make_branched_conversation(conversation_data: OrderedDict, calculate_chains: bool = True) -> None:
     """
     Modifies the input conversation_data dictionary in-place to include versioning information for each message in the
@@ -89,6 +90,11 @@ def _get_branching_messages(curr_version: OrderedDict, parent_version: OrderedDi
     """
     Fetches the branching messages between a current version and its parent version.
 
+    The messages are aligned by the position of the current version's root message, which also works for versions
+    that only hold a window of their last messages; an empty OrderedDict is returned for a version whose window starts
+    after that position. Data without positions falls back to comparing the contents of both versions message by
+    message.
+
     Parameters
     ----------
     curr_version : OrderedDict
@@ -105,6 +111,12 @@ def _get_branching_messages(curr_version: OrderedDict, parent_version: OrderedDi
     curr_version_root_msg = str(curr_version["root_message"])
     parent_messages = parent_version["messages"]
 
+    position = curr_version.get("root_position")
+    if position is not None:
+        curr_branch_msg = next((m for m in current_messages if m["position"] == position), OrderedDict())
+        parent_branch_msg = next((m for m in parent_messages if m["position"] == position), OrderedDict())
+        return curr_branch_msg, parent_branch_msg
+
     msg_enumerable = zip(current_messages, parent_messages)
     n = min(len(current_messages), len(parent_messages))
     for idx in range(n - 1):
@@ -192,9 +204,11 @@ def _make_branched_conversation_chains(conversation_data: OrderedDict) -> None:
         The conversation data.
     """
     versions = [v for v in conversation_data["versions"]]
-    zipped_messages = list(zip_longest(*[v["messages"] for v in versions], fillvalue=OrderedDict()))
+    # Rows are aligned by position, as windowed versions only hold their last messages
+    messages_by_position = [{m.get("position", idx): m for idx, m in enumerate(v["messages"])} for v in versions]
 
-    for idx, row in enumerate(zipped_messages):
+    for position in sorted(set().union(*messages_by_position)):
+        row = [messages.get(position, OrderedDict()) for messages in messages_by_position]
         # if at least there are two OrderedDicts which are not empty
         candidate_cells = [c for c in row if c and c.get("versions", [])]
         if len(candidate_cells) >= 1:
@@ -206,9 +220,10 @@ def _make_branched_conversation_chains(conversation_data: OrderedDict) -> None:
                 replacement_data = id_version_chain_matches.pop()
                 replacement_id = replacement_data["id"]
                 replacement_chain = replacement_data["chain"]
-                for v_idx, version in enumerate(versions):
-                    if idx < len(version["messages"]) and version["messages"][idx]["id"] == replacement_id:
-                        conversation_data["versions"][v_idx]["messages"][idx]["versions"] = replacement_chain
+                for messages in messages_by_position:
+                    message = messages.get(position)
+                    if message is not None and message["id"] == replacement_id:
+                        message["versions"] = replacement_chain
                         break
 
 
@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Sequence
+
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.db.models.constants import OnConflict
+
+__all__ = ["insert_rows", "parameter_list", "preserved_timestamps"]
+
+
+@contextmanager
+def preserved_timestamps(*model_classes: type[models.Model]) -> Iterator[None]:
+    """
+    Temporarily disables `auto_now` / `auto_now_add` on the given models so that rows written with `bulk_create` or
+    `bulk_update` keep the timestamps set on the instances instead of being stamped with the current time.
+
+    Meant for commands (seeding, imports, benchmarks); the flags are process-wide, so avoid it in request handlers.
+    """
+    fields = [
+        field
+        for model_class in model_classes
+        for field in model_class._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def insert_rows(
+    model_class: type[models.Model],
+    fields: Sequence[str],
+    rows: Iterable[Sequence],
+    ignore_conflicts: bool = False,
+    using: str = DEFAULT_DB_ALIAS,
+) -> None:
+    """
+    Inserts plain tuples of field values with a single `executemany`, for bulk writers where `bulk_create` is the
+    bottleneck: no model instances, no `pre_save` (so timestamps are written as given) and no signals. Values are
+    still converted by their fields, e.g. UUIDs, datetimes and compressed text.
+    """
+    connection = connections[using]
+    fields = [model_class._meta.get_field(name) for name in fields]
+    on_conflict = OnConflict.IGNORE if ignore_conflicts else None
+    sql = "%s %s (%s) VALUES (%s) %s" % (
+        connection.ops.insert_statement(on_conflict=on_conflict),
+        connection.ops.quote_name(model_class._meta.db_table),
+        ", ".join(connection.ops.quote_name(field.column) for field in fields),
+        parameter_list(fields),
+        connection.ops.on_conflict_suffix_sql(fields, on_conflict, None, None),
+    )
+    params = [[field.get_db_prep_save(value, connection) for field, value in zip(fields, row)] for row in rows]
+    if params:
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+
+def parameter_list(values: Sequence) -> str:
+    """The `%s, %s, ...` placeholders of `values`, for raw `IN (...)` and `VALUES (...)` lists."""
+    return ", ".join(["%s"] * len(values))
@@ -0,0 +1,111 @@
+"""
+The change feed behind delta sync.
+
+`chat_change` (the `Change` model) holds the latest change of every conversation, version and message with a
+revision from an AUTOINCREMENT key, so revisions only ever grow and are never reused. Triggers on the three tables
+replace the row of an object on every insert, update and delete (see `chat/migrations/0011_change_log_user_deletes.py`).
+A client that has seen revision R therefore gets everything it is missing from the rows above R, and the log only
+grows with the number of objects, not with the number of changes.
+
+Deletions leave a tombstone row (`deleted`). A version tombstone stands for the messages of the version, and a
+conversation tombstone for everything in the conversation. Soft-deleted conversations are logged as deleted as well.
+
+Like the reference count and search triggers, these are skipped inside `suspended_triggers()`; bulk writers log their
+changes with `record_conversations`, `record_deleted_versions` and `record_deleted_conversations` instead.
+"""
+from datetime import datetime
+from typing import Optional
+
+from chat.models import Change, Conversation, Message, Version
+from chat.utils.bulk import parameter_list
+
+__all__ = ["changes_since", "record_conversations", "record_deleted_conversations", "record_deleted_versions"]
+
+# Every statement has parameters, so "%" is escaped
+_NOW = "strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now')"
+_COLUMNS = "chat_change (user_id, conversation_id, kind, object_id, deleted, changed_at)"
+_FROM_VERSIONS = (
+    "FROM chat_version AS version JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id"
+)
+
+
+def record_conversations(cursor, conversation_ids: list) -> None:
+    """Logs the conversations, with all of their versions and messages, as changed. Ids in their database form."""
+    if not conversation_ids:
+        return
+    placeholders = parameter_list(conversation_ids)
+    for statement in (
+        f"SELECT user_id, id, 'conversation', id, deleted_at IS NOT NULL, {_NOW} "
+        f"FROM chat_conversation WHERE id IN ({placeholders})",
+        f"SELECT conversation.user_id, conversation.id, 'version', version.id, 0, {_NOW} {_FROM_VERSIONS} "
+        f"WHERE version.conversation_id IN ({placeholders})",
+        f"SELECT conversation.user_id, conversation.id, 'message', message.id, 0, {_NOW} "
+        "FROM chat_message AS message "
+        "JOIN chat_version AS version ON version.id = message.version_id "
+        "JOIN chat_conversation AS conversation ON conversation.id = version.conversation_id "
+        f"WHERE version.conversation_id IN ({placeholders})",
+    ):
+        cursor.execute(f"INSERT OR REPLACE INTO {_COLUMNS} {statement}", conversation_ids)
+
+
+def record_deleted_versions(cursor, versions: str, params: list) -> None:
+    """Leaves tombstones for the versions of the `versions` list or subquery, which replace those of their messages."""
+    cursor.execute(
+        f"DELETE FROM chat_change WHERE object_id IN (SELECT id FROM chat_message WHERE version_id IN ({versions}))",
+        params,
+    )
+    cursor.execute(
+        f"INSERT OR REPLACE INTO {_COLUMNS} "
+        f"SELECT conversation.user_id, conversation.id, 'version', version.id, 1, {_NOW} {_FROM_VERSIONS} "
+        f"WHERE version.id IN ({versions})",
+        params,
+    )
+
+
+def record_deleted_conversations(cursor, conversation_ids: list) -> None:
+    """Leaves one tombstone per conversation in place of everything logged for it."""
+    if not conversation_ids:
+        return
+    placeholders = parameter_list(conversation_ids)
+    cursor.execute(f"DELETE FROM chat_change WHERE conversation_id IN ({placeholders})", conversation_ids)
+    cursor.execute(
+        f"INSERT INTO {_COLUMNS} SELECT user_id, id, 'conversation', id, 1, {_NOW} "
+        f"FROM chat_conversation WHERE id IN ({placeholders})",
+        conversation_ids,
+    )
+
+
+def changes_since(user, revision: int = 0, changed_after: Optional[datetime] = None, limit: int = 500) -> dict:
+    """
+    The user's changes after `revision` (or after the time `changed_after`), oldest first and at most `limit` of
+    them: the current conversations, versions and messages, and the ids of the deleted ones. `revision` in the result
+    is the one to ask from next time; `more` tells whether changes are left after it.
+    """
+    changes = Change.objects.filter(user=user, revision__gt=revision)
+    if changed_after is not None:
+        changes = changes.filter(changed_at__gt=changed_after)
+    changes = list(changes.order_by("revision").values_list("revision", "kind", "object_id", "deleted")[: limit + 1])
+    more = len(changes) > limit
+    changes = changes[:limit]
+
+    changed = {"conversation": [], "version": [], "message": []}
+    deleted = {"conversation": [], "version": [], "message": []}
+    for _, kind, object_id, is_deleted in changes:
+        (deleted if is_deleted else changed)[kind].append(object_id)
+
+    # Versions and messages of soft-deleted conversations are covered by the conversation's tombstone
+    conversations = Conversation.objects.filter(pk__in=changed["conversation"], user=user, deleted_at__isnull=True)
+    versions = Version.objects.filter(pk__in=changed["version"], conversation__deleted_at__isnull=True)
+    messages = Message.objects.filter(pk__in=changed["message"], version__conversation__deleted_at__isnull=True)
+    result = {
+        "revision": changes[-1][0] if changes else revision,
+        "more": more,
+        "conversations": list(conversations.order_by("created_at")),
+        "versions": list(versions.order_by("pk")),
+        "messages": list(messages.select_related("role").order_by("version_id", "position")),
+    }
+    for kind, objects in (("conversation", "conversations"), ("version", "versions"), ("message", "messages")):
+        # Objects gone since their change was logged are deleted too
+        found = {instance.pk for instance in result[objects]}
+        result[f"deleted_{objects}"] = deleted[kind] + [pk for pk in changed[kind] if pk not in found]
+    return result
@@ -0,0 +1,72 @@
+"""
+Compression of large message bodies.
+
+Bodies shorter than `CHAT_BODY_COMPRESSION_THRESHOLD` bytes, and bodies that do not shrink, are stored as plain text.
+Larger ones are stored as a BLOB in the same column: a one-byte codec tag followed by the compressed UTF-8 text. SQLite
+keeps the storage class of every value, so plain bodies stay readable (and searchable with `LIKE`) as they are.
+
+SQL only ever reads the plain form: the search triggers skip compressed bodies, whose text is indexed from Python, and
+the conversation previews come from `MessageBody.preview`. zstd needs the optional `zstandard` package, zlib is used
+when it is missing. Bodies written with zstd can only be read where `zstandard` is installed.
+"""
+import zlib
+from typing import Optional, Union
+
+from django.conf import settings
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+__all__ = ["CompressedTextField", "compress", "decompress"]
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def compress(text: str, codec: Optional[str] = None, threshold: Optional[int] = None) -> Union[str, bytes]:
+    """
+    The value to store for `text`: `text` itself below the threshold or when compressing does not pay, otherwise the
+    tagged compressed bytes. `codec` and `threshold` default to the settings.
+    """
+    codec = codec or settings.CHAT_BODY_COMPRESSION_CODEC
+    threshold = settings.CHAT_BODY_COMPRESSION_THRESHOLD if threshold is None else threshold
+    if codec == "none":
+        return text
+    data = text.encode()
+    if len(data) < threshold:
+        return text
+
+    if codec == "zstd" and zstandard is not None:
+        compressed = b"s" + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    else:
+        compressed = b"z" + zlib.compress(data, ZLIB_LEVEL)
+    return compressed if len(compressed) < len(data) else text
+
+
+def decompress(value: Union[str, bytes, memoryview, None]) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+
+    value = bytes(value)
+    tag, payload = value[:1], value[1:]
+    if tag == b"z":
+        return zlib.decompress(payload).decode()
+    if tag == b"s":
+        if zstandard is None:
+            raise RuntimeError("This message body is compressed with zstd, install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(payload).decode()
+    raise ValueError(f"Unknown message body codec {tag!r}")
+
+
+class CompressedTextField(models.TextField):
+    """A text field stored with `compress`; reads, `values()` included, always give back the text."""
+
+    def from_db_value(self, value, expression, connection):
+        return decompress(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        return value if value is None else compress(value)
@@ -0,0 +1,68 @@
+"""
+The denormalized counters of `Conversation`, so conversation lists read a single table: `version_count`, and the
+`message_count`, `last_message_at` and `last_message_preview` of the active version.
+
+Triggers keep them up to date in the statement that changes the rows: version and message inserts and deletes, edits
+of the last message and switches of the active version (see `chat/migrations/0012_conversation_counters.py`). Like the
+other triggers they are skipped inside `suspended_triggers()`; bulk writers call `refresh_counters` for the
+conversations they touch instead. `Conversation.save()` never writes the counters, the values loaded with an instance
+may be stale. `reconcile_counters` recomputes them and repairs any drift.
+"""
+from typing import Iterator, Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from chat.utils.bulk import parameter_list
+
+__all__ = ["reconcile_counters", "refresh_counters"]
+
+_LAST_MESSAGE = "FROM chat_message WHERE version_id = conversation.active_version_id ORDER BY position DESC LIMIT 1"
+# The value of every counter, computed from the rows
+_EXPECTED = {
+    "version_count": "(SELECT COUNT(*) FROM chat_version WHERE conversation_id = conversation.id)",
+    "message_count": "(SELECT COUNT(*) FROM chat_message WHERE version_id = conversation.active_version_id)",
+    "last_message_at": f"(SELECT created_at {_LAST_MESSAGE})",
+    "last_message_preview": (
+        f"COALESCE((SELECT preview FROM chat_messagebody WHERE hash = (SELECT body_id {_LAST_MESSAGE})), '')"
+    ),
+}
+
+
+def refresh_counters(cursor, conversation_ids: list) -> None:
+    """Recomputes the counters of the conversations. Ids in their database form."""
+    if not conversation_ids:
+        return
+    assignments = ", ".join(f"{field} = {expression}" for field, expression in _EXPECTED.items())
+    cursor.execute(
+        f"UPDATE chat_conversation AS conversation SET {assignments} WHERE id IN ({parameter_list(conversation_ids)})",
+        conversation_ids,
+    )
+
+
+def reconcile_counters(
+    slice_size: int = 500, dry_run: bool = False, using: str = DEFAULT_DB_ALIAS
+) -> Iterator[dict[str, int]]:
+    """
+    Compares the counters of every conversation with the rows, `slice_size` conversations at a time in id order, and
+    repairs the ones that drifted, one transaction per slice. Yields the number of checked and of repaired
+    conversations of every slice.
+    """
+    stored = ", ".join(f"conversation.{field}" for field in _EXPECTED)
+    expected = ", ".join(_EXPECTED.values())
+    after: Optional[str] = None
+    while True:
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT conversation.id, {stored}, {expected} FROM chat_conversation AS conversation "
+                f"WHERE %s IS NULL OR conversation.id > %s ORDER BY conversation.id LIMIT %s",
+                [after, after, slice_size],
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            end = 1 + len(_EXPECTED)
+            drifted = [row[0] for row in rows if row[1:end] != row[end:]]
+            if not dry_run:
+                refresh_counters(cursor, drifted)
+        after = rows[-1][0]
+        yield {"conversations": len(rows), "repaired": len(drifted)}
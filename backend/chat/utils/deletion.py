@@ -0,0 +1,177 @@
+"""
+Set-based hard deletes of conversations, for the retention purge and for large conversation trees.
+
+`conversation.delete()` goes through Django's collector, which loads every version and message of the conversation
+and updates the `parent_version` / `root_message` links pointing at them one object at a time. `delete_conversations`
+and `delete_versions` do the same work with a fixed number of statements per call, whatever the size of the trees:
+
+1. the conversations whose active version is being deleted are added, as `Conversation.active_version` cascades;
+2. the `active_version`, `parent_version` and `root_message` links into the deleted rows are cleared, which breaks
+   the cycles between the tables and is the `SET_NULL` of those foreign keys for rows that are kept; kept subtrees
+   cut off from their parent lose the closure rows to the ancestors above it;
+3. closure rows, search index entries, messages (and the bodies nobody references any more), versions and finally
+   the conversations are deleted, leaving tombstones in the change log (`chat.utils.changes`); kept conversations
+   get their counters refreshed (`chat.utils.counters`).
+
+The per-row triggers are suspended and their work is done per statement, see `chat.utils.sqlite`.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Iterable, Iterator, Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from chat.models import Conversation, Version
+from chat.search import get_backend as get_search_backend
+from chat.utils.bulk import parameter_list
+from chat.utils.changes import record_deleted_conversations, record_deleted_versions
+from chat.utils.counters import refresh_counters
+from chat.utils.sqlite import suspended_triggers
+
+__all__ = ["delete_conversations", "delete_versions", "purge_deleted_conversations"]
+
+_CONVERSATIONS = """
+WITH RECURSIVE doomed(id) AS (
+    SELECT id FROM chat_conversation WHERE id IN ({ids})
+    UNION
+    SELECT conversation.id
+    FROM chat_conversation AS conversation
+    JOIN chat_version AS version ON version.id = conversation.active_version_id
+    JOIN doomed ON doomed.id = version.conversation_id
+)
+SELECT id FROM doomed
+"""
+_DETACH = """
+DELETE FROM chat_versionancestry WHERE id IN (
+    SELECT link.id
+    FROM chat_version AS child
+    JOIN chat_versionancestry AS above ON above.descendant_id = child.id AND above.depth > 0
+    JOIN chat_versionancestry AS below ON below.ancestor_id = child.id
+    JOIN chat_versionancestry AS link
+        ON link.ancestor_id = above.ancestor_id AND link.descendant_id = below.descendant_id
+    WHERE child.parent_version_id IN ({versions}) AND child.id NOT IN ({versions})
+)
+"""
+
+# `{versions}` is a list or subquery of the versions being deleted
+_STATEMENTS = [
+    # Kept versions whose parent goes become roots, their subtrees lose the ancestors above
+    _DETACH,
+    "UPDATE chat_version SET parent_version_id = NULL WHERE parent_version_id IN ({versions})",
+    "UPDATE chat_version SET root_message_id = NULL "
+    "WHERE root_message_id IN (SELECT id FROM chat_message WHERE version_id IN ({versions}))",
+    "DELETE FROM chat_versionancestry WHERE descendant_id IN ({versions})",
+    "DELETE FROM chat_versionancestry WHERE ancestor_id IN ({versions})",
+]
+
+
+def delete_conversations(conversation_ids: Iterable, using: str = DEFAULT_DB_ALIAS) -> dict[str, int]:
+    """
+    Hard-deletes conversations with everything below them, in one transaction. Returns the number of deleted
+    conversations, versions, messages and message bodies.
+    """
+    connection = connections[using]
+    pk = Conversation._meta.pk
+    ids = [pk.get_db_prep_value(conversation_id, connection) for conversation_id in conversation_ids]
+    stats = {"conversations": 0, "versions": 0, "messages": 0, "bodies": 0}
+    if not ids:
+        return stats
+
+    with transaction.atomic(using=using), suspended_triggers(using), connection.cursor() as cursor:
+        cursor.execute(_CONVERSATIONS.format(ids=parameter_list(ids)), ids)
+        ids = [row[0] for row in cursor.fetchall()]
+        placeholders = parameter_list(ids)
+        cursor.execute(f"UPDATE chat_conversation SET active_version_id = NULL WHERE id IN ({placeholders})", ids)
+        versions = f"SELECT id FROM chat_version WHERE conversation_id IN ({placeholders})"
+        stats.update(_delete_versions(cursor, versions, ids, using, whole_conversations=True))
+        record_deleted_conversations(cursor, ids)
+        cursor.execute(f"DELETE FROM chat_conversation WHERE id IN ({placeholders})", ids)
+        stats["conversations"] = cursor.rowcount
+    return stats
+
+
+def delete_versions(version_ids: Iterable, using: str = DEFAULT_DB_ALIAS) -> dict[str, int]:
+    """
+    Hard-deletes versions with their messages, in one transaction, as `delete_conversations` does. Kept versions
+    below a deleted one become roots; conversations whose active version is deleted are deleted too.
+    """
+    connection = connections[using]
+    pk = Version._meta.pk
+    ids = [pk.get_db_prep_value(version_id, connection) for version_id in version_ids]
+    stats = {"conversations": 0, "versions": 0, "messages": 0, "bodies": 0}
+    if not ids:
+        return stats
+
+    with transaction.atomic(using=using), suspended_triggers(using), connection.cursor() as cursor:
+        cursor.execute(f"SELECT id FROM chat_conversation WHERE active_version_id IN ({parameter_list(ids)})", ids)
+        conversations = [row[0] for row in cursor.fetchall()]
+        if conversations:
+            stats = delete_conversations(conversations, using=using)
+        for key, count in _delete_versions(cursor, parameter_list(ids), ids, using).items():
+            stats[key] += count
+    return stats
+
+
+def _delete_versions(
+    cursor, versions: str, params: list, using: str, whole_conversations: bool = False
+) -> dict[str, int]:
+    def execute(statement: str) -> None:
+        cursor.execute(statement.format(versions=versions), params * statement.count("{versions}"))
+
+    # The conversations' tombstones stand for their versions, and their counters go with them
+    conversations = []
+    if not whole_conversations:
+        execute("SELECT DISTINCT conversation_id FROM chat_version WHERE id IN ({versions})")
+        conversations = [row[0] for row in cursor.fetchall()]
+
+    execute("SELECT id, body_id FROM chat_message WHERE version_id IN ({versions})")
+    messages = cursor.fetchall()
+    references = Counter(body_id for _, body_id in messages)
+
+    for statement in _STATEMENTS:
+        execute(statement)
+    get_search_backend().unindex([message_id for message_id, _ in messages], using=using)
+    if not whole_conversations:
+        record_deleted_versions(cursor, versions, params)
+    execute("DELETE FROM chat_message WHERE version_id IN ({versions})")
+    stats = {"messages": cursor.rowcount}
+    cursor.executemany(
+        "UPDATE chat_messagebody SET ref_count = ref_count - %s WHERE hash = %s",
+        [(count, body_id) for body_id, count in references.items()],
+    )
+    cursor.executemany(
+        "DELETE FROM chat_messagebody WHERE hash = %s AND ref_count = 0", [(body_id,) for body_id in references]
+    )
+    stats["bodies"] = max(cursor.rowcount, 0)
+    execute("DELETE FROM chat_version WHERE id IN ({versions})")
+    stats["versions"] = cursor.rowcount
+    refresh_counters(cursor, conversations)
+    return stats
+
+
+def purge_deleted_conversations(
+    older_than: timedelta,
+    batch_size: int = 200,
+    limit: Optional[int] = None,
+    using: str = DEFAULT_DB_ALIAS,
+) -> Iterator[dict]:
+    """
+    Hard-deletes the conversations soft-deleted more than `older_than` ago, oldest first, `batch_size` conversations
+    per transaction so that other writers only ever wait for one batch. Yields the stats of every batch, with
+    `seconds` the time its transaction held the database.
+    """
+    cutoff = timezone.now() - older_than
+    expired = Conversation.objects.using(using).filter(deleted_at__lt=cutoff).order_by("deleted_at")
+    purged = 0
+    while limit is None or purged < limit:
+        size = batch_size if limit is None else min(batch_size, limit - purged)
+        started_at = time.monotonic()
+        with transaction.atomic(using=using):
+            # Selected inside the transaction, so a conversation cannot be restored in between
+            stats = delete_conversations(expired.values_list("pk", flat=True)[:size], using=using)
+        if not stats["conversations"]:
+            return
+        purged += stats["conversations"]
+        yield {**stats, "seconds": time.monotonic() - started_at}
@@ -0,0 +1,155 @@
+"""
+Garbage collection of versions nobody can reach any more.
+
+Every conversation shows the tree holding its active version. Versions cut off from that tree (their parent was
+deleted and `parent_version` set to NULL, or they were never attached) are never displayed again, nor are versions
+left without any message. `collect_garbage` looks at a slice of conversations at a time: one query reads all of
+their versions, one pass over each tree marks what the policy allows to go, and `delete_versions` removes it in
+batches of one short transaction each. A checkpoint (the last conversation id of the slice) lets the next run
+continue where this one stopped, so a periodic job eventually covers every conversation without long locks.
+
+`collect_orphan_bodies` sweeps the message bodies no message references, which the reference count triggers did not
+get to drop, e.g. bodies inserted by a write that failed before its messages.
+"""
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Optional
+from uuid import UUID
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from chat.models import Conversation, Message, MessageBody, Version
+from chat.utils.deletion import delete_versions
+
+__all__ = ["GCPolicy", "collect_garbage", "collect_orphan_bodies", "find_garbage"]
+
+
+@dataclass
+class GCPolicy:
+    unreachable: bool = True  # versions outside of the tree of the active version
+    empty: bool = True  # versions without messages and without any kept version below them
+    min_idle: timedelta = timedelta(hours=24)  # conversations modified more recently are left alone
+
+    @classmethod
+    def from_settings(cls) -> "GCPolicy":
+        return cls(
+            unreachable=settings.CHAT_GC_UNREACHABLE,
+            empty=settings.CHAT_GC_EMPTY,
+            min_idle=timedelta(hours=settings.CHAT_GC_MIN_IDLE_HOURS),
+        )
+
+
+def find_garbage(active_versions: dict[UUID, UUID], policy: GCPolicy, using: str = DEFAULT_DB_ALIAS) -> list[UUID]:
+    """The versions of the conversations in `active_versions` (conversation id -> active version id) to delete."""
+    rows = (
+        Version.objects.using(using)
+        .filter(conversation_id__in=active_versions)
+        .annotate(has_messages=Exists(Message.objects.filter(version=OuterRef("pk"))))
+        .values_list("id", "conversation_id", "parent_version_id", "has_messages")
+    )
+    trees = defaultdict(dict)
+    for version_id, conversation_id, parent_id, has_messages in rows:
+        trees[conversation_id][version_id] = (parent_id, has_messages)
+
+    garbage = []
+    for conversation_id, versions in trees.items():
+        garbage += _tree_garbage(versions, active_versions[conversation_id], policy)
+    return garbage
+
+
+def _tree_garbage(versions: dict, active_id: UUID, policy: GCPolicy) -> list[UUID]:
+    if active_id not in versions:
+        return []
+    children = defaultdict(list)
+    for version_id, (parent_id, _) in versions.items():
+        children[parent_id].append(version_id)
+
+    root, seen = active_id, {active_id}
+    while versions[root][0] in versions and versions[root][0] not in seen:
+        root = versions[root][0]
+        seen.add(root)
+    # Parents come before their children in `tree`
+    tree = [root]
+    for version_id in tree:
+        tree += children[version_id]
+
+    garbage = set(versions) - set(tree) if policy.unreachable else set()
+    if policy.empty:
+        for version_id in reversed(tree):
+            if (
+                version_id != active_id
+                and not versions[version_id][1]
+                and all(child in garbage for child in children[version_id])
+            ):
+                garbage.add(version_id)
+    return list(garbage)
+
+
+def collect_garbage(
+    after: Optional[UUID] = None,
+    slice_size: int = 500,
+    batch_size: int = 1000,
+    policy: Optional[GCPolicy] = None,
+    dry_run: bool = False,
+    using: str = DEFAULT_DB_ALIAS,
+) -> dict:
+    """
+    Collects the garbage of the `slice_size` conversations following `after` in id order. The stats hold `last`, the
+    checkpoint to pass as `after` next time (None once the end is reached), and `seconds`, the time the database was
+    locked for the deletes.
+    """
+    policy = policy or GCPolicy.from_settings()
+    conversations = Conversation.objects.using(using).order_by("pk")
+    if after is not None:
+        conversations = conversations.filter(pk__gt=after)
+    page = list(conversations.values_list("pk", "active_version_id", "modified_at")[:slice_size])
+
+    idle_before = timezone.now() - policy.min_idle
+    active_versions = {pk: active_id for pk, active_id, modified_at in page if active_id and modified_at < idle_before}
+    garbage = find_garbage(active_versions, policy, using=using)
+
+    stats = {"conversations": len(page), "garbage": len(garbage), "versions": 0, "messages": 0, "bodies": 0}
+    stats["last"] = page[-1][0] if len(page) == slice_size else None
+    stats["seconds"] = 0.0
+    if dry_run:
+        return stats
+
+    for start in range(0, len(garbage), batch_size):
+        end = start + batch_size
+        batch = garbage[start:end]
+        started_at = time.monotonic()
+        with transaction.atomic(using=using):
+            # A version made active since the pass is reachable again
+            active = Conversation.objects.using(using).filter(active_version_id__in=batch)
+            kept = set(active.values_list("active_version_id", flat=True))
+            deleted = delete_versions([pk for pk in batch if pk not in kept], using=using)
+        stats["seconds"] += time.monotonic() - started_at
+        for key in ("versions", "messages", "bodies"):
+            stats[key] += deleted[key]
+    return stats
+
+
+def collect_orphan_bodies(batch_size: int = 1000, dry_run: bool = False, using: str = DEFAULT_DB_ALIAS) -> int:
+    """Deletes the message bodies with `ref_count` 0 that no message points at, and returns how many there were."""
+    orphans = (
+        MessageBody.objects.using(using)
+        .filter(ref_count=0)
+        .filter(~Exists(Message.objects.filter(body=OuterRef("pk"))))
+    )
+    if dry_run:
+        return orphans.count()
+
+    deleted = 0
+    while True:
+        with transaction.atomic(using=using):
+            # Checked again in the delete, a body may have been referenced since
+            batch = list(orphans.values_list("pk", flat=True)[:batch_size])
+            count, _ = orphans.filter(pk__in=batch).delete()
+        deleted += count
+        if len(batch) < batch_size:
+            return deleted
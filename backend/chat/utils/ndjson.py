@@ -0,0 +1,367 @@
+"""
+NDJSON export and import of conversations, for backups and moving users between environments.
+
+A stream is a header line followed by every conversation, each one directly followed by its versions and then its
+messages, one JSON object per line:
+
+    {"type": "header", "format": "chat.conversations", "version": 1}
+    {"type": "conversation", "id": ..., "user": "<email>", "title": ..., "active_version": ..., ...}
+    {"type": "version", "id": ..., "conversation": ..., "parent_version": ..., "root_message": ...}
+    {"type": "message", "id": ..., "version": ..., "role": "user", "content": ..., "position": 0, ...}
+
+Both directions run in constant memory. The export reads a chunk of conversations at a time and streams their
+messages with `.iterator()`; the import buffers whole conversations until `batch_size` messages are pending and writes
+them with plain `executemany` inserts, keeping every id and timestamp. Conversations whose id already exists are
+skipped, so an interrupted import can simply be run again.
+"""
+import json
+from collections import Counter, defaultdict
+from datetime import datetime
+from itertools import groupby, islice
+from typing import Iterable, Iterator, Optional, Union
+from uuid import UUID
+
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from authentication.models import CustomUser
+from chat.models import Conversation, Message, MessageBody, Role, Version, VersionAncestry
+from chat.search import get_backend as get_search_backend
+from chat.utils.bulk import insert_rows
+from chat.utils.changes import record_conversations
+from chat.utils.counters import refresh_counters
+from chat.utils.sqlite import suspended_triggers
+
+__all__ = ["FORMAT", "FORMAT_VERSION", "NDJSONImportError", "export_conversations", "import_conversations"]
+
+FORMAT = "chat.conversations"
+FORMAT_VERSION = 1
+
+CONVERSATION_FIELDS = ("id", "user__email", "title", "created_at", "modified_at", "deleted_at", "active_version_id")
+VERSION_FIELDS = ("id", "conversation_id", "parent_version_id", "root_message_id")
+CONVERSATION_COLUMNS = ["id", "user", "title", "created_at", "modified_at", "deleted_at", "active_version"]
+MESSAGE_COLUMNS = ["id", "version", "role", "body", "position", "created_at"]
+MESSAGE_FIELDS = (
+    "version__conversation_id",
+    "id",
+    "version_id",
+    "role__name",
+    "body__content",
+    "position",
+    "created_at",
+)
+
+
+class NDJSONImportError(ValueError):
+    pass
+
+
+def export_conversations(conversations: QuerySet, chunk_size: int = 500) -> Iterator[str]:
+    """Yields the lines of the export of `conversations`, newline included."""
+    yield _line({"type": "header", "format": FORMAT, "version": FORMAT_VERSION})
+
+    rows = conversations.order_by("pk").values_list(*CONVERSATION_FIELDS).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        ids = [row[0] for row in chunk]
+        versions = defaultdict(list)
+        for row in Version.objects.filter(conversation_id__in=ids).values_list(*VERSION_FIELDS):
+            versions[row[1]].append(row)
+        # Same order as the chunk, so both can be walked in step
+        messages = groupby(
+            Message.objects.filter(version__conversation_id__in=ids)
+            .order_by("version__conversation_id", "version_id", "position")
+            .values_list(*MESSAGE_FIELDS)
+            .iterator(chunk_size=5_000),
+            key=lambda row: row[0],
+        )
+        next_messages = next(messages, (None, ()))
+
+        for pk, email, title, created_at, modified_at, deleted_at, active_version_id in chunk:
+            yield _line(
+                {
+                    "type": "conversation",
+                    "id": str(pk),
+                    "user": email,
+                    "title": title,
+                    "created_at": _datetime(created_at),
+                    "modified_at": _datetime(modified_at),
+                    "deleted_at": _datetime(deleted_at),
+                    "active_version": _uuid(active_version_id),
+                }
+            )
+            for version_pk, _, parent_version_id, root_message_id in versions[pk]:
+                yield _line(
+                    {
+                        "type": "version",
+                        "id": str(version_pk),
+                        "conversation": str(pk),
+                        "parent_version": _uuid(parent_version_id),
+                        "root_message": _uuid(root_message_id),
+                    }
+                )
+            if next_messages[0] == pk:
+                for _, message_pk, version_id, role, content, position, created_at in next_messages[1]:
+                    yield _line(
+                        {
+                            "type": "message",
+                            "id": str(message_pk),
+                            "version": str(version_id),
+                            "role": role,
+                            "content": content,
+                            "position": position,
+                            "created_at": _datetime(created_at),
+                        }
+                    )
+                next_messages = next(messages, (None, ()))
+
+
+def import_conversations(
+    lines: Iterable[Union[str, bytes]], user: Optional[CustomUser] = None, batch_size: int = 10_000
+) -> dict:
+    """
+    Imports an export and returns the number of imported conversations, versions and messages, and of skipped
+    conversations. Conversations go to `user` when given, otherwise to the user with the email of their record.
+    Every batch is written in its own transaction, wrap the call in one to make the whole import atomic.
+    """
+    importer = _Importer(user, batch_size)
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise NDJSONImportError(f"Line {number}: not valid JSON")
+        if not isinstance(record, dict):
+            raise NDJSONImportError(f"Line {number}: expected an object")
+        try:
+            importer.add(record)
+        except NDJSONImportError as e:
+            raise NDJSONImportError(f"Line {number}: {e}") from None
+        except (KeyError, TypeError, ValueError) as e:
+            raise NDJSONImportError(f"Line {number}: invalid {record.get('type')} record ({e!r})") from None
+    importer.finish()
+    return importer.stats
+
+
+class _Importer:
+    def __init__(self, user: Optional[CustomUser], batch_size: int):
+        self.user = user
+        self.batch_size = batch_size
+        self.stats = {"conversations": 0, "versions": 0, "messages": 0, "skipped": 0}
+        self.header = False
+        self.user_ids: dict[str, int] = {}
+        self.role_ids: dict[str, int] = {}
+        self.now = timezone.now()
+        # The conversation being read and the ids it contains or links to, see `_close_conversation`
+        self.conversation_id: Optional[UUID] = None
+        self.version_ids: set[UUID] = set()
+        self.message_ids: set[UUID] = set()
+        self.linked_version_ids: set[UUID] = set()
+        self.linked_message_ids: set[UUID] = set()
+        # Pending rows, as tuples of the fields in CONVERSATION_COLUMNS / MESSAGE_COLUMNS
+        self.conversations: list[tuple] = []
+        self.versions: list[Version] = []
+        self.messages: list[tuple] = []
+        self.bodies: dict[str, str] = {}
+
+    def add(self, record: dict) -> None:
+        kind = record.get("type")
+        if not self.header:
+            if kind != "header" or record.get("format") != FORMAT:
+                raise NDJSONImportError(f"not a {FORMAT} export")
+            if record.get("version") != FORMAT_VERSION:
+                raise NDJSONImportError(f"unsupported format version {record.get('version')!r}")
+            self.header = True
+        elif kind == "conversation":
+            self._close_conversation()
+            if len(self.messages) >= self.batch_size:
+                self.flush()
+            self._conversation(record)
+        elif kind == "version":
+            self._version(record)
+        elif kind == "message":
+            self._message(record)
+        else:
+            raise NDJSONImportError(f"unknown record type {kind!r}")
+
+    def finish(self) -> None:
+        if not self.header:
+            raise NDJSONImportError("Empty import")
+        self._close_conversation()
+        self.flush()
+
+    def _conversation(self, record: dict) -> None:
+        self.conversation_id = _parse_uuid(record["id"])
+        active_version_id = _parse_uuid(record.get("active_version"))
+        created_at = _parse_datetime(record.get("created_at")) or self.now
+        self.conversations.append(
+            (
+                self.conversation_id,
+                self.user.pk if self.user else self._user_id(record["user"]),
+                _string(record["title"]),
+                created_at,
+                _parse_datetime(record.get("modified_at")) or created_at,
+                _parse_datetime(record.get("deleted_at")),
+                active_version_id,
+            )
+        )
+        self.version_ids, self.message_ids = set(), set()
+        self.linked_version_ids, self.linked_message_ids = {active_version_id}, set()
+
+    def _version(self, record: dict) -> None:
+        if self.conversation_id is None or _parse_uuid(record["conversation"]) != self.conversation_id:
+            raise NDJSONImportError("version outside of its conversation")
+        version = Version(
+            id=_parse_uuid(record["id"]),
+            conversation_id=self.conversation_id,
+            parent_version_id=_parse_uuid(record.get("parent_version")),
+            root_message_id=_parse_uuid(record.get("root_message")),
+        )
+        self.versions.append(version)
+        self.version_ids.add(version.id)
+        self.linked_version_ids.add(version.parent_version_id)
+        self.linked_message_ids.add(version.root_message_id)
+
+    def _message(self, record: dict) -> None:
+        version_id = _parse_uuid(record["version"])
+        if version_id not in self.version_ids:
+            raise NDJSONImportError("message of a version outside of its conversation")
+        content = _string(record["content"])
+        body_id = MessageBody.hash_of(content)
+        self.bodies[body_id] = content
+        message_id = _parse_uuid(record["id"])
+        self.messages.append(
+            (
+                message_id,
+                version_id,
+                self._role_id(record["role"]),
+                body_id,
+                int(record["position"]),
+                _parse_datetime(record.get("created_at")) or self.now,
+            )
+        )
+        self.message_ids.add(message_id)
+
+    def _close_conversation(self) -> None:
+        """Checks that the links of the conversation stay within it, the foreign keys would only fail at commit."""
+        if self.conversation_id is None:
+            return
+        conversation_id, self.conversation_id = self.conversation_id, None
+        if (
+            not (self.linked_version_ids - {None}) <= self.version_ids
+            or not (self.linked_message_ids - {None}) <= self.message_ids
+        ):
+            raise NDJSONImportError(f"conversation {conversation_id} links to versions or messages outside of it")
+
+    def flush(self) -> None:
+        if not self.conversations:
+            return
+        existing = set(
+            Conversation.objects.filter(pk__in=[row[0] for row in self.conversations]).values_list("pk", flat=True)
+        )
+        conversations = [row for row in self.conversations if row[0] not in existing]
+        versions = _parents_first([version for version in self.versions if version.conversation_id not in existing])
+        version_ids = {version.id for version in versions}
+        messages = [row for row in self.messages if row[1] in version_ids]
+        references = Counter(row[3] for row in messages)
+
+        # The triggers would index, count and log every row one at a time, the same work is done per batch here.
+        # Conversations point at their active version and versions at their root message before those rows exist;
+        # foreign keys are only checked when the transaction commits
+        with transaction.atomic(), suspended_triggers():
+            insert_rows(
+                MessageBody,
+                ["hash", "content", "preview", "ref_count"],
+                [
+                    (body_id, self.bodies[body_id], MessageBody.preview_of(self.bodies[body_id]), 0)
+                    for body_id in references
+                ],
+                ignore_conflicts=True,
+            )
+            insert_rows(Conversation, CONVERSATION_COLUMNS, conversations)
+            insert_rows(
+                Version,
+                ["id", "conversation", "parent_version", "root_message"],
+                [(v.id, v.conversation_id, v.parent_version_id, v.root_message_id) for v in versions],
+            )
+            insert_rows(Message, MESSAGE_COLUMNS, messages)
+            insert_rows(
+                VersionAncestry,
+                ["ancestor", "descendant", "depth"],
+                [(row.ancestor_id, row.descendant_id, row.depth) for row in VersionAncestry.objects.rows_for(versions)],
+            )
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    "UPDATE chat_messagebody SET ref_count = ref_count + %s WHERE hash = %s",
+                    [(count, body_id) for body_id, count in references.items()],
+                )
+                pk = Conversation._meta.pk
+                conversation_ids = [pk.get_db_prep_value(row[0], connection) for row in conversations]
+                refresh_counters(cursor, conversation_ids)
+                record_conversations(cursor, conversation_ids)
+            get_search_backend().index([row[0] for row in messages])
+
+        self.stats["conversations"] += len(conversations)
+        self.stats["versions"] += len(versions)
+        self.stats["messages"] += len(messages)
+        self.stats["skipped"] += len(existing)
+        self.conversations, self.versions, self.messages, self.bodies = [], [], [], {}
+
+    def _user_id(self, email: str) -> int:
+        if email not in self.user_ids:
+            try:
+                self.user_ids[email] = CustomUser.objects.values_list("pk", flat=True).get(email=email)
+            except CustomUser.DoesNotExist:
+                raise NDJSONImportError(f"unknown user {email}")
+        return self.user_ids[email]
+
+    def _role_id(self, name: str) -> int:
+        if name not in self.role_ids:
+            # Roles are not created from uploads, they are global
+            try:
+                self.role_ids[name] = Role.objects.values_list("pk", flat=True).get(name=_string(name))
+            except Role.DoesNotExist:
+                raise NDJSONImportError(f"unknown role {name}")
+        return self.role_ids[name]
+
+
+def _parents_first(versions: list[Version]) -> list[Version]:
+    """Orders versions so that every parent comes before its children, as `rows_for` needs."""
+    children = defaultdict(list)
+    for version in versions:
+        children[version.parent_version_id].append(version)
+    ordered, stack = [], list(reversed(children[None]))
+    while stack:
+        version = stack.pop()
+        ordered.append(version)
+        stack.extend(reversed(children[version.id]))
+    if len(ordered) != len(versions):
+        raise NDJSONImportError("the parent links of the versions form a cycle")
+    return ordered
+
+
+def _line(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _string(value) -> str:
+    if not isinstance(value, str):
+        raise TypeError(f"expected a string, got {value!r}")
+    return value
+
+
+def _uuid(value) -> Optional[str]:
+    return str(value) if value is not None else None
+
+
+def _datetime(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _parse_uuid(value: Optional[str]) -> Optional[UUID]:
+    return UUID(value) if value else None
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
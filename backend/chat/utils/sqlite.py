@@ -0,0 +1,46 @@
+"""
+Switching off the triggers on the chat tables.
+
+Every trigger that maintains the body reference counts, the search index, the sync change log or the conversation
+counters only runs while `chat_triggers_suspended` is empty. Inside `suspended_triggers()` that table holds a row of
+the block's transaction, so bulk writers can skip the per-row work and do it with a few set-based statements instead.
+The row never commits, so other connections, `dbshell` and the sqlite3 CLI always see the triggers on. The triggers
+are plain SQL and call no functions of the app.
+"""
+from contextlib import contextmanager
+from typing import Iterator
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.transaction import TransactionManagementError
+
+__all__ = ["suspended_triggers"]
+
+
+@contextmanager
+def suspended_triggers(using: str = DEFAULT_DB_ALIAS) -> Iterator[None]:
+    """
+    Skips the reference count, search, change log and counter triggers for the statements of this transaction in the
+    block. The caller takes over: `ref_count` of the bodies it references or releases, `SearchBackend.index` for the
+    messages it inserts, the records of `chat.utils.changes` and `chat.utils.counters.refresh_counters`. Only allowed
+    inside a transaction, so nothing commits half maintained.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        yield
+        return
+    if not connection.in_atomic_block:
+        raise TransactionManagementError("suspended_triggers() must be used inside a transaction")
+
+    depth = getattr(connection, "chat_triggers_suspended", 0)
+    if not depth:
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO chat_triggers_suspended DEFAULT VALUES")
+    connection.chat_triggers_suspended = depth + 1
+    try:
+        yield
+    finally:
+        connection.chat_triggers_suspended = depth
+        # A transaction marked for rollback takes the row with it
+        if not depth and not connection.needs_rollback:
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM chat_triggers_suspended")
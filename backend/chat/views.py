@@ -1,12 +1,37 @@
+from itertools import islice
+from typing import AsyncIterator, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from chat.models import Conversation, Message, Version
-from chat.serializers import ConversationSerializer, MessageSerializer, TitleSerializer, VersionSerializer
+from chat import live
+from chat.models import DEFAULT_CONVERSATION_TITLE, Conversation, Message, Version
+from chat.search import get_backend as get_search_backend
+from chat.serializers import (
+    ConversationSerializer,
+    ConversationSummarySerializer,
+    MessageSerializer,
+    SearchHitSerializer,
+    SyncSerializer,
+    TitleSerializer,
+    VersionSerializer,
+)
+from chat.utils import ndjson
 from chat.utils.branching import make_branched_conversation
+from chat.utils.changes import changes_since
+from chat.utils.deletion import delete_conversations
+
+# Lines per chunk of an export streamed over ASGI
+EXPORT_STREAM_LINES = 500
 
 
 @api_view(["GET"])
@@ -18,14 +43,25 @@ def chat_root_view(request):
 @api_view(["GET"])
 def get_conversations(request):
     conversations = Conversation.objects.filter(user=request.user, deleted_at__isnull=True).order_by("-modified_at")
+    conversations = ConversationSerializer.setup_eager_loading(conversations)
     serializer = ConversationSerializer(conversations, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@login_required
+@api_view(["GET"])
+def get_conversation_summaries(request):
+    """The conversation list without versions and messages: counts and the last message come from a single table."""
+    conversations = Conversation.objects.filter(user=request.user, deleted_at__isnull=True).order_by("-modified_at")
+    serializer = ConversationSummarySerializer(conversations, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
 @login_required
 @api_view(["GET"])
 def get_conversations_branched(request):
     conversations = Conversation.objects.filter(user=request.user, deleted_at__isnull=True).order_by("-modified_at")
+    conversations = ConversationSerializer.setup_eager_loading(conversations)
     conversations_serializer = ConversationSerializer(conversations, many=True)
     conversations_data = conversations_serializer.data
 
@@ -39,7 +75,13 @@ def get_conversations_branched(request):
 @api_view(["GET"])
 def get_conversation_branched(request, pk):
     try:
-        conversation = Conversation.objects.get(user=request.user, pk=pk)
+        last_messages = _int_param(request, "last_messages", maximum=settings.CHAT_MESSAGE_WINDOW_MAX)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        conversations = ConversationSerializer.setup_eager_loading(Conversation.objects.all(), last_messages)
+        conversation = conversations.get(user=request.user, pk=pk)
     except Conversation.DoesNotExist:
         return Response({"detail": "Conversation not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -47,6 +89,9 @@ def get_conversation_branched(request, pk):
     conversation_data = conversation_serializer.data
     make_branched_conversation(conversation_data)
 
+    if last_messages is not None:
+        for version_data in conversation_data["versions"]:
+            version_data["previous_cursor"] = _previous_cursor(version_data["messages"])
     return Response(conversation_data, status=status.HTTP_200_OK)
 
 
@@ -54,7 +99,7 @@ def get_conversation_branched(request, pk):
 @api_view(["POST"])
 def add_conversation(request):
     try:
-        conversation_data = {"title": request.data.get("title", "Mock title"), "user": request.user}
+        conversation_data = {"title": request.data.get("title", DEFAULT_CONVERSATION_TITLE), "user": request.user}
         conversation = Conversation.objects.create(**conversation_data)
         version = Version.objects.create(conversation=conversation)
 
@@ -81,7 +126,8 @@ def add_conversation(request):
 @api_view(["GET", "PUT", "DELETE"])
 def conversation_manage(request, pk):
     try:
-        conversation = Conversation.objects.get(user=request.user, pk=pk)
+        conversations = ConversationSerializer.setup_eager_loading(Conversation.objects.all())
+        conversation = conversations.get(user=request.user, pk=pk)
     except Conversation.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -90,14 +136,19 @@ def conversation_manage(request, pk):
         return Response(serializer.data)
 
     elif request.method == "PUT":
+        title, active_version_id = conversation.title, conversation.active_version_id
         serializer = ConversationSerializer(conversation, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            if conversation.title != title:
+                live.publish(conversation.pk, "title", title=conversation.title)
+            if conversation.active_version_id != active_version_id:
+                live.publish(conversation.pk, "version", active_version=conversation.active_version_id)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == "DELETE":
-        conversation.delete()
+        delete_conversations([conversation.pk])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -114,6 +165,7 @@ def conversation_change_title(request, pk):
     if serializer.is_valid():
         conversation.title = serializer.data.get("title")
         conversation.save()
+        live.publish(conversation.pk, "title", title=conversation.title)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     return Response({"detail": "Title not provided"}, status=status.HTTP_400_BAD_REQUEST)
@@ -147,6 +199,7 @@ def conversation_add_message(request, pk):
     serializer = MessageSerializer(data=request.data)
     if serializer.is_valid():
         serializer.save(version=version)
+        live.publish(conversation.pk, "message", version_id=version.pk, message=serializer.data)
         # return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(
             {
@@ -163,7 +216,6 @@ def conversation_add_message(request, pk):
 def conversation_add_version(request, pk):
     try:
         conversation = Conversation.objects.get(user=request.user, pk=pk)
-        version = conversation.active_version
         root_message_id = request.data.get("root_message_id")
         root_message = Message.objects.get(pk=root_message_id)
     except Conversation.DoesNotExist:
@@ -179,18 +231,22 @@ def conversation_add_version(request, pk):
         conversation=conversation, parent_version=root_message.version, root_message=root_message
     )
 
-    # Copy messages before root_message to new_version
-    messages_before_root = Message.objects.filter(version=version, created_at__lt=root_message.created_at)
+    # Copy the messages before root_message to new_version, keeping their positions; copies share the bodies
+    messages_before_root = Message.objects.filter(
+        version=root_message.version_id, position__lt=root_message.position
+    ).values_list("body_id", "role_id", "position")
     new_messages = [
-        Message(content=message.content, role=message.role, version=new_version) for message in messages_before_root
+        Message(body_id=body_id, role_id=role_id, version=new_version, position=position)
+        for body_id, role_id, position in messages_before_root
     ]
     Message.objects.bulk_create(new_messages)
 
     # Set the new version as the current version
     conversation.active_version = new_version
     conversation.save()
+    live.publish(conversation.pk, "version", active_version=new_version.pk)
 
-    serializer = VersionSerializer(new_version)
+    serializer = VersionSerializer(VersionSerializer.setup_eager_loading([new_version])[0])
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -198,7 +254,7 @@ def conversation_add_version(request, pk):
 @api_view(["PUT"])
 def conversation_switch_version(request, pk, version_id):
     try:
-        conversation = Conversation.objects.get(pk=pk)
+        conversation = Conversation.objects.get(user=request.user, pk=pk)
         version = Version.objects.get(pk=version_id, conversation=conversation)
     except Conversation.DoesNotExist:
         return Response({"detail": "Conversation not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -207,6 +263,7 @@ def conversation_switch_version(request, pk, version_id):
 
     conversation.active_version = version
     conversation.save()
+    live.publish(conversation.pk, "version", active_version=version.pk)
 
     return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -215,13 +272,14 @@ def conversation_switch_version(request, pk, version_id):
 @api_view(["POST"])
 def version_add_message(request, pk):
     try:
-        version = Version.objects.get(pk=pk)
+        version = Version.objects.get(pk=pk, conversation__user=request.user)
     except Version.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
     serializer = MessageSerializer(data=request.data)
     if serializer.is_valid():
         serializer.save(version=version)
+        live.publish(version.conversation_id, "message", version_id=version.pk, message=serializer.data)
         return Response(
             {
                 "message": serializer.data,
@@ -230,3 +288,136 @@ def version_add_message(request, pk):
             status=status.HTTP_201_CREATED,
         )
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@login_required
+@api_view(["GET"])
+def version_messages(request, pk):
+    """
+    The last `limit` messages of a version, oldest first. `previous_cursor` is passed back as `before` to page towards
+    the start of the version, it is null once the first message has been returned.
+    """
+    try:
+        limit = _int_param(request, "limit", maximum=settings.CHAT_MESSAGE_WINDOW_MAX) or settings.CHAT_MESSAGE_WINDOW
+        before = _int_param(request, "before", allow_zero=True)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        version = Version.objects.get(pk=pk, conversation__user=request.user)
+    except Version.DoesNotExist:
+        return Response({"detail": "Version not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    messages = version.messages.select_related("role").order_by("-position")
+    if before is not None:
+        messages = messages.filter(position__lt=before)
+    window = MessageSerializer(reversed(messages[:limit]), many=True).data
+    return Response(
+        {"version_id": version.id, "messages": window, "previous_cursor": _previous_cursor(window)},
+        status=status.HTTP_200_OK,
+    )
+
+
+@login_required
+@api_view(["GET"])
+def search_messages(request):
+    query = request.query_params.get("q", "").strip()
+    if not query:
+        return Response({"detail": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = (
+            _int_param(request, "limit", maximum=settings.CHAT_SEARCH_MAX_RESULTS) or settings.CHAT_SEARCH_MAX_RESULTS
+        )
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    hits = get_search_backend().search(request.user, query, limit)
+    return Response({"query": query, "results": SearchHitSerializer(hits, many=True).data}, status=status.HTTP_200_OK)
+
+
+@login_required
+@api_view(["GET"])
+def export_conversations(request):
+    """The user's conversations as a streamed NDJSON export, see `chat.utils.ndjson`."""
+    conversations = Conversation.objects.filter(user=request.user, deleted_at__isnull=True)
+    lines = ndjson.export_conversations(conversations)
+    if isinstance(request._request, ASGIRequest):
+        lines = _async_batches(lines, EXPORT_STREAM_LINES)
+    response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+    response["Content-Disposition"] = 'attachment; filename="conversations.ndjson"'
+    return response
+
+
+async def _async_batches(lines: Iterator[str], size: int) -> AsyncIterator[str]:
+    """
+    Pulls `size` lines at a time on the request's sync thread, where the queries run. Served over ASGI, a sync iterator
+    would be read whole into memory before the first byte goes out.
+    """
+    read = sync_to_async(lambda: "".join(islice(lines, size)))
+    while batch := await read():
+        yield batch
+
+
+@login_required
+@api_view(["POST"])
+def import_conversations(request):
+    """
+    Imports an NDJSON export sent as the request body, read line by line, into the user's account. The import is
+    atomic; conversations that already exist are skipped.
+    """
+    if request.stream is None:
+        return Response({"detail": "Empty import"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        with transaction.atomic():
+            stats = ndjson.import_conversations(iter(request.stream.readline, b""), user=request.user)
+    except ndjson.NDJSONImportError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except IntegrityError:
+        return Response({"detail": "Versions or messages of the import already exist"}, status=status.HTTP_409_CONFLICT)
+    return Response(stats, status=status.HTTP_201_CREATED)
+
+
+@login_required
+@api_view(["GET"])
+def sync_changes(request):
+    """
+    What changed in the user's conversations since the revision `since` (or the ISO time `since_time`), for clients
+    keeping a local copy: the changed objects and the ids of the deleted ones. The returned `revision` is the next
+    `since`; while `more` is true, ask again right away.
+    """
+    try:
+        since = _int_param(request, "since", allow_zero=True) or 0
+        limit = _int_param(request, "limit", maximum=settings.CHAT_SYNC_PAGE_MAX) or settings.CHAT_SYNC_PAGE
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    since_time = request.query_params.get("since_time")
+    if since_time is not None:
+        try:
+            since_time = parse_datetime(since_time)
+        except ValueError:
+            since_time = None
+        if since_time is None:
+            return Response(
+                {"detail": "since_time must be an ISO 8601 date and time"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if timezone.is_naive(since_time):
+            since_time = timezone.make_aware(since_time)
+
+    changes = changes_since(request.user, since, changed_after=since_time, limit=limit)
+    return Response(SyncSerializer(changes).data, status=status.HTTP_200_OK)
+
+
+def _int_param(request, name: str, maximum: Optional[int] = None, allow_zero: bool = False) -> Optional[int]:
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    if not value.isdigit() or (not allow_zero and int(value) == 0):
+        raise ValueError(f"{name} must be a {'non-negative' if allow_zero else 'positive'} integer")
+    return min(int(value), maximum) if maximum is not None else int(value)
+
+
+def _previous_cursor(messages_data: list) -> Optional[int]:
+    # Positions are dense, so anything before the first message of the window means there are older messages
+    if messages_data and messages_data[0]["position"] > 0:
+        return messages_data[0]["position"]
+    return None
@@ -0,0 +1,107 @@
+import asyncio
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from src.utils.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from src.utils.load_generator import DEPLOYMENTS, LoadConfig, percentile, run_load_async, started_deployment
+
+GREEDY_PREFIX = "admission-greedy"
+REGULAR_PREFIX = "admission-regular"
+
+
+class Command(BaseCommand):
+    help = (
+        "Starts this backend against a fake upstream, sends GPT answers and titles through the real endpoints from "
+        "one greedy user with many tabs and several regular users, and reports per user admissions, 429 rejections "
+        "and time to first token (which includes the admission queue wait)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--deployment", choices=sorted(DEPLOYMENTS), default="asgi")
+        parser.add_argument("--port", type=int, default=None, help="Port of the deployment, a free one by default")
+        parser.add_argument("--users", type=int, default=4, help="Number of regular users (one tab each)")
+        parser.add_argument("--greedy-tabs", type=int, default=16, help="Concurrent tabs of the greedy user")
+        parser.add_argument("--requests", type=int, default=20, help="Requests sent by each tab")
+        parser.add_argument("--title-ratio", type=float, default=0.2, help="Share of title requests")
+        parser.add_argument("--first-token-delay", type=float, default=0.05, help="Upstream delay before an answer")
+        parser.add_argument("--token-delay", type=float, default=0.005, help="Upstream delay between tokens")
+        parser.add_argument("--reply-tokens", type=int, default=20, help="Tokens of every upstream answer")
+        parser.add_argument("--max-concurrent", type=int, default=settings.GPT_STREAMS_MAX_CONCURRENT)
+        parser.add_argument("--max-per-user", type=int, default=settings.GPT_STREAMS_MAX_PER_USER)
+        parser.add_argument("--max-queue", type=int, default=settings.GPT_STREAMS_MAX_QUEUE)
+        parser.add_argument("--queue-timeout", type=float, default=settings.GPT_STREAMS_QUEUE_TIMEOUT)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        upstream = FakeOpenAIConfig(
+            reply=" ".join(["token"] * options["reply_tokens"]),
+            first_token_delay=options["first_token_delay"],
+            token_delay=options["token_delay"],
+        )
+        env = {
+            "GPT_STREAMS_MAX_CONCURRENT": str(options["max_concurrent"]),
+            "GPT_STREAMS_MAX_PER_USER": str(options["max_per_user"]),
+            "GPT_STREAMS_MAX_QUEUE": str(options["max_queue"]),
+            "GPT_STREAMS_QUEUE_TIMEOUT": str(options["queue_timeout"]),
+        }
+        ratio = options["title_ratio"]
+        base = {"operations": options["requests"], "mix": {"stream_answer": 1 - ratio, "title": ratio}}
+        configs = {
+            "greedy": dict(users=1, tabs=options["greedy_tabs"], email_prefix=GREEDY_PREFIX, **base),
+            "regular": dict(users=options["users"], email_prefix=REGULAR_PREFIX, **base),
+        }
+        accounts = {GREEDY_PREFIX: 1, REGULAR_PREFIX: options["users"]}
+        port = options["port"] or _free_port()
+
+        with FakeOpenAIServer(upstream) as fake, started_deployment(
+            options["deployment"], fake.url, port, accounts, LoadConfig.password, env
+        ) as base_url:
+
+            async def run_all():
+                runs = [
+                    run_load_async(LoadConfig(base_url=base_url, seed=options["seed"], **config))
+                    for config in configs.values()
+                ]
+                return await asyncio.gather(*runs)
+
+            reports = dict(zip(configs, asyncio.run(run_all())))
+
+        self.stdout.write(
+            f"{'user':<10}{'request':<15}{'sent':>8}{'admitted':>10}{'rejected':>10}{'p50 ms':>10}{'p95 ms':>10}"
+        )
+        for user, report in reports.items():
+            for endpoint in ("stream_answer", "title"):
+                latencies = report.latencies.get(endpoint, [])
+                errors = report.errors.get(endpoint, {})
+                rejected = errors.get("429", 0)
+                admitted = len(latencies) - sum(errors.values())
+                # Answers are timed to their first token, titles to the whole response
+                samples = report.ttft if endpoint == "stream_answer" else latencies
+                p50, p95 = (percentile(samples, pct) * 1000 for pct in (50, 95))
+                self.stdout.write(
+                    f"{user:<10}{endpoint:<15}{len(latencies):>8}{admitted:>10}{rejected:>10}{p50:>10.1f}{p95:>10.1f}"
+                )
+            # e.g. conversations the tabs create before asking for answers, failing on a locked database
+            other = {
+                f"{endpoint} {error}": count
+                for endpoint, errors in report.errors.items()
+                for error, count in errors.items()
+                if error != "429"
+            }
+            if other:
+                self.stdout.write(self.style.WARNING(f"{user}: other errors {other}"))
+
+        elapsed = max(report.elapsed for report in reports.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{fake.stats.requests} upstream requests in {elapsed:.2f}s from {options['deployment']}"
+            )
+        )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,150 @@
+import itertools
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Hashable, Iterator, Optional
+
+from django.conf import settings
+
+__all__ = ["AdmissionRejected", "StreamScheduler", "stream_scheduler"]
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(f"Request not admitted: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Ticket:
+    user: Hashable
+    priority: int
+    seq: int
+    enqueued_at: float
+    granted: bool = False
+
+
+@dataclass
+class Slot:
+    scheduler: "StreamScheduler"
+    user: Hashable
+    waited: float
+    released: bool = field(default=False, repr=False)
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self.user)
+
+
+class StreamScheduler:
+    """
+    Admission control for upstream GPT calls.
+
+    At most `max_concurrent` calls run at once and at most `max_per_user` of them belong to the same user (0 disables
+    the per-user cap). Calls that cannot start immediately wait in a queue bounded by `max_queue`; a waiter gives up
+    after `queue_timeout` seconds. When a slot frees up the next call is chosen by priority class first (titles before
+    answers), then by fair share (the user with the fewest running calls), then by arrival order.
+    """
+
+    TITLE = 0
+    ANSWER = 1
+
+    def __init__(self, max_concurrent: int = 16, max_per_user: int = 4, max_queue: int = 64, queue_timeout=10.0):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: list[_Ticket] = []
+        self._running_by_user: dict[Hashable, int] = defaultdict(int)
+        self._running = 0
+        self.admitted_total = 0
+        self.rejected_total: Counter = Counter()
+
+    @classmethod
+    def from_settings(cls) -> "StreamScheduler":
+        return cls(
+            max_concurrent=settings.GPT_STREAMS_MAX_CONCURRENT,
+            max_per_user=settings.GPT_STREAMS_MAX_PER_USER,
+            max_queue=settings.GPT_STREAMS_MAX_QUEUE,
+            queue_timeout=settings.GPT_STREAMS_QUEUE_TIMEOUT,
+        )
+
+    def acquire(self, user: Hashable, priority: int = ANSWER, timeout: Optional[float] = None) -> Slot:
+        """Blocks until a slot is granted to `user` and returns it, or raises `AdmissionRejected`."""
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                self.rejected_total["queue_full"] += 1
+                raise AdmissionRejected("queue_full")
+
+            ticket = _Ticket(user, priority, next(self._seq), time.monotonic())
+            self._waiting.append(ticket)
+            self._dispatch()
+            if not self._cond.wait_for(lambda: ticket.granted, timeout=timeout):
+                self._waiting.remove(ticket)
+                self.rejected_total["timeout"] += 1
+                raise AdmissionRejected("timeout")
+
+            self.admitted_total += 1
+            return Slot(self, user, time.monotonic() - ticket.enqueued_at)
+
+    @contextmanager
+    def slot(self, user: Hashable, priority: int = ANSWER, timeout: Optional[float] = None) -> Iterator[Slot]:
+        acquired = self.acquire(user, priority, timeout)
+        try:
+            yield acquired
+        finally:
+            acquired.release()
+
+    def hold(self, slot: Slot, chunks: Iterator[str]) -> Iterator[str]:
+        """Keeps `slot` for as long as the `chunks` stream is being consumed, releasing it when the stream ends."""
+        try:
+            yield from chunks
+        finally:
+            slot.release()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "running": self._running,
+                "waiting": len(self._waiting),
+                "max_concurrent": self.max_concurrent,
+                "admitted_total": self.admitted_total,
+                "rejected_total": dict(self.rejected_total),
+            }
+
+    def _release(self, user: Hashable) -> None:
+        with self._cond:
+            self._running -= 1
+            self._running_by_user[user] -= 1
+            if not self._running_by_user[user]:
+                del self._running_by_user[user]
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        granted = False
+        while self._running < self.max_concurrent:
+            eligible = [
+                t
+                for t in self._waiting
+                if not self.max_per_user or self._running_by_user.get(t.user, 0) < self.max_per_user
+            ]
+            if not eligible:
+                break
+            ticket = min(eligible, key=lambda t: (t.priority, self._running_by_user.get(t.user, 0), t.seq))
+            self._waiting.remove(ticket)
+            ticket.granted = True
+            self._running += 1
+            self._running_by_user[ticket.user] += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+
+stream_scheduler = StreamScheduler.from_settings()
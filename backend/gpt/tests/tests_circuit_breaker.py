@@ -0,0 +1,198 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from src.libs import openai
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from src.utils.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from src.utils.gpt import (
+    GPT_VERSIONS,
+    GPTVersion,
+    breaker_for,
+    get_conversation_answer,
+    is_upstream_failure,
+    upstream_breakers,
+)
+from src.utils.metrics import REGISTRY
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            "test",
+            window=10,
+            min_calls=4,
+            error_rate_threshold=0.5,
+            slow_call_duration=2.0,
+            open_duration=5,
+            clock=self.clock,
+        )
+
+    def test_opens_on_error_rate(self):
+        for failed in (False, True, False, True):
+            self.breaker.acquire()
+            self.breaker.record_failure() if failed else self.breaker.record_success(0.1)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError) as ctx:
+            self.breaker.acquire()
+        self.assertEqual(ctx.exception.retry_after, 5)
+
+    def test_opens_on_slow_calls(self):
+        for latency in (3.0, 0.1, 3.0, 0.1):
+            self.breaker.record_success(latency)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_old_failures_leave_the_window(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.clock.now = 11
+        self.breaker.record_failure()
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_probe_closes_breaker(self):
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.clock.now = 5
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.acquire()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.acquire()  # only one probe at a time
+        self.breaker.record_success(0.1)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_probe_failure_reopens(self):
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.clock.now = 5
+
+        with self.assertRaises(RuntimeError):
+            with self.breaker.protect():
+                raise RuntimeError("still down")
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.snapshot()["opened_total"], 2)
+
+    def test_only_upstream_failures_count(self):
+        self.breaker.is_failure = lambda error: not isinstance(error, ValueError)
+        for _ in range(4):
+            self.breaker.acquire()
+            self.breaker.record_failure()
+        self.clock.now = 5
+
+        with self.assertRaises(ValueError):
+            with self.breaker.protect():
+                raise ValueError("bad request")
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.acquire()  # the probe was given back
+
+    def test_metrics(self):
+        with mock.patch.dict(upstream_breakers, clear=True):
+            breaker = breaker_for(GPTVersion("metered", "metered-engine"))
+            breaker.min_calls = 1
+            breaker.acquire()
+            breaker.record_failure()
+            with self.assertRaises(CircuitOpenError):
+                breaker.acquire()
+
+        metrics = REGISTRY.render().splitlines()
+        for line in (
+            'gpt_breaker_state{model="metered",state="closed"} 0',
+            'gpt_breaker_state{model="metered",state="open"} 1',
+            'gpt_breaker_consecutive_failures{model="metered"} 1',
+            'gpt_breaker_rejected_calls_total{model="metered"} 1',
+            'gpt_breaker_transitions_total{model="metered",state="open"} 1',
+        ):
+            self.assertIn(line, metrics)
+
+
+class UpstreamCircuitBreakerTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.mock_user.set_password("password")
+        cls.mock_user.save()
+
+    def setUp(self):
+        is_logged_in = self.client.login(email="mock@email.com", password="password")
+        assert is_logged_in, "User login failed"
+
+        self.server = FakeOpenAIServer(FakeOpenAIConfig(error_rate=1.0)).start()
+        self.addCleanup(self.server.stop)
+
+        self.breaker = CircuitBreaker("fake", min_calls=2, open_duration=30)
+        version = GPTVersion("fake", "fake-engine", api_base=self.server.url, api_key="test", api_type="open_ai")
+        for patcher in (
+            mock.patch.dict(GPT_VERSIONS, {"fake": version}, clear=True),
+            mock.patch.dict(upstream_breakers, {"fake": self.breaker}, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.conversation = [{"role": "user", "content": "Hi"}]
+
+    def test_failures_open_the_breaker_and_stop_upstream_calls(self):
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                list(get_conversation_answer(self.conversation, "fake"))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        response = self.client.post(
+            "/gpt/conversation/",
+            data=json.dumps({"conversation": self.conversation, "model": "fake"}),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "30")
+        self.assertEqual(self.server.stats.requests, 2)
+
+    def test_deployments_have_their_own_breaker(self):
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                list(get_conversation_answer(self.conversation, "fake"))
+
+        secondary = GPTVersion("secondary", "secondary-engine", api_base=self.server.url)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker_for(secondary).state, CircuitBreaker.CLOSED)
+
+    def test_invalid_requests_leave_the_breaker_closed(self):
+        self.server.config.error_status = 400
+        self.breaker.is_failure = is_upstream_failure
+
+        for _ in range(4):
+            with self.assertRaises(openai.error.InvalidRequestError):
+                list(get_conversation_answer(self.conversation, "fake"))
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.snapshot()["calls"], 0)
+
+    def test_breaker_state_endpoint(self):
+        self.breaker.record_failure()
+        for url in ("/gpt/circuit_breaker/", "/gpt/scheduler/"):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        CustomUser.objects.filter(pk=self.mock_user.pk).update(is_staff=True)
+        response = self.client.get("/gpt/circuit_breaker/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        [snapshot] = response.json()["breakers"]
+        self.assertEqual((snapshot["name"], snapshot["state"], snapshot["calls"]), ("fake", CircuitBreaker.CLOSED, 1))
@@ -0,0 +1,121 @@
+import json
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from src.utils.gpt import GPT_VERSIONS, STREAMS_IN_FLIGHT, GPTVersion, get_conversation_answer
+from src.utils.hedging import HedgePolicy, LatencyTracker, hedged_stream, ttft_tracker
+
+
+def _fake_version(name: str, server: FakeOpenAIServer) -> GPTVersion:
+    return GPTVersion(name, f"{name}-engine", api_base=server.url, api_key="test", api_type="open_ai")
+
+
+class HedgedStreamTests(SimpleTestCase):
+    def test_primary_wins_without_hedging(self):
+        secondary = mock.Mock(return_value=iter(["never"]))
+        chunks = list(hedged_stream(lambda: iter(["a", "b"]), secondary, delay=1.0))
+
+        self.assertEqual(chunks, ["a", "b"])
+        secondary.assert_not_called()
+
+    def test_slow_primary_is_hedged(self):
+        def slow():
+            time.sleep(0.5)
+            yield "slow"
+
+        chunks = list(hedged_stream(slow, lambda: iter(["fast", "!"]), delay=0.05))
+        self.assertEqual(chunks, ["fast", "!"])
+
+    def test_failed_primary_hedges_immediately(self):
+        def broken():
+            raise ConnectionError("upstream down")
+            yield
+
+        started_at = time.monotonic()
+        chunks = list(hedged_stream(broken, lambda: iter(["ok"]), delay=5.0))
+        self.assertEqual(chunks, ["ok"])
+        self.assertLess(time.monotonic() - started_at, 1.0)
+
+    def test_both_legs_failing_raises(self):
+        def broken():
+            raise ConnectionError("upstream down")
+            yield
+
+        with self.assertRaises(ConnectionError):
+            list(hedged_stream(broken, broken, delay=0.01))
+
+    def test_policy_delay_uses_percentile_once_warmed_up(self):
+        tracker = LatencyTracker()
+        policy = HedgePolicy(enabled=True, percentile=50, min_samples=3, default_delay=2.0, min_delay=0.01)
+        self.assertEqual(policy.delay_for("gpt35", tracker), 2.0)
+
+        for sample in (0.1, 0.2, 0.3):
+            tracker.record("gpt35", sample)
+        self.assertEqual(policy.delay_for("gpt35", tracker), 0.2)
+
+
+class HedgedConversationAnswerTests(SimpleTestCase):
+    def setUp(self):
+        self.slow_server = FakeOpenAIServer(FakeOpenAIConfig(reply="slow answer", first_token_delay=1.0)).start()
+        self.fast_server = FakeOpenAIServer(FakeOpenAIConfig(reply="fast answer")).start()
+        self.addCleanup(self.slow_server.stop)
+        self.addCleanup(self.fast_server.stop)
+
+        versions = {"primary": _fake_version("primary", self.slow_server)}
+        versions["secondary"] = _fake_version("secondary", self.fast_server)
+        patcher = mock.patch.dict(GPT_VERSIONS, versions)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.conversation = [{"role": "user", "content": "Hi"}]
+        ttft_tracker.reset()
+        self.addCleanup(ttft_tracker.reset)
+
+    def test_hedge_to_secondary_deployment(self):
+        policy = HedgePolicy(enabled=True, targets={"primary": "secondary"}, default_delay=0.1)
+
+        started_at = time.monotonic()
+        answer = "".join(get_conversation_answer(self.conversation, "primary", hedge_policy=policy))
+
+        self.assertEqual(answer, "fast answer")
+        self.assertLess(time.monotonic() - started_at, 1.0)
+        self.assertEqual(self.slow_server.stats.requests, 1)
+        self.assertEqual(self.fast_server.stats.requests, 1)
+
+    def test_losing_connection_is_dropped(self):
+        policy = HedgePolicy(enabled=True, targets={"primary": "secondary"}, default_delay=0.1)
+        in_flight = json.dumps(["primary"])
+
+        with mock.patch.object(CircuitBreaker, "record_failure") as record_failure:
+            answer = "".join(get_conversation_answer(self.conversation, "primary", hedge_policy=policy))
+            deadline = time.monotonic() + 0.5
+            while STREAMS_IN_FLIGHT.dump()[in_flight] and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        self.assertEqual(answer, "fast answer")
+        # The slow server only answers after a second, the primary leg must not wait for it
+        self.assertEqual(STREAMS_IN_FLIGHT.dump()[in_flight], 0)
+        record_failure.assert_not_called()
+        # The cancelled primary counts as at least as slow as the time it was given
+        self.assertEqual(ttft_tracker.count("primary"), 1)
+        self.assertGreaterEqual(ttft_tracker.percentile("primary", 100), 0.1)
+
+    def test_hedging_disabled(self):
+        policy = HedgePolicy(enabled=False, targets={"primary": "secondary"}, default_delay=0.1)
+
+        answer = "".join(get_conversation_answer(self.conversation, "primary", hedge_policy=policy))
+
+        self.assertEqual(answer, "slow answer")
+        self.assertEqual(self.fast_server.stats.requests, 0)
+
+    def test_fast_primary_is_not_hedged(self):
+        policy = HedgePolicy(enabled=True, targets={"secondary": "primary"}, default_delay=0.5)
+
+        answer = "".join(get_conversation_answer(self.conversation, "secondary", hedge_policy=policy))
+
+        self.assertEqual(answer, "fast answer")
+        self.assertEqual(self.slow_server.stats.requests, 0)
@@ -0,0 +1,84 @@
+import os
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import LiveServerTestCase, SimpleTestCase
+
+from chat.models import Conversation, Role
+from src.utils.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from src.utils.gpt import GPT_VERSIONS, GPTVersion
+from src.utils.load_generator import LoadConfig, LoadReport, percentile, run_deployment, run_load
+
+
+class LoadReportTests(SimpleTestCase):
+    def test_percentile(self):
+        values = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_summary(self):
+        report = LoadReport()
+        report.elapsed = 2.0
+        report.record("add_message", 0.1)
+        report.record("add_message", 0.3, error="500")
+        report.record_stream(ttft=0.05, tokens=10, duration=0.5)
+
+        summary = report.summary()
+
+        self.assertEqual(summary["requests"], 2)
+        self.assertEqual(summary["throughput_rps"], 1.0)
+        self.assertEqual(summary["endpoints"]["add_message"]["error_rate"], 0.5)
+        self.assertEqual(summary["endpoints"]["add_message"]["errors"], {"500": 1})
+        self.assertEqual(summary["streams"]["ttft_p50_ms"], 50.0)
+        self.assertEqual(summary["streams"]["tokens_per_s_p50"], 20.0)
+
+    @mock.patch("src.utils.load_generator.run_load", return_value=LoadReport())
+    @mock.patch("src.utils.load_generator._wait_until_up")
+    @mock.patch("src.utils.load_generator.subprocess")
+    def test_deployment_uses_a_throwaway_database(self, subprocess, wait_until_up, run_load):
+        run_deployment("wsgi", LoadConfig(users=1), "http://127.0.0.1:1", port=1)
+
+        paths = {call.kwargs["env"]["DATABASE_PATH"] for call in subprocess.run.call_args_list}
+        paths.add(subprocess.Popen.call_args.kwargs["env"]["DATABASE_PATH"])
+        self.assertEqual(len(paths), 1)
+        path = paths.pop()
+        self.assertNotEqual(path, str(settings.DATABASES["default"]["NAME"]))
+        self.assertFalse(os.path.exists(os.path.dirname(path)))
+
+
+class LoadGeneratorTests(LiveServerTestCase):
+    def setUp(self):
+        Role.objects.get_or_create(name="user")
+        Role.objects.get_or_create(name="assistant")
+        call_command("create_load_users", count=1, stdout=StringIO())
+
+        self.server = FakeOpenAIServer(FakeOpenAIConfig(reply="one two three four")).start()
+        self.addCleanup(self.server.stop)
+        version = GPTVersion("gpt35", "fake-engine", api_base=self.server.url, api_key="test", api_type="open_ai")
+        patcher = mock.patch.dict(GPT_VERSIONS, {"gpt35": version})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_runs_every_operation_against_a_live_server(self):
+        config = LoadConfig(base_url=self.live_server_url, users=1, operations=12, seed=3)
+
+        summary = run_load(config).summary()
+
+        for endpoint in ("login", "add_conversation", "add_message", "add_version", "stream_answer"):
+            self.assertIn(endpoint, summary["endpoints"])
+            self.assertEqual(summary["endpoints"][endpoint]["errors"], {}, endpoint)
+        self.assertGreater(summary["streams"]["count"], 0)
+        self.assertTrue(Conversation.objects.filter(user__email="load-0@example.com").exists())
+
+    def test_tabs_share_the_user_and_ask_for_titles(self):
+        config = LoadConfig(base_url=self.live_server_url, users=1, tabs=2, operations=3, mix={"title": 1})
+
+        summary = run_load(config).summary()
+
+        self.assertEqual(summary["endpoints"]["login"]["requests"], 2)
+        self.assertEqual(summary["endpoints"]["title"]["errors"], {})
+        self.assertEqual(summary["endpoints"]["title"]["requests"], 6)
+        self.assertNotIn("add_conversation", summary["endpoints"])
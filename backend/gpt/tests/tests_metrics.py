@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from src.utils.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from src.utils.gpt import GPT_VERSIONS, GPTVersion
+from src.utils.metrics import Counter, Gauge, Histogram, Registry
+
+
+def _sample(text: str, line_prefix: str) -> float:
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"No sample {line_prefix} in\n{text}")
+
+
+class RegistryTests(SimpleTestCase):
+    def test_render(self):
+        registry = Registry()
+        requests = Counter("requests_total", "Requests", ["view"], registry=registry)
+        in_flight = Gauge("in_flight", "In flight", registry=registry)
+        latency = Histogram("latency_seconds", "Latency", ["view"], buckets=(0.1, 1.0), registry=registry)
+
+        requests.inc(view="a")
+        requests.inc(2, view='b"')
+        in_flight.inc()
+        latency.observe(0.05, view="a")
+        latency.observe(0.5, view="a")
+        latency.observe(5, view="a")
+
+        text = registry.render()
+        self.assertIn("# TYPE requests_total counter", text)
+        self.assertIn('requests_total{view="a"} 1', text)
+        self.assertIn('requests_total{view="b\\""} 2', text)
+        self.assertIn("in_flight 1", text)
+        self.assertIn('latency_seconds_bucket{view="a",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{view="a",le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{view="a",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{view="a"} 3', text)
+        self.assertEqual(_sample(text, 'latency_seconds_sum{view="a"}'), 5.55)
+
+    def test_label_mismatch(self):
+        counter = Counter("c", "C", ["view"], registry=Registry())
+        with self.assertRaises(ValueError):
+            counter.inc(method="GET")
+
+    def test_multiprocess_merge(self):
+        with tempfile.TemporaryDirectory() as directory:
+            other = Registry(directory)
+            Counter("requests_total", "Requests", registry=other).inc(3)
+            Gauge("in_flight", "In flight", registry=other).inc(5)
+            Histogram("latency_seconds", "Latency", buckets=(1.0,), registry=other).observe(0.5)
+            with open(os.path.join(directory, "999999999.json"), "w") as f:  # a worker that has exited
+                json.dump(other.dump(), f)
+
+            registry = Registry(directory)
+            Counter("requests_total", "Requests", registry=registry).inc()
+            Gauge("in_flight", "In flight", registry=registry).inc()
+            Histogram("latency_seconds", "Latency", buckets=(1.0,), registry=registry).observe(2.0)
+
+            text = registry.render()
+
+        self.assertIn("requests_total 4", text)
+        self.assertIn("in_flight 1", text)
+        self.assertIn('latency_seconds_bucket{le="1"} 1', text)
+        self.assertIn("latency_seconds_count 2", text)
+
+
+class MetricsEndpointTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.mock_user.set_password("password")
+        cls.mock_user.save()
+
+    def setUp(self):
+        is_logged_in = self.client.login(email="mock@email.com", password="password")
+        assert is_logged_in, "User login failed"
+
+        self.server = FakeOpenAIServer(FakeOpenAIConfig(reply="one two three")).start()
+        self.addCleanup(self.server.stop)
+        version = GPTVersion("gpt35", "fake-engine", api_base=self.server.url, api_key="test", api_type="open_ai")
+        patcher = mock.patch.dict(GPT_VERSIONS, {"gpt35": version})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _metrics(self) -> str:
+        with self.settings(METRICS_TOKEN="secret"):
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        return response.content.decode()
+
+    @override_settings(METRICS_TOKEN="secret", METRICS_ALLOWED_IPS=["10.0.0.5"])
+    def test_access(self):
+        for headers in ({}, {"HTTP_AUTHORIZATION": "Bearer wrong"}, {"HTTP_AUTHORIZATION": "Basic secret"}):
+            with self.subTest(headers=headers):
+                self.assertEqual(self.client.get("/metrics", **headers).status_code, 403)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.5").status_code, 200)
+
+        with self.settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+
+    def test_request_metrics(self):
+        before = self._metrics()
+        self.client.get(reverse("get_conversations"))
+        after = self._metrics()
+
+        prefix = 'http_requests_total{view="get_conversations",method="GET",status="200"}'
+        self.assertEqual(_sample(after, prefix) - (_sample(before, prefix) if prefix in before else 0), 1)
+        self.assertIn('http_request_duration_seconds_count{view="get_conversations",method="GET"}', after)
+        self.assertIn('http_request_db_queries_count{view="get_conversations"}', after)
+
+    def test_stream_metrics(self):
+        response = self.client.post(reverse("get_answer"), {"user_question": "Hi"}, format="json")
+        b"".join(response.streaming_content)
+
+        text = self._metrics()
+        self.assertEqual(_sample(text, 'gpt_streams_in_flight{model="gpt35"}'), 0)
+        self.assertGreaterEqual(_sample(text, 'gpt_stream_tokens_total{model="gpt35"}'), 3)
+        self.assertIn('gpt_time_to_first_token_seconds_count{model="gpt35"}', text)
+        self.assertIn('gpt_tokens_per_second_count{model="gpt35"}', text)
@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from authentication.models import CustomUser
+from gpt.scheduler import AdmissionRejected, StreamScheduler
+
+
+def _acquire_in_background(scheduler, user, priority, granted_order):
+    def run():
+        slot = scheduler.acquire(user, priority, timeout=5)
+        granted_order.append(user)
+        slot.release()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    # make sure tickets are enqueued in a known order
+    deadline = time.monotonic() + 1
+    while thread.is_alive() and time.monotonic() < deadline:
+        if user in [t.user for t in scheduler._waiting]:
+            break
+        time.sleep(0.001)
+    return thread
+
+
+class StreamSchedulerTests(SimpleTestCase):
+    def test_global_cap(self):
+        scheduler = StreamScheduler(max_concurrent=2, max_per_user=0, max_queue=10, queue_timeout=0.05)
+        first, second = scheduler.acquire("a"), scheduler.acquire("b")
+
+        with self.assertRaises(AdmissionRejected) as ctx:
+            scheduler.acquire("c")
+        self.assertEqual(ctx.exception.reason, "timeout")
+
+        first.release()
+        scheduler.acquire("c").release()
+        second.release()
+        self.assertEqual(scheduler.snapshot()["running"], 0)
+
+    def test_queue_full(self):
+        scheduler = StreamScheduler(max_concurrent=1, max_per_user=0, max_queue=0)
+
+        with self.assertRaises(AdmissionRejected) as ctx:
+            scheduler.acquire("a")
+        self.assertEqual(ctx.exception.reason, "queue_full")
+
+    def test_per_user_cap(self):
+        scheduler = StreamScheduler(max_concurrent=4, max_per_user=1, max_queue=10, queue_timeout=0.05)
+        scheduler.acquire("greedy")
+
+        with self.assertRaises(AdmissionRejected):
+            scheduler.acquire("greedy")
+        scheduler.acquire("other").release()
+
+    def test_fair_share_and_title_priority(self):
+        scheduler = StreamScheduler(max_concurrent=2, max_per_user=0, max_queue=10)
+        greedy_slots = [scheduler.acquire("greedy"), scheduler.acquire("greedy")]
+        granted_order = []
+
+        threads = [
+            _acquire_in_background(scheduler, "greedy", StreamScheduler.ANSWER, granted_order),
+            _acquire_in_background(scheduler, "polite", StreamScheduler.ANSWER, granted_order),
+            _acquire_in_background(scheduler, "titler", StreamScheduler.TITLE, granted_order),
+        ]
+        for slot in greedy_slots:
+            slot.release()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(granted_order, ["titler", "polite", "greedy"])
+
+    def test_hold_releases_when_stream_closes(self):
+        scheduler = StreamScheduler(max_concurrent=1, max_per_user=0, max_queue=10)
+        stream = scheduler.hold(scheduler.acquire("a"), iter(["a", "b"]))
+        next(stream)
+        stream.close()
+
+        self.assertEqual(scheduler.snapshot()["running"], 0)
+
+
+class AdmissionControlViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        cls.mock_user.set_password("password")
+        cls.mock_user.save()
+
+    def setUp(self):
+        is_logged_in = self.client.login(email="mock@email.com", password="password")
+        assert is_logged_in, "User login failed"
+
+    def test_conversation_rejected_when_saturated(self):
+        scheduler = StreamScheduler(max_concurrent=1, max_per_user=0, max_queue=10, queue_timeout=0.01)
+        slot = scheduler.acquire("someone else")
+        self.addCleanup(slot.release)
+
+        with mock.patch("gpt.views.stream_scheduler", scheduler):
+            response = self.client.post(
+                "/gpt/conversation/",
+                data=json.dumps({"conversation": [{"role": "user", "content": "Hi"}], "model": "gpt35"}),
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(scheduler.snapshot()["rejected_total"], {"timeout": 1})
@@ -0,0 +1,76 @@
+import json
+import time
+from unittest import mock
+
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+
+from authentication.models import CustomUser
+from chat.models import DEFAULT_CONVERSATION_TITLE, Conversation
+from gpt.titles import generate_conversation_title
+from src.utils.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+from src.utils.gpt import GPT_VERSIONS, GPTVersion
+
+
+class BackgroundTitleTests(APITransactionTestCase):
+    def setUp(self):
+        self.mock_user = CustomUser.objects.create(email="mock@email.com", is_active=True)
+        self.mock_user.set_password("password")
+        self.mock_user.save()
+        is_logged_in = self.client.login(email="mock@email.com", password="password")
+        assert is_logged_in, "User login failed"
+
+        self.server = FakeOpenAIServer(FakeOpenAIConfig(reply='"Friendly greeting"')).start()
+        self.addCleanup(self.server.stop)
+        version = GPTVersion("gpt35", "fake-engine", api_base=self.server.url, api_key="test", api_type="open_ai")
+        patcher = mock.patch.dict(GPT_VERSIONS, {"gpt35": version})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.conversation = Conversation.objects.create(user=self.mock_user)
+
+    def _wait_for_title(self, timeout: float = 5.0) -> str:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.conversation.refresh_from_db()
+            if self.conversation.title != DEFAULT_CONVERSATION_TITLE:
+                break
+            time.sleep(0.02)
+        return self.conversation.title
+
+    def test_title_generated_while_answer_streams(self):
+        response = self.client.post(
+            "/gpt/conversation/",
+            data=json.dumps(
+                {
+                    "conversation": [{"role": "user", "content": "Hi there"}],
+                    "model": "gpt35",
+                    "conversation_id": str(self.conversation.id),
+                }
+            ),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        answer = b"".join(response.streaming_content).decode()
+
+        self.assertEqual(answer, '"Friendly greeting"')
+        self.assertEqual(self._wait_for_title(), "Friendly greeting")
+        self.assertEqual(self.server.stats.requests, 2)
+
+    def test_no_title_without_conversation_id(self):
+        response = self.client.post(
+            "/gpt/conversation/",
+            data=json.dumps({"conversation": [{"role": "user", "content": "Hi there"}], "model": "gpt35"}),
+            content_type="application/json",
+        )
+        b"".join(response.streaming_content)
+
+        self.assertEqual(self.server.stats.requests, 1)
+
+    def test_user_title_is_not_overwritten(self):
+        Conversation.objects.filter(pk=self.conversation.pk).update(title="Chosen by user")
+
+        generate_conversation_title(self.conversation.id, "Hi there", "Hello")
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.title, "Chosen by user")
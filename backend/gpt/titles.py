@@ -0,0 +1,64 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from chat import live
+from chat.models import DEFAULT_CONVERSATION_TITLE, Conversation
+from src.utils.gpt import get_gpt_title
+
+__all__ = ["generate_conversation_title", "submit_title_generation", "with_background_title"]
+
+logger = logging.getLogger(__name__)
+
+_title_executor = ThreadPoolExecutor(max_workers=settings.GPT_TITLE_WORKERS, thread_name_prefix="gpt-title")
+_pending_titles = threading.BoundedSemaphore(settings.GPT_TITLE_MAX_PENDING)
+
+
+def generate_conversation_title(conversation_id, user_question: str, chatbot_response: str) -> Optional[str]:
+    """
+    Generates a title and stores it on the conversation, unless the conversation got a title in the meantime.
+
+    Returns the generated title, or None if it could not be generated.
+    """
+    try:
+        title = get_gpt_title(user_question, chatbot_response)[: Conversation._meta.get_field("title").max_length]
+        # Conditional UPDATE so a title set by the user while we were waiting is never overwritten
+        if Conversation.objects.filter(pk=conversation_id, title=DEFAULT_CONVERSATION_TITLE).update(title=title):
+            live.publish(conversation_id, "title", title=title)
+        return title
+    except Exception:
+        logger.exception("Title generation failed for conversation %s", conversation_id)
+        return None
+    finally:
+        close_old_connections()
+
+
+def submit_title_generation(conversation_id, user_question: str, chatbot_response: str) -> Optional[Future]:
+    """Queues title generation on the background pool. Returns None when the pool is saturated."""
+    if not _pending_titles.acquire(blocking=False):
+        logger.warning("Title generation queue is full, skipping conversation %s", conversation_id)
+        return None
+
+    future = _title_executor.submit(generate_conversation_title, conversation_id, user_question, chatbot_response)
+    future.add_done_callback(lambda _: _pending_titles.release())
+    return future
+
+
+def with_background_title(chunks: Iterator[str], conversation_id, user_question: str) -> Iterator[str]:
+    """
+    Passes `chunks` through unchanged and launches title generation as soon as the first chunk is available, so the
+    title is generated concurrently with the rest of the answer.
+    """
+    submitted = False
+    try:
+        for chunk in chunks:
+            if not submitted:
+                submit_title_generation(conversation_id, user_question, chunk)
+                submitted = True
+            yield chunk
+    finally:
+        chunks.close()
@@ -3,8 +3,10 @@ from django.urls import path
 from gpt import views
 
 urlpatterns = [
-    path("", views.gpt_root_view),
-    path("title/", views.get_title),
-    path("question/", views.get_answer),
-    path("conversation/", views.get_conversation),
+    path("", views.gpt_root_view, name="gpt_root_view"),
+    path("title/", views.get_title, name="get_title"),
+    path("question/", views.get_answer, name="get_answer"),
+    path("conversation/", views.get_conversation, name="get_conversation"),
+    path("circuit_breaker/", views.get_circuit_breaker_state, name="get_circuit_breaker_state"),
+    path("scheduler/", views.get_scheduler_state, name="get_scheduler_state"),
 ]
@@ -1,8 +1,80 @@
+import uuid
+from functools import wraps
+from itertools import chain
+from math import ceil
+
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import status
 from rest_framework.decorators import api_view
 
-from src.utils.gpt import get_conversation_answer, get_gpt_title, get_simple_answer
+from chat.models import DEFAULT_CONVERSATION_TITLE, Conversation
+from gpt.scheduler import AdmissionRejected, StreamScheduler, stream_scheduler
+from gpt.titles import with_background_title
+from src.utils.circuit_breaker import CircuitOpenError
+from src.utils.gpt import GPT_VERSIONS, breaker_for, get_conversation_answer, get_gpt_title, get_simple_answer
+
+
+def _upstream_unavailable(error: CircuitOpenError) -> JsonResponse:
+    response = JsonResponse({"detail": "GPT upstream is unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    response["Retry-After"] = str(ceil(error.retry_after))
+    return response
+
+
+class _PrimedStream:
+    """A stream whose first chunk was already pulled; closing it closes (and releases) the underlying stream."""
+
+    def __init__(self, head: list[str], chunks):
+        self.head = head
+        self.chunks = chunks
+
+    def __iter__(self):
+        return chain(self.head, self.chunks)
+
+    def close(self):
+        self.chunks.close()
+
+
+def _not_admitted(error: AdmissionRejected) -> JsonResponse:
+    response = JsonResponse({"detail": "Too many concurrent GPT requests"}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response["Retry-After"] = str(ceil(error.retry_after))
+    return response
+
+
+def _stream_response(request, chunks) -> StreamingHttpResponse | JsonResponse:
+    try:
+        slot = stream_scheduler.acquire(request.user.pk, StreamScheduler.ANSWER)
+    except AdmissionRejected as e:
+        return _not_admitted(e)
+    chunks = stream_scheduler.hold(slot, chunks)
+
+    # Pull the first chunk before committing to a 200 so an open circuit fails fast with a proper status
+    try:
+        first_chunk = next(chunks, None)
+    except CircuitOpenError as e:
+        chunks.close()
+        return _upstream_unavailable(e)
+    head = [first_chunk] if first_chunk is not None else []
+    return StreamingHttpResponse(_PrimedStream(head, chunks), content_type="text/html")
+
+
+def _staff_only(view):
+    """Operational state is for staff, like /metrics is for scrapers."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_staff:
+            return JsonResponse({"detail": "Staff only"}, status=status.HTTP_403_FORBIDDEN)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _parse_uuid(value) -> uuid.UUID | None:
+    try:
+        return uuid.UUID(str(value)) if value else None
+    except ValueError:
+        return None
 
 
 @api_view(["GET"])
@@ -10,11 +82,31 @@ def gpt_root_view(request):
     return JsonResponse({"message": "GPT endpoint works!"})
 
 
+@login_required
+@api_view(["GET"])
+@_staff_only
+def get_circuit_breaker_state(request):
+    return JsonResponse({"breakers": [breaker_for(version).snapshot() for version in GPT_VERSIONS.values()]})
+
+
+@login_required
+@api_view(["GET"])
+@_staff_only
+def get_scheduler_state(request):
+    return JsonResponse(stream_scheduler.snapshot())
+
+
 @login_required
 @api_view(["POST"])
 def get_title(request):
     data = request.data
-    title = get_gpt_title(data["user_question"], data["chatbot_response"])
+    try:
+        with stream_scheduler.slot(request.user.pk, StreamScheduler.TITLE):
+            title = get_gpt_title(data["user_question"], data["chatbot_response"])
+    except AdmissionRejected as e:
+        return _not_admitted(e)
+    except CircuitOpenError as e:
+        return _upstream_unavailable(e)
     return JsonResponse({"content": title})
 
 
@@ -22,13 +114,23 @@ def get_title(request):
 @api_view(["POST"])
 def get_answer(request):
     data = request.data
-    return StreamingHttpResponse(get_simple_answer(data["user_question"], stream=True), content_type="text/html")
+    return _stream_response(request, get_simple_answer(data["user_question"], stream=True))
 
 
 @login_required
 @api_view(["POST"])
 def get_conversation(request):
     data = request.data
-    return StreamingHttpResponse(
-        get_conversation_answer(data["conversation"], data["model"], stream=True), content_type="text/html"
-    )
+    chunks = get_conversation_answer(data["conversation"], data["model"], stream=True)
+
+    # When the client names an untitled conversation, its title is generated server-side alongside the answer
+    conversation_id = _parse_uuid(data.get("conversation_id"))
+    user_question = next((m["content"] for m in data["conversation"] if m.get("role") == "user"), None)
+    if conversation_id and user_question:
+        untitled = Conversation.objects.filter(
+            pk=conversation_id, user=request.user, title=DEFAULT_CONVERSATION_TITLE
+        ).exists()
+        if untitled:
+            chunks = with_background_title(chunks, conversation_id, user_question)
+
+    return _stream_response(request, chunks)
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+__all__ = ["CircuitBreaker", "CircuitOpenError"]
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit `{name}` is open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class _Attempt:
+    def __init__(self, clock: Callable[[], float]):
+        self._clock = clock
+        self.started_at = clock()
+        self.latency: Optional[float] = None
+
+    def first_byte(self) -> None:
+        if self.latency is None:
+            self.latency = self._clock() - self.started_at
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker for upstream calls.
+
+    The breaker opens when, over the last `window` seconds and at least `min_calls` calls, either the error rate reaches
+    `error_rate_threshold` or the share of calls slower than `slow_call_duration` reaches `slow_call_rate_threshold`.
+    While open every call fails immediately with `CircuitOpenError`. After `open_duration` seconds up to
+    `half_open_probes` calls are let through; a successful probe closes the breaker, a failed or slow one re-opens it.
+
+    `is_failure` tells which exceptions raised inside `protect` count as failures of the upstream. Others, e.g. errors
+    about the request itself, give the call back without recording it, so a few bad requests cannot open the breaker
+    for everyone. By default every exception counts.
+
+    `on_event`, e.g. to export metrics, is called with the breaker and one of `"success"`, `"failure"`, `"rejected"`
+    or the state the breaker just moved to. It runs with the breaker's lock held and must not call back into it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        window: float = 60.0,
+        min_calls: int = 10,
+        error_rate_threshold: float = 0.5,
+        slow_call_duration: float = 10.0,
+        slow_call_rate_threshold: float = 0.5,
+        open_duration: float = 30.0,
+        half_open_probes: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+        is_failure: Callable[[BaseException], bool] = lambda error: True,
+        on_event: Optional[Callable[["CircuitBreaker", str], None]] = None,
+    ):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+        self._clock = clock
+        self.is_failure = is_failure
+        self.on_event = on_event
+        self._lock = threading.Lock()
+        self._calls: deque = deque()  # (timestamp, failed, slow)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.rejected_total = 0
+        self.opened_total = 0
+        self.consecutive_failures = 0
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str = "GPT_BREAKER", **kwargs) -> "CircuitBreaker":
+        return cls(
+            name,
+            window=float(os.getenv(f"{prefix}_WINDOW", 60.0)),
+            min_calls=int(os.getenv(f"{prefix}_MIN_CALLS", 10)),
+            error_rate_threshold=float(os.getenv(f"{prefix}_ERROR_RATE", 0.5)),
+            slow_call_duration=float(os.getenv(f"{prefix}_SLOW_CALL_DURATION", 10.0)),
+            slow_call_rate_threshold=float(os.getenv(f"{prefix}_SLOW_CALL_RATE", 0.5)),
+            open_duration=float(os.getenv(f"{prefix}_OPEN_DURATION", 30.0)),
+            half_open_probes=int(os.getenv(f"{prefix}_HALF_OPEN_PROBES", 1)),
+            **kwargs,
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open(self._clock())
+            return self._state
+
+    def acquire(self) -> None:
+        """Reserves a call, raising `CircuitOpenError` when the breaker does not let it through."""
+        with self._lock:
+            now = self._clock()
+            self._maybe_half_open(now)
+            if self._state == self.OPEN or (
+                self._state == self.HALF_OPEN and self._probes_in_flight >= self.half_open_probes
+            ):
+                self.rejected_total += 1
+                self._emit("rejected")
+                raise CircuitOpenError(self.name, self._retry_after(now))
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight += 1
+
+    def record_success(self, latency: float) -> None:
+        self._record(failed=False, latency=latency)
+
+    def record_failure(self, latency: float = 0.0) -> None:
+        self._record(failed=True, latency=latency)
+
+    def release(self) -> None:
+        """Gives back a reserved call whose outcome is unknown (e.g. it was cancelled before any response)."""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes_in_flight:
+                self._probes_in_flight -= 1
+
+    @contextmanager
+    def protect(self) -> Iterator[_Attempt]:
+        """
+        Guards one upstream call. Call `attempt.first_byte()` when the first response byte arrives so that streamed
+        calls are judged by their time-to-first-byte rather than by their total duration.
+        """
+        self.acquire()
+        attempt = _Attempt(self._clock)
+        try:
+            yield attempt
+        except GeneratorExit:
+            if attempt.latency is None:
+                self.release()
+            else:
+                self.record_success(attempt.latency)
+            raise
+        except Exception as error:
+            if self.is_failure(error):
+                self.record_failure(self._clock() - attempt.started_at)
+            else:
+                self.release()
+            raise
+        else:
+            latency = attempt.latency if attempt.latency is not None else self._clock() - attempt.started_at
+            self.record_success(latency)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = self._clock()
+            self._maybe_half_open(now)
+            self._prune(now)
+            calls = len(self._calls)
+            failures = sum(1 for _, failed, _ in self._calls if failed)
+            slow = sum(1 for _, _, is_slow in self._calls if is_slow)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "calls": calls,
+                "error_rate": failures / calls if calls else 0.0,
+                "slow_call_rate": slow / calls if calls else 0.0,
+                "retry_after": self._retry_after(now) if self._state == self.OPEN else 0.0,
+                "rejected_total": self.rejected_total,
+                "opened_total": self.opened_total,
+                "consecutive_failures": self.consecutive_failures,
+            }
+
+    def _record(self, failed: bool, latency: float) -> None:
+        slow = latency >= self.slow_call_duration
+        with self._lock:
+            now = self._clock()
+            self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+            self._emit("failure" if failed else "success")
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self._state = self.CLOSED
+                    self._calls.clear()
+                    self._emit(self.CLOSED)
+                return
+            if self._state == self.OPEN:
+                return
+
+            self._calls.append((now, failed, slow))
+            self._prune(now)
+            calls = len(self._calls)
+            if calls < self.min_calls:
+                return
+            error_rate = sum(1 for _, is_failed, _ in self._calls if is_failed) / calls
+            slow_rate = sum(1 for _, _, is_slow in self._calls if is_slow) / calls
+            if error_rate >= self.error_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self._state = self.OPEN
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self._calls.clear()
+        self.opened_total += 1
+        self._emit(self.OPEN)
+
+    def _maybe_half_open(self, now: float) -> None:
+        if self._state == self.OPEN and now - self._opened_at >= self.open_duration:
+            self._state = self.HALF_OPEN
+            self._probes_in_flight = 0
+            self._emit(self.HALF_OPEN)
+
+    def _emit(self, event: str) -> None:
+        if self.on_event is not None:
+            self.on_event(self, event)
+
+    def _retry_after(self, now: float) -> float:
+        return max(0.0, self.open_duration - (now - self._opened_at))
+
+    def _prune(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
@@ -0,0 +1,226 @@
+"""
+A small OpenAI-compatible chat completion server for local testing, benchmarks and load tests.
+
+It answers both the Azure style (``/openai/deployments/<engine>/chat/completions``) and the OpenAI style
+(``/engines/<engine>/chat/completions``, ``/chat/completions``) routes, streams Server-Sent Events when asked to and
+can inject latency and errors so that hedging, circuit breaking and admission control can be exercised without
+touching the real upstream.
+
+Run it standalone with::
+
+    python -m src.utils.fake_openai --port 8100 --first-token-delay 0.2 --token-delay 0.01
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+__all__ = ["FakeOpenAIConfig", "FakeOpenAIServer"]
+
+
+@dataclass
+class FakeOpenAIConfig:
+    reply: Optional[str] = None  # fixed reply, otherwise the last user message is echoed back
+    reply_prefix: str = ""
+    first_token_delay: float = 0.0  # seconds before the first chunk (or the whole non-streamed answer)
+    token_delay: float = 0.0  # seconds between streamed chunks
+    error_rate: float = 0.0  # fraction of requests answered with `error_status`
+    error_status: int = 500
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeOpenAIStats:
+    requests: int = 0
+    errors: int = 0
+    completed_streams: int = 0
+    aborted_streams: int = 0
+    engines: list = field(default_factory=list)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002
+        pass
+
+    def do_POST(self):  # noqa: N802
+        path = self.path.split("?", 1)[0]
+        if not path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown route {path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        engine = _engine_from_path(path) or body.get("model", "")
+        config, stats = self.server.config, self.server.stats
+
+        with self.server.lock:
+            stats.requests += 1
+            stats.engines.append(engine)
+            failed = self.server.random.random() < config.error_rate
+            if failed:
+                stats.errors += 1
+
+        time.sleep(config.first_token_delay)
+        if failed:
+            self._send_json(config.error_status, {"error": {"message": "Injected failure", "type": "server_error"}})
+            return
+
+        content = self.server.make_reply(body.get("messages", []))
+        if body.get("stream"):
+            self._stream(engine, content)
+        else:
+            self._send_json(
+                200,
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "model": engine,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                },
+            )
+
+    def _stream(self, engine: str, content: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        tokens = [f"{word} " for word in content.split(" ")]
+        tokens[-1] = tokens[-1].rstrip()
+        try:
+            for idx, token in enumerate(tokens):
+                if idx:
+                    time.sleep(self.server.config.token_delay)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": engine,
+                    "choices": [{"index": 0, "delta": {"content": token}}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            with self.server.lock:
+                self.server.stats.aborted_streams += 1
+            return
+        with self.server.lock:
+            self.server.stats.completed_streams += 1
+        self.close_connection = True
+
+    def _send_json(self, status_code: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _engine_from_path(path: str) -> Optional[str]:
+    parts = path.strip("/").split("/")
+    for marker in ("deployments", "engines"):
+        if marker in parts and parts.index(marker) + 1 < len(parts):
+            return parts[parts.index(marker) + 1]
+    return None
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: FakeOpenAIConfig):
+        super().__init__(address, _Handler)
+        self.config = config
+        self.stats = FakeOpenAIStats()
+        self.lock = threading.Lock()
+        self.random = random.Random(config.seed)
+
+    def make_reply(self, messages: list[dict]) -> str:
+        if self.config.reply is not None:
+            return f"{self.config.reply_prefix}{self.config.reply}"
+        last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        return f"{self.config.reply_prefix}You said: {last_user}"
+
+
+class FakeOpenAIServer:
+    """
+    Runs the fake upstream in a background thread.
+
+    Examples
+    --------
+    >>> with FakeOpenAIServer(FakeOpenAIConfig(first_token_delay=0.5)) as server:
+    ...     GPTVersion("slow", "gpt-35-turbo-0613", api_base=server.url, api_key="test", api_type="open_ai")
+    """
+
+    def __init__(self, config: Optional[FakeOpenAIConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self._server = _Server((host, port), config or FakeOpenAIConfig())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def config(self) -> FakeOpenAIConfig:
+        return self._server.config
+
+    @property
+    def stats(self) -> FakeOpenAIStats:
+        return self._server.stats
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completion server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--reply", default=None)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(
+        reply=args.reply,
+        first_token_delay=args.first_token_delay,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    server = _Server((args.host, args.port), config)
+    print(f"Fake OpenAI server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,18 @@
+import os
+import socket
+import threading
+import time
 from dataclasses import dataclass
+from typing import Optional
+
+import requests
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 
 from src.libs import openai
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.hedging import HedgePolicy, hedged_stream, leg_cancelled, on_cancel, ttft_tracker
+from src.utils.metrics import Counter, Gauge, Histogram
 
 GPT_40_PARAMS = dict(
     temperature=0.7,
@@ -9,6 +21,8 @@ GPT_40_PARAMS = dict(
     presence_penalty=0,
     stop=None,
     stream=False,
+    # Fail before the library defaults do, so a degraded upstream cannot pin worker threads for minutes
+    request_timeout=float(os.getenv("OPENAI_REQUEST_TIMEOUT", 30.0)),
 )
 
 
@@ -16,6 +30,17 @@ GPT_40_PARAMS = dict(
 class GPTVersion:
     name: str
     engine: str
+    # Optional per-deployment overrides, the globally configured `openai` settings are used otherwise
+    api_base: Optional[str] = None
+    api_key: Optional[str] = None
+    api_type: Optional[str] = None
+    api_version: Optional[str] = None
+
+    def request_kwargs(self) -> dict:
+        overrides = dict(
+            api_base=self.api_base, api_key=self.api_key, api_type=self.api_type, api_version=self.api_version
+        )
+        return {"engine": self.engine, **{key: value for key, value in overrides.items() if value is not None}}
 
 
 GPT_VERSIONS = {
@@ -25,21 +50,159 @@ GPT_VERSIONS = {
     "gpt4-32k": GPTVersion("gpt4-32k", "gpt4-32k-0613"),
 }
 
+HEDGE_POLICY = HedgePolicy.from_env()
+
+
+def _shutdown(sock: socket.socket) -> None:
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _CancellableConnection(HTTPConnection):
+    def connect(self):
+        super().connect()
+        # Shutting the socket down wakes up a read blocked on it, closing it from another thread would not
+        on_cancel(lambda sock=self.sock: _shutdown(sock))
+
+
+class _CancellableHTTPSConnection(_CancellableConnection, HTTPSConnection):
+    pass
+
+
+class _CancellablePool(HTTPConnectionPool):
+    ConnectionCls = _CancellableConnection
+
+
+class _CancellableHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _CancellableHTTPSConnection
+
+
+class _CancellableAdapter(requests.adapters.HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _CancellablePool, "https": _CancellableHTTPSPool}
+
+
+def _make_session() -> requests.Session:
+    """Like openai's own session, but a losing hedge leg can drop its upstream connection, see `on_cancel`."""
+    session = requests.Session()
+    adapter = _CancellableAdapter(max_retries=openai.api_requestor.MAX_CONNECTION_RETRIES)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# openai keeps one session per thread, so every hedge leg gets its own
+openai.requestssession = _make_session
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Errors that say the upstream is unhealthy. Invalid requests and credentials are the caller's problem."""
+    if leg_cancelled():
+        # The connection of a losing hedge leg was dropped on purpose
+        return False
+    if isinstance(
+        error,
+        (
+            openai.error.Timeout,
+            openai.error.APIConnectionError,
+            openai.error.ServiceUnavailableError,
+            openai.error.RateLimitError,
+        ),
+    ):
+        return True
+    # Without a status, the response broke off or could not be parsed
+    return isinstance(error, openai.error.APIError) and (error.http_status is None or error.http_status >= 500)
+
+
+STREAMS_IN_FLIGHT = Gauge("gpt_streams_in_flight", "Upstream GPT streams being consumed", ["model"])
+TIME_TO_FIRST_TOKEN = Histogram("gpt_time_to_first_token_seconds", "Time to the first streamed token", ["model"])
+TOKENS_PER_SECOND = Histogram(
+    "gpt_tokens_per_second", "Streaming rate after the first token", ["model"], buckets=(5, 10, 20, 50, 100, 200, 500)
+)
+STREAM_TOKENS = Counter("gpt_stream_tokens_total", "Streamed tokens", ["model"])
+# Gauges of every worker are summed: the state one counts the workers whose breaker is in each state
+BREAKER_STATE = Gauge("gpt_breaker_state", "Workers whose circuit breaker is in this state", ["model", "state"])
+BREAKER_CONSECUTIVE_FAILURES = Gauge(
+    "gpt_breaker_consecutive_failures", "Upstream failures since the last success", ["model"]
+)
+BREAKER_REJECTED = Counter(
+    "gpt_breaker_rejected_calls_total", "Calls failed fast by an open circuit breaker", ["model"]
+)
+BREAKER_TRANSITIONS = Counter("gpt_breaker_transitions_total", "Circuit breaker state changes", ["model", "state"])
+BREAKER_STATES = (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)
+
+
+def _set_breaker_state(name: str, state: str) -> None:
+    for other in BREAKER_STATES:
+        BREAKER_STATE.set(int(other == state), model=name, state=other)
+
+
+def _record_breaker_event(breaker: CircuitBreaker, event: str) -> None:
+    if event == "rejected":
+        BREAKER_REJECTED.inc(model=breaker.name)
+    elif event in BREAKER_STATES:
+        _set_breaker_state(breaker.name, event)
+        BREAKER_TRANSITIONS.inc(model=breaker.name, state=event)
+    else:
+        BREAKER_CONSECUTIVE_FAILURES.set(breaker.consecutive_failures, model=breaker.name)
+
+
+# One breaker per `GPT_VERSIONS` entry, so a failing deployment does not fail fast the secondary it is hedged to
+upstream_breakers: dict[str, CircuitBreaker] = {}
+_upstream_breakers_lock = threading.Lock()
+
+
+def breaker_for(version: GPTVersion) -> CircuitBreaker:
+    with _upstream_breakers_lock:
+        if version.name not in upstream_breakers:
+            upstream_breakers[version.name] = CircuitBreaker.from_env(
+                version.name, is_failure=is_upstream_failure, on_event=_record_breaker_event
+            )
+            _set_breaker_state(version.name, CircuitBreaker.CLOSED)
+        return upstream_breakers[version.name]
+
+
+def _stream_chunks(version: GPTVersion, messages: list[dict[str, str]], **kwargs):
+    with breaker_for(version).protect() as attempt:
+        STREAMS_IN_FLIGHT.inc(model=version.name)
+        started_at = time.monotonic()
+        first_chunk_at = None
+        chunks = 0
+
+        try:
+            for resp in openai.ChatCompletion.create(**version.request_kwargs(), messages=messages, **kwargs):
+                attempt.first_byte()
+                choices = resp.get("choices", [])
+                if not choices:
+                    continue
+                chunk = choices.pop()["delta"].get("content")
+                if chunk:
+                    if first_chunk_at is None:
+                        first_chunk_at = time.monotonic()
+                        ttft_tracker.record(version.name, first_chunk_at - started_at)
+                        TIME_TO_FIRST_TOKEN.observe(first_chunk_at - started_at, model=version.name)
+                    chunks += 1
+                    yield chunk
+        finally:
+            if first_chunk_at is None and leg_cancelled():
+                # A losing hedge leg took at least this long, leaving it out would bias the hedge delay low
+                ttft_tracker.record(version.name, time.monotonic() - started_at)
+            STREAMS_IN_FLIGHT.dec(model=version.name)
+            # Streamed chat completions carry one token per chunk
+            STREAM_TOKENS.inc(chunks, model=version.name)
+            duration = time.monotonic() - first_chunk_at if first_chunk_at is not None else 0.0
+            if chunks > 1 and duration > 0:
+                TOKENS_PER_SECOND.observe(chunks / duration, model=version.name)
+
 
 def get_simple_answer(prompt: str, stream: bool = True):
     kwargs = {**GPT_40_PARAMS, **dict(stream=stream)}
+    messages = [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": prompt}]
 
-    for resp in openai.ChatCompletion.create(
-        engine=GPT_VERSIONS["gpt35"].engine,
-        messages=[{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": prompt}],
-        **kwargs,
-    ):
-        choices = resp.get("choices", [])
-        if not choices:
-            continue
-        chunk = choices.pop()["delta"].get("content")
-        if chunk:
-            yield chunk
+    yield from _stream_chunks(GPT_VERSIONS["gpt35"], messages, **kwargs)
 
 
 def get_gpt_title(prompt: str, response: str):
@@ -50,28 +213,33 @@ def get_gpt_title(prompt: str, response: str):
     )
     usr_msg = f'user_question: "{prompt}"\n' f'chatbot_response: "{response}"'
 
-    response = openai.ChatCompletion.create(
-        engine=GPT_VERSIONS["gpt35"].engine,
-        messages=[{"role": "system", "content": sys_msg}, {"role": "user", "content": usr_msg}],
-        **GPT_40_PARAMS,
-    )
+    version = GPT_VERSIONS["gpt35"]
+    with breaker_for(version).protect():
+        response = openai.ChatCompletion.create(
+            **version.request_kwargs(),
+            messages=[{"role": "system", "content": sys_msg}, {"role": "user", "content": usr_msg}],
+            **GPT_40_PARAMS,
+        )
 
     result = response["choices"][0]["message"]["content"].replace('"', "")
     return result
 
 
-def get_conversation_answer(conversation: list[dict[str, str]], model: str, stream: bool = True):
+def get_conversation_answer(
+    conversation: list[dict[str, str]], model: str, stream: bool = True, hedge_policy: Optional[HedgePolicy] = None
+):
     kwargs = {**GPT_40_PARAMS, **dict(stream=stream)}
-    engine = GPT_VERSIONS[model].engine
-
-    for resp in openai.ChatCompletion.create(
-        engine=engine,
-        messages=[{"role": "system", "content": "You are a helpful assistant."}, *conversation],
-        **kwargs,
-    ):
-        choices = resp.get("choices", [])
-        if not choices:
-            continue
-        chunk = choices.pop()["delta"].get("content")
-        if chunk:
-            yield chunk
+    version = GPT_VERSIONS[model]
+    messages = [{"role": "system", "content": "You are a helpful assistant."}, *conversation]
+
+    hedge_policy = hedge_policy or HEDGE_POLICY
+    secondary = hedge_policy.secondary_for(model) if stream else None
+    if secondary is None:
+        yield from _stream_chunks(version, messages, **kwargs)
+        return
+
+    yield from hedged_stream(
+        lambda: _stream_chunks(version, messages, **kwargs),
+        lambda: _stream_chunks(GPT_VERSIONS[secondary], messages, **kwargs),
+        delay=hedge_policy.delay_for(version.name),
+    )
@@ -0,0 +1,231 @@
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+
+__all__ = ["HedgePolicy", "LatencyTracker", "hedged_stream", "leg_cancelled", "on_cancel", "ttft_tracker"]
+
+StreamFactory = Callable[[], Iterator[str]]
+
+_current = threading.local()
+
+
+class LatencyTracker:
+    """
+    Keeps a rolling window of time-to-first-token samples per engine and answers percentile queries over it.
+    """
+
+    def __init__(self, window: int = 200):
+        self._samples: dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def count(self, key: str) -> int:
+        with self._lock:
+            return len(self._samples[key])
+
+    def percentile(self, key: str, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples[key])
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, max(0, round(pct / 100 * len(samples)) - 1))
+        return samples[idx]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+ttft_tracker = LatencyTracker()
+
+
+def _parse_targets(raw: str) -> dict[str, str]:
+    """Parses ``"gpt35:gpt35-16k,gpt4:gpt4-32k"`` into ``{"gpt35": "gpt35-16k", "gpt4": "gpt4-32k"}``."""
+    targets = {}
+    for pair in filter(None, (p.strip() for p in raw.split(","))):
+        primary, _, secondary = pair.partition(":")
+        if secondary:
+            targets[primary.strip()] = secondary.strip()
+    return targets
+
+
+@dataclass
+class HedgePolicy:
+    """
+    Decides whether and when a streamed completion is duplicated to a secondary `GPT_VERSIONS` entry.
+
+    The hedge delay is the `percentile` of the primary engine's recent time-to-first-token, clamped to
+    [`min_delay`, `max_delay`]. Until `min_samples` observations exist, `default_delay` is used instead.
+    """
+
+    enabled: bool = False
+    targets: dict[str, str] = field(default_factory=dict)
+    percentile: float = 95.0
+    min_delay: float = 0.05
+    max_delay: float = 5.0
+    default_delay: float = 1.0
+    min_samples: int = 20
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy":
+        return cls(
+            enabled=os.getenv("GPT_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes"),
+            targets=_parse_targets(os.getenv("GPT_HEDGE_TARGETS", "")),
+            percentile=float(os.getenv("GPT_HEDGE_PERCENTILE", 95.0)),
+            min_delay=float(os.getenv("GPT_HEDGE_MIN_DELAY", 0.05)),
+            max_delay=float(os.getenv("GPT_HEDGE_MAX_DELAY", 5.0)),
+            default_delay=float(os.getenv("GPT_HEDGE_DEFAULT_DELAY", 1.0)),
+            min_samples=int(os.getenv("GPT_HEDGE_MIN_SAMPLES", 20)),
+        )
+
+    def secondary_for(self, model: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        return self.targets.get(model)
+
+    def delay_for(self, key: str, tracker: LatencyTracker = ttft_tracker) -> float:
+        if tracker.count(key) < self.min_samples:
+            return self.default_delay
+        observed = tracker.percentile(key, self.percentile)
+        return min(self.max_delay, max(self.min_delay, observed))
+
+
+class _Leg(threading.Thread):
+    """Drains one upstream stream into the shared event queue until it finishes or is cancelled."""
+
+    def __init__(self, name: str, factory: StreamFactory, events: queue.Queue):
+        super().__init__(name=f"hedge-{name}", daemon=True)
+        self.factory = factory
+        self.events = events
+        self.cancelled = threading.Event()
+        self._on_cancel: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def run(self):
+        _current.leg = self
+        stream = None
+        try:
+            stream = self.factory()
+            for chunk in stream:
+                if self.cancelled.is_set():
+                    break
+                self.events.put((self, "chunk", chunk))
+            else:
+                self.events.put((self, "done", None))
+        except Exception as e:
+            self.events.put((self, "error", e))
+        finally:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if not self.cancelled.is_set():
+                self._on_cancel.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled.is_set():
+                return
+            self.cancelled.set()
+            callbacks, self._on_cancel = self._on_cancel, []
+        # The leg may be blocked reading from upstream, the callbacks are what interrupts it
+        for callback in callbacks:
+            callback()
+
+
+def on_cancel(callback: Callable[[], None]) -> None:
+    """
+    Runs `callback` from `cancel()` when the hedge leg running the calling thread loses, or right away if it already
+    has. Outside of a hedge leg this does nothing.
+    """
+    leg = getattr(_current, "leg", None)
+    if leg is not None:
+        leg.on_cancel(callback)
+
+
+def leg_cancelled() -> bool:
+    """Whether the calling thread is a hedge leg that has been cancelled."""
+    leg = getattr(_current, "leg", None)
+    return leg is not None and leg.cancelled.is_set()
+
+
+def hedged_stream(primary: StreamFactory, secondary: StreamFactory, delay: float) -> Iterator[str]:
+    """
+    Yields the chunks of whichever of two equivalent upstream streams produces its first chunk first.
+
+    The primary stream is started immediately. If it has not produced anything after `delay` seconds (or fails before
+    producing anything) the secondary stream is started too. The first leg to produce a chunk wins, the other one is
+    cancelled and its upstream connection closed.
+
+    Parameters
+    ----------
+    primary : StreamFactory
+        Callable returning the primary chunk iterator.
+    secondary : StreamFactory
+        Callable returning the secondary chunk iterator.
+    delay : float
+        Seconds to wait for the primary's first chunk before hedging.
+
+    Raises
+    ------
+    Exception
+        The last error raised by a leg, if both legs fail before producing a chunk.
+    """
+    events: queue.Queue = queue.Queue()
+    legs = [_Leg("primary", primary, events)]
+    legs[0].start()
+    deadline = time.monotonic() + delay
+    failed: list[Exception] = []
+    winner = None
+
+    try:
+        while winner is None:
+            hedged = len(legs) == 2
+            timeout = None if hedged else max(0.0, deadline - time.monotonic())
+            try:
+                leg, kind, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                legs.append(_Leg("secondary", secondary, events))
+                legs[-1].start()
+                continue
+
+            if kind == "error":
+                failed.append(payload)
+                if len(failed) == len(legs) and hedged:
+                    raise payload
+                if not hedged:
+                    legs.append(_Leg("secondary", secondary, events))
+                    legs[-1].start()
+                continue
+
+            winner = leg
+            for other in legs:
+                if other is not winner:
+                    other.cancel()
+            if kind == "done":
+                return
+            yield payload
+
+        while True:
+            leg, kind, payload = events.get()
+            if leg is not winner:
+                continue
+            if kind == "chunk":
+                yield payload
+            elif kind == "error":
+                raise payload
+            else:
+                return
+    finally:
+        for leg in legs:
+            leg.cancel()
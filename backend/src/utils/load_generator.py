@@ -0,0 +1,409 @@
+"""
+End-to-end load generator for the chat and GPT APIs.
+
+Virtual users log in through `/auth/login/` and then run a weighted mix of operations against a running
+deployment: creating conversations, adding messages, forking versions through `add_version` and streaming answers
+from `/gpt/conversation/`. Latency percentiles are reported per endpoint, together with time-to-first-token and
+tokens/s for streamed answers and the error rate of every endpoint.
+
+Run against an already running server, whose users are created with `manage.py create_load_users --count 20`:
+
+    python -m src.utils.load_generator --base-url http://127.0.0.1:8000 --users 20 --duration 30
+
+or let the tool start the bundled fake OpenAI server and compare a WSGI (`manage.py runserver`) and an ASGI
+(uvicorn, as in `server.py`) deployment of this backend one after the other:
+
+    python -m src.utils.load_generator --compare wsgi,asgi --users 20 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+import aiohttp
+
+from src.utils.fake_openai import FakeOpenAIConfig, FakeOpenAIServer
+
+__all__ = ["DEFAULT_MIX", "LoadConfig", "LoadReport", "run_load", "run_load_async", "started_deployment"]
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+DEFAULT_MIX = {"create_conversation": 1, "add_message": 4, "add_version": 1, "stream_answer": 2}
+# `title` calls the upstream without streaming, it is left out of the default mix
+OPERATIONS = (*DEFAULT_MIX, "title")
+
+DEPLOYMENTS = {
+    "wsgi": [sys.executable, "manage.py", "runserver", "--noreload", "127.0.0.1:{port}"],
+    "asgi": [sys.executable, "-m", "uvicorn", "backend.asgi:application", "--host", "127.0.0.1", "--port", "{port}"],
+}
+
+
+@dataclass
+class LoadConfig:
+    base_url: str = "http://127.0.0.1:8000"
+    users: int = 10
+    # Concurrent sessions (browser tabs) of every user, each one a virtual user of its own
+    tabs: int = 1
+    # Total operations per virtual user; `duration` (seconds) stops the run earlier when set
+    operations: int = 50
+    duration: Optional[float] = None
+    mix: dict = field(default_factory=lambda: dict(DEFAULT_MIX))
+    model: str = "gpt35"
+    password: str = "load-test-password"
+    email_prefix: str = "load"
+    seed: int = 0
+    timeout: float = 60.0
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class LoadReport:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.ttft: list[float] = []
+        self.tokens_per_second: list[float] = []
+        self.elapsed = 0.0
+
+    def record(self, endpoint: str, latency: float, error: Optional[str] = None) -> None:
+        self.latencies[endpoint].append(latency)
+        if error is not None:
+            self.errors[endpoint][error] += 1
+
+    def record_stream(self, ttft: float, tokens: int, duration: float) -> None:
+        self.ttft.append(ttft)
+        if duration > 0:
+            self.tokens_per_second.append(tokens / duration)
+
+    def summary(self) -> dict:
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            errors = sum(self.errors[endpoint].values())
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": dict(self.errors[endpoint]),
+                "error_rate": errors / len(values),
+                **{f"p{pct}_ms": round(percentile(values, pct) * 1000, 2) for pct in (50, 95, 99)},
+            }
+        total = sum(len(values) for values in self.latencies.values())
+        return {
+            "elapsed_s": round(self.elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / self.elapsed, 2) if self.elapsed else 0.0,
+            "endpoints": endpoints,
+            "streams": {
+                "count": len(self.ttft),
+                **{f"ttft_p{pct}_ms": round(percentile(self.ttft, pct) * 1000, 2) for pct in (50, 95, 99)},
+                "tokens_per_s_p50": round(percentile(self.tokens_per_second, 50), 2),
+            },
+        }
+
+
+class _VirtualUser:
+    def __init__(self, idx: int, tab: int, config: LoadConfig, report: LoadReport, session: aiohttp.ClientSession):
+        self.email = f"{config.email_prefix}-{idx}@example.com"
+        self.config = config
+        self.report = report
+        self.session = session
+        self.rng = random.Random(f"{config.seed}-{idx}" if tab == 0 else f"{config.seed}-{idx}-{tab}")
+        self.cookies: dict[str, str] = {}
+        # conversation id -> messages of its active version, as returned by the API
+        self.conversations: dict[str, list[dict]] = {}
+
+    def _headers(self) -> dict:
+        # Secure cookies are not sent back over plain http by cookie jars, so they are tracked by hand
+        headers = {"Cookie": "; ".join(f"{name}={value}" for name, value in self.cookies.items())}
+        if "csrftoken" in self.cookies:
+            headers["X-CSRFToken"] = self.cookies["csrftoken"]
+        return headers
+
+    async def _request(self, endpoint: str, method: str, path: str, payload: Optional[dict] = None):
+        """Sends one request and records it under `endpoint`, returning the decoded body or None on errors."""
+        url = self.config.base_url + path
+        started_at = time.perf_counter()
+        try:
+            async with self.session.request(method, url, json=payload, headers=self._headers()) as resp:
+                body = await resp.read()
+                self.cookies.update({name: morsel.value for name, morsel in resp.cookies.items()})
+                error = None if resp.status < 400 else str(resp.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            body, error = None, type(e).__name__
+        self.report.record(endpoint, time.perf_counter() - started_at, error)
+        if error is not None or not body:
+            return None
+        return json.loads(body)
+
+    async def login(self) -> bool:
+        credentials = {"email": self.email, "password": self.config.password}
+        await self._request("csrf_token", "GET", "/auth/csrf_token/")
+        return await self._request("login", "POST", "/auth/login/", credentials) is not None
+
+    async def run(self, deadline: Optional[float]) -> None:
+        if not await self.login():
+            return
+        operations = list(self.config.mix)
+        weights = [self.config.mix[op] for op in operations]
+        for _ in range(self.config.operations):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            operation = self.rng.choices(operations, weights)[0]
+            if operation not in ("create_conversation", "title") and not self.conversations:
+                operation = "create_conversation"
+            await getattr(self, operation)()
+
+    async def create_conversation(self) -> None:
+        messages = [
+            {"role": "user", "content": f"Question from {self.email}"},
+            {"role": "assistant", "content": "An answer"},
+        ]
+        data = await self._request("add_conversation", "POST", "/chat/conversations/add/", {"messages": messages})
+        if data:
+            self.conversations[data["id"]] = data["versions"][0]["messages"]
+
+    async def add_message(self) -> None:
+        conversation_id = self.rng.choice(list(self.conversations))
+        role = "user" if len(self.conversations[conversation_id]) % 2 == 0 else "assistant"
+        payload = {"role": role, "content": f"{role} message {len(self.conversations[conversation_id])}"}
+        path = f"/chat/conversations/{conversation_id}/add_message/"
+        data = await self._request("add_message", "POST", path, payload)
+        if data:
+            self.conversations[conversation_id].append(data["message"])
+
+    async def add_version(self) -> None:
+        conversation_id = self.rng.choice(list(self.conversations))
+        user_messages = [m for m in self.conversations[conversation_id] if m["role"] == "user"]
+        if not user_messages:
+            return await self.add_message()
+        payload = {"root_message_id": self.rng.choice(user_messages)["id"]}
+        path = f"/chat/conversations/{conversation_id}/add_version/"
+        data = await self._request("add_version", "POST", path, payload)
+        if data:
+            self.conversations[conversation_id] = data["messages"]
+
+    async def stream_answer(self) -> None:
+        conversation_id = self.rng.choice(list(self.conversations))
+        history = [{"role": m["role"], "content": m["content"]} for m in self.conversations[conversation_id]]
+        payload = {
+            "conversation": history + [{"role": "user", "content": "Tell me more"}],
+            "model": self.config.model,
+            "conversation_id": conversation_id,
+        }
+        started_at = time.perf_counter()
+        first_token_at, tokens, error = None, 0, None
+        try:
+            url = self.config.base_url + "/gpt/conversation/"
+            async with self.session.post(url, json=payload, headers=self._headers()) as resp:
+                if resp.status >= 400:
+                    error = str(resp.status)
+                    await resp.read()
+                else:
+                    async for chunk in resp.content.iter_any():
+                        if chunk and first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        # The fake upstream sends one word per chunk, Django may merge chunks, so count words
+                        tokens += len(chunk.split())
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = type(e).__name__
+        finished_at = time.perf_counter()
+        self.report.record("stream_answer", finished_at - started_at, error)
+        if error is None and first_token_at is not None:
+            self.report.record_stream(first_token_at - started_at, tokens, finished_at - first_token_at)
+
+    async def title(self) -> None:
+        payload = {"user_question": f"Question from {self.email}", "chatbot_response": "An answer"}
+        await self._request("title", "POST", "/gpt/title/", payload)
+
+
+async def run_load_async(config: LoadConfig) -> LoadReport:
+    """`run_load` inside a running event loop, e.g. to load one deployment with several configurations at once."""
+    report = LoadReport()
+    timeout = aiohttp.ClientTimeout(total=config.timeout)
+    connector = aiohttp.TCPConnector(limit=config.users * config.tabs)
+    async with aiohttp.ClientSession(
+        timeout=timeout, connector=connector, cookie_jar=aiohttp.DummyCookieJar()
+    ) as session:
+        deadline = time.monotonic() + config.duration if config.duration else None
+        started_at = time.perf_counter()
+        users = [
+            _VirtualUser(idx, tab, config, report, session) for idx in range(config.users) for tab in range(config.tabs)
+        ]
+        await asyncio.gather(*(user.run(deadline) for user in users))
+        report.elapsed = time.perf_counter() - started_at
+    return report
+
+
+def run_load(config: LoadConfig) -> LoadReport:
+    """Runs the configured load against `config.base_url`; `config.users` virtual users run concurrently."""
+    return asyncio.run(run_load_async(config))
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(url + "/", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not come up within {timeout}s")
+
+
+@contextmanager
+def started_deployment(
+    deployment: str,
+    fake_openai_url: str,
+    port: int,
+    accounts: dict[str, int],
+    password: str,
+    env: Optional[dict[str, str]] = None,
+) -> Iterator[str]:
+    """
+    Starts this backend as a `wsgi` or `asgi` deployment talking to the fake upstream and yields its base URL.
+    `accounts` maps email prefixes to the number of load test users created with each; `env` is added to the
+    environment of the server.
+    """
+    env = {
+        **os.environ,
+        "OPENAI_API_TYPE": "open_ai",
+        "OPENAI_API_BASE": fake_openai_url,
+        "OPENAI_API_KEY": "load-test",
+        "OPENAI_API_VERSION": "",
+        **(env or {}),
+    }
+    env.setdefault("DJANGO_SECRET_KEY", "load-test")
+    env.setdefault("FRONTEND_URL", "http://127.0.0.1:3000")
+    # The deployment gets a throwaway database, the developer's db.sqlite3 is left alone
+    with tempfile.TemporaryDirectory(prefix=f"load-{deployment}-db-") as database_dir:
+        env["DATABASE_PATH"] = os.path.join(database_dir, "db.sqlite3")
+        setup = [["migrate", "--noinput"], ["create_roles"]]
+        for prefix, count in accounts.items():
+            setup.append(["create_load_users", "--count", str(count), "--prefix", prefix, "--password", password])
+        for command in setup:
+            subprocess.run([sys.executable, "manage.py", *command], cwd=BACKEND_DIR, env=env, check=True)
+
+        command = [part.format(port=port) for part in DEPLOYMENTS[deployment]]
+        log = tempfile.NamedTemporaryFile(prefix=f"load-{deployment}-", suffix=".log", delete=False)
+        process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            try:
+                _wait_until_up(base_url, process)
+            except RuntimeError as e:
+                raise RuntimeError(f"{e}, see {log.name}") from e
+            yield base_url
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+            log.close()
+
+
+def run_deployment(deployment: str, config: LoadConfig, fake_openai_url: str, port: int) -> LoadReport:
+    """Starts a deployment with `started_deployment` and runs the load on it."""
+    # A fresh prefix per deployment keeps the runs from sharing conversations
+    prefix = f"load-{deployment}"
+    accounts = {prefix: config.users}
+    with started_deployment(deployment, fake_openai_url, port, accounts, config.password) as base_url:
+        return run_load(LoadConfig(**{**asdict(config), "base_url": base_url, "email_prefix": prefix}))
+
+
+def format_summary(name: str, summary: dict) -> str:
+    lines = [
+        f"== {name}: {summary['requests']} requests in {summary['elapsed_s']}s ({summary['throughput_rps']} req/s)",
+        f"{'endpoint':<20}{'requests':>10}{'errors':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for endpoint, stats in summary["endpoints"].items():
+        lines.append(
+            f"{endpoint:<20}{stats['requests']:>10}{stats['error_rate']:>10.1%}"
+            f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+        )
+    streams = summary["streams"]
+    lines.append(
+        f"streams: {streams['count']}, TTFT p50/p95/p99 {streams['ttft_p50_ms']}/{streams['ttft_p95_ms']}/"
+        f"{streams['ttft_p99_ms']} ms, {streams['tokens_per_s_p50']} tokens/s (p50)"
+    )
+    return "\n".join(lines)
+
+
+def _parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation `{name}`, expected one of {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the chat and GPT APIs")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="Deployment to load, unless --compare")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--tabs", type=int, default=1, help="Concurrent sessions of every user")
+    parser.add_argument("--operations", type=int, default=50, help="Operations per virtual user")
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument(
+        "--mix", type=_parse_mix, default=dict(DEFAULT_MIX), help="e.g. create_conversation=1,add_message=4"
+    )
+    parser.add_argument("--model", default="gpt35")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", default=None, help="Comma-separated deployments to start and compare: wsgi,asgi")
+    parser.add_argument("--port", type=int, default=8050, help="Port for deployments started by --compare")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Fake upstream delay between tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="Fake upstream time to first token")
+    parser.add_argument("--reply-tokens", type=int, default=50, help="Words in every fake upstream answer")
+    parser.add_argument("--output", type=Path, default=None, help="Write the summaries as JSON")
+    args = parser.parse_args()
+
+    config = LoadConfig(
+        base_url=args.base_url.rstrip("/"),
+        users=args.users,
+        tabs=args.tabs,
+        operations=args.operations,
+        duration=args.duration,
+        mix=args.mix,
+        model=args.model,
+        seed=args.seed,
+    )
+
+    summaries = {}
+    if args.compare:
+        upstream = FakeOpenAIConfig(
+            reply=" ".join(f"token{i}" for i in range(args.reply_tokens)),
+            first_token_delay=args.first_token_delay,
+            token_delay=args.token_delay,
+        )
+        with FakeOpenAIServer(upstream) as fake_openai:
+            for deployment in args.compare.split(","):
+                report = run_deployment(deployment.strip(), config, fake_openai.url, args.port)
+                summaries[deployment.strip()] = report.summary()
+    else:
+        summaries[config.base_url] = run_load(config).summary()
+
+    for name, summary in summaries.items():
+        print(format_summary(name, summary))
+    if args.output:
+        args.output.write_text(json.dumps(summaries, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+A small in-process metrics registry with Prometheus text exposition.
+
+Counters, gauges and histograms live in process memory. When `METRICS_MULTIPROC_DIR` is set (e.g. when running
+several uvicorn workers) every process also dumps its values to `<dir>/<pid>.json`, at most every
+`METRICS_FLUSH_INTERVAL` seconds and at exit, and `render()` merges the files of all processes: counters and
+histograms are summed over every file, gauges only over processes that are still alive. Clear the directory when
+the deployment restarts.
+"""
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+__all__ = ["Counter", "Gauge", "Histogram", "REGISTRY", "Registry"]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def dump(self) -> dict:
+        with self._lock:
+            return {
+                json.dumps(key): {**value, "buckets": list(value["buckets"])} if isinstance(value, dict) else value
+                for key, value in self._values.items()
+            }
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            idx = bisect.bisect_left(self.buckets, value)
+            if idx < len(self.buckets):
+                state["buckets"][idx] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+
+class Registry:
+    def __init__(self, multiproc_dir: Optional[str] = None, flush_interval: float = 1.0):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._metrics: dict[str, _Metric] = {}
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+        if multiproc_dir:
+            os.makedirs(multiproc_dir, exist_ok=True)
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def dump(self) -> dict:
+        dump = {}
+        for name, metric in self._metrics.items():
+            dump[name] = {"type": metric.type, "help": metric.documentation, "labels": metric.labelnames}
+            if isinstance(metric, Histogram):
+                dump[name]["buckets"] = metric.buckets
+            dump[name]["values"] = metric.dump()
+        return dump
+
+    def maybe_flush(self) -> None:
+        """Writes this process' values for the other workers, unless that happened less than `flush_interval` ago."""
+        if self.multiproc_dir and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.multiproc_dir:
+            return
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            path = os.path.join(self.multiproc_dir, f"{os.getpid()}.json")
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(self.dump(), f)
+            os.replace(f"{path}.tmp", path)
+
+    def collect(self) -> dict:
+        """This process' values, merged with those of the other processes in multi-process mode."""
+        if not self.multiproc_dir:
+            return self.dump()
+
+        self.flush()
+        merged: dict = {}
+        for filename in sorted(os.listdir(self.multiproc_dir)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.multiproc_dir, filename)) as f:
+                    dump = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _is_alive(int(filename.split(".")[0]))
+            for name, metric in dump.items():
+                target = merged.setdefault(name, {**metric, "values": {}})
+                if metric["type"] == "gauge" and not alive:
+                    continue
+                for key, value in metric["values"].items():
+                    target["values"][key] = _merge(target["values"].get(key), value)
+        return merged
+
+    def render(self) -> str:
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in sorted(metric["values"].items()):
+                labels = list(zip(metric["labels"], json.loads(key)))
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric["buckets"], value["buckets"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', _number(bound))])} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(current, value):
+    if current is None:
+        return value
+    if isinstance(value, dict):
+        return {
+            "buckets": [a + b for a, b in zip(current["buckets"], value["buckets"])],
+            "sum": current["sum"] + value["sum"],
+            "count": current["count"] + value["count"],
+        }
+    return current + value
+
+
+def _is_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _labels(labels: list) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = Registry(
+    multiproc_dir=os.getenv("METRICS_MULTIPROC_DIR") or None,
+    flush_interval=float(os.getenv("METRICS_FLUSH_INTERVAL", 1.0)),
+)
+atexit.register(REGISTRY.flush)